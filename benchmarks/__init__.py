@@ -0,0 +1,3 @@
+"""
+Benchmarks for prolix, run with airspeed velocity (asv run).
+"""
@@ -0,0 +1,117 @@
+"""
+Benchmarks for building questions and running quiz and card sessions.
+"""
+import numpy as np
+
+import prolix
+from prolix.core import _get_definitions, _get_words
+from benchmarks.common import deck_sizes, make_deck, use_data_path
+
+
+class QuestionBuild:
+    """ Time generating a single question. """
+    params = deck_sizes
+    param_names = ['words']
+
+    def setup(self, size):
+        use_data_path(make_deck(size))
+        self.word = prolix.read_words().index[size // 2]
+
+    def time_word_quiz(self, size):
+        prolix.WordQuiz()
+
+    def time_word_quiz_given_word(self, size):
+        prolix.WordQuiz(word=self.word)
+
+    def time_get_definitions(self, size):
+        _get_definitions(self.word)
+
+    def time_get_words(self, size):
+        _get_words(self.word)
+
+
+class QuizRunCycle:
+    """ Time a full quiz, answering every question, with a fake loop. """
+    params = (deck_sizes, [None, 'bench_user'])
+    param_names = ['words', 'user']
+
+    def setup(self, size, user):
+        use_data_path(make_deck(size))
+        np.random.seed(42)
+
+    def time_quiz_run(self, size, user):
+        quiz_run = prolix.QuizRun(question_count=15, user=user)
+        quiz_run._debug = True
+        quiz_run()
+        while not quiz_run._has_exited:
+            quiz_run._answer_correctly()
+
+    def time_create_display(self, size, user):
+        quiz_run = prolix.QuizRun(question_count=15, user=user)
+        for _ in range(15):
+            quiz_run._create_display()
+
+
+class CardRunCycle:
+    """ Time drawing and discarding flash cards with a fake loop. """
+    params = deck_sizes
+    param_names = ['words']
+
+    def setup(self, size):
+        use_data_path(make_deck(size))
+        np.random.seed(42)
+        self.card_run = prolix.CardRun()
+        self.card_run._debug = True
+
+    def time_draw_cards(self, size):
+        for _ in range(100):
+            self.card_run._handle_input('right')
+
+    def time_discard_cards(self, size):
+        for _ in range(100):
+            self.card_run._handle_input('left')
+
+    # discards empty the pile, so time each call on a fresh run
+    time_discard_cards.number = 1
+    time_discard_cards.repeat = 20
+    time_discard_cards.warmup_time = 0
+
+
+def _bytes_per_session(make_session, sessions: int = 20) -> float:
+    """ Return the bytes allocated and kept by each of sessions sessions. """
+    import gc
+    import tracemalloc
+    make_session()  # build shared state, eg the deck, outside the count
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    kept = [make_session() for _ in range(sessions)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del kept
+    return used / sessions
+
+
+class SessionMemory:
+    """ Memory held by each quiz and card session on top of the shared deck. """
+    params = deck_sizes
+    param_names = ['words']
+
+    def setup(self, size):
+        use_data_path(make_deck(size))
+        np.random.seed(42)
+
+    def track_quiz_session_bytes(self, size):
+        return _bytes_per_session(
+            lambda: prolix.QuizRun(question_count=15, headless=True))
+
+    def track_card_session_bytes(self, size):
+        return _bytes_per_session(lambda: prolix.CardRun(headless=True))
+
+    def track_word_quiz_bytes(self, size):
+        return _bytes_per_session(prolix.WordQuiz, sessions=1000)
+
+    track_quiz_session_bytes.unit = 'bytes'
+    track_card_session_bytes.unit = 'bytes'
+    track_word_quiz_bytes.unit = 'bytes'
@@ -0,0 +1,14 @@
+"""
+Benchmarks for the cold start of the command line interface.
+"""
+
+
+class Startup:
+    """ Time importing prolix in a fresh interpreter, the startup target is
+    prolix.cli.startup_target. """
+
+    def timeraw_import_prolix(self):
+        return 'import prolix'
+
+    def timeraw_import_cli(self):
+        return 'import prolix.cli'
@@ -0,0 +1,26 @@
+"""
+Benchmarks for loading the word store.
+"""
+import prolix
+from benchmarks.common import deck_sizes, make_deck, use_data_path
+
+
+class ReadWords:
+    """ Time reading the word deck. """
+    params = deck_sizes
+    param_names = ['words']
+
+    def setup(self, size):
+        use_data_path(make_deck(size))
+        prolix.read_words()
+
+    def time_read_words_cold(self, size):
+        prolix.store._word_cache.clear()
+        prolix.read_words()
+
+    def time_read_words_warm(self, size):
+        prolix.read_words()
+
+    def peakmem_read_words_cold(self, size):
+        prolix.store._word_cache.clear()
+        prolix.read_words()
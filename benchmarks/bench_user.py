@@ -0,0 +1,50 @@
+"""
+Benchmarks for recording answers and reading user stats.
+"""
+import shutil
+
+import prolix
+from prolix import events
+from benchmarks.common import deck_sizes, make_deck, use_data_path
+
+
+class UserStats:
+    """ Time recording answers and reading them back. """
+    params = deck_sizes
+    param_names = ['words']
+    answers = 100
+
+    def setup(self, size):
+        path = make_deck(size)
+        use_data_path(path)
+        # start every repeat from an empty database and event log
+        for name in ('.prolix.db', 'events'):
+            target = path / name
+            if target.is_dir():
+                shutil.rmtree(target)
+            elif target.exists():
+                target.unlink()
+        self.words = list(prolix.read_words().index[: self.answers])
+        self.user = prolix.User('bench_user')
+        self.user.correctly_answered_word(self.words)
+        prolix.user.flush()
+
+    def time_answer_words(self, size):
+        for word in self.words:
+            self.user.correctly_answered_word(word)
+        prolix.user.flush()
+
+    def time_record_answer_events(self, size):
+        for word in self.words:
+            self.user.record_answer(word, events.RIGHT)
+
+    def time_compact_events(self, size):
+        for word in self.words:
+            self.user.record_answer(word, events.RIGHT)
+        prolix.user.compact_events()
+
+    def time_get_quiz_df(self, size):
+        self.user.get_quiz_df()
+
+    def time_word_difficulty(self, size):
+        prolix.user.get_word_difficulty()
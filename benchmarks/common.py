@@ -0,0 +1,30 @@
+"""
+Helpers shared by the benchmarks.
+"""
+import tempfile
+from pathlib import Path
+
+import prolix
+
+# the number of words in the decks each benchmark is run against
+deck_sizes = [1_000, 10_000, 100_000]
+
+# where benchmark decks and databases are written
+bench_path = Path(tempfile.gettempdir()) / 'prolix_benchmarks'
+
+
+def make_deck(size: int) -> Path:
+    """
+    Return the data directory of a synthetic deck with size words, creating
+    it if needed.
+    """
+    from prolix import synth
+    path = bench_path / f'deck_{size}'
+    if not (path / 'words.csv').exists():
+        synth.write_deck(path, size, seed=size)
+    return path
+
+
+def use_data_path(path: Path):
+    """ Point prolix's word store, user database and event log at path. """
+    prolix.set_data_path(path)
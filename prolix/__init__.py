@@ -1,24 +1,92 @@
 """
-A flask/command line app for studying GRE vocab words.
+A command line app, and local HTTP/JSON server, for studying GRE vocab
+words.
+
+Submodules and shortcut attributes are imported on first access so that
+importing prolix, or running the command line interface, does not pay for
+pandas, numpy, urwid or the database until they are needed.
 """
+import importlib
+import os
+import sys
+import time
 from pathlib import Path
 
-
 from .version import __version__
 
-# get datapath
-data_path = Path(__file__).parent / 'data'
+# when the package started importing, used to measure cli cold start
+_import_time = time.perf_counter()
+
+# get datapath, the PROLIX_DATA_PATH environment variable overrides it
+default_data_path = Path(__file__).parent / 'data'
+
+
+def _env_data_path() -> Path:
+    """ Return the data directory set by PROLIX_DATA_PATH, or the bundled
+    one. """
+    return Path(os.environ.get('PROLIX_DATA_PATH') or default_data_path)
+
+
+data_path = _env_data_path()
 database_path = data_path / '.prolix.db'
 user_file_path = data_path / '.user.txt'
 
+# shortcut attributes and the modules which define them
+_shortcuts = {
+    'read_words': 'prolix.store',
+    'add_words': 'prolix.store',
+    'WordQuiz': 'prolix.core',
+    'QuizRun': 'prolix.core',
+    'Card': 'prolix.core',
+    'CardRun': 'prolix.core',
+    'RecallRun': 'prolix.core',
+    'User': 'prolix.user',
+}
+_submodules = {
+    'cache', 'checkpoint', 'cli', 'core', 'deck', 'events', 'export',
+    'grading', 'headless', 'masks', 'metrics', 'profiling', 'recall',
+    'search', 'server', 'session', 'store', 'sync', 'synth', 'tags',
+    'user', 'utils', 'writer',
+}
+
+
+def set_data_path(path=None):
+    """
+    Point prolix at a different data directory.
+
+    The directory holds the word store, the user database and the event
+    log. Queued writes are committed and caches tied to the old directory
+    are dropped first.
 
-import prolix.store
-import prolix.cli
+    Parameters
+    ----------
+    path
+        The new data directory, if None use the one set by
+        PROLIX_DATA_PATH, or the bundled data directory if it isn't set.
+    """
+    global data_path, database_path, user_file_path
+    for name in ('events', 'user', 'store', 'deck', 'search', 'recall',
+                 'masks', 'tags'):
+        module = sys.modules.get(f'prolix.{name}')
+        if module is not None:
+            module._reset()
+    data_path = Path(path) if path else _env_data_path()
+    data_path.mkdir(parents=True, exist_ok=True)
+    database_path = data_path / '.prolix.db'
+    user_file_path = data_path / '.user.txt'
 
-# shortcut imports
-from prolix.store import read_words, add_words
-from prolix.core import WordQuiz, QuizRun, Card, CardRun
-from prolix.user import User
 
+def __getattr__(name):
+    """ Import submodules and shortcut attributes on first access. """
+    if name in _shortcuts:
+        value = getattr(importlib.import_module(_shortcuts[name]), name)
+    elif name in _submodules:
+        value = importlib.import_module(f'prolix.{name}')
+    else:
+        raise AttributeError(f"module 'prolix' has no attribute '{name}'")
+    globals()[name] = value
+    return value
 
 
+def __dir__():
+    return sorted(set(globals()) | set(_shortcuts) | _submodules)
@@ -0,0 +1,104 @@
+"""
+A thread-safe cache for the word store and user tables.
+
+Reads are lock free, since a single dict lookup is atomic, and writes
+take a lock. What a plain dict gets wrong is the check-then-load sequence
+of a cache miss, so loads are single flight: a key is loaded by one
+caller while concurrent callers for it wait on a lock and then use its
+result. Keys hash to one of a fixed set of locks (lock striping), so
+loads of keys on different stripes run concurrently.
+"""
+import threading
+from typing import Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class LoadingCache:
+    """
+    A mapping of keys to values loaded on first use.
+
+    Parameters
+    ----------
+    stripes
+        The number of load locks keys are spread over.
+    """
+
+    def __init__(self, stripes: int = 16):
+        self._data = {}
+        self._write_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        # the number of times a loader ran, useful for tests and stats
+        self.loads = 0
+        # the number of times a valid value was found, counted without a
+        # lock so concurrent hits may be undercounted
+        self.hits = 0
+
+    def _stripe(self, key: Hashable) -> threading.Lock:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def get(self, key, default=None):
+        """ Return the value of key, default if it is not cached. """
+        return self._data.get(key, default)
+
+    def keys(self) -> list:
+        """ Return a list of the cached keys. """
+        with self._write_lock:
+            return list(self._data)
+
+    def set(self, key, value):
+        """ Cache value for key. """
+        with self._write_lock:
+            self._data[key] = value
+
+    def pop(self, key, default=None):
+        """ Remove key and return its value, default if it is not cached. """
+        with self._write_lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """ Remove every key. """
+        with self._write_lock:
+            self._data.clear()
+
+    def get_or_load(self, key, loader: Callable,
+                    is_valid: Optional[Callable] = None):
+        """
+        Return the value of key, calling loader() to load it if needed.
+
+        Parameters
+        ----------
+        key
+            The key.
+        loader
+            Called with no arguments to load the value. If it raises
+            nothing is cached and the next caller loads again.
+        is_valid
+            If given, called with a cached value and returning False if it
+            is stale and should be loaded again.
+        """
+        value = self._data.get(key, _MISSING)
+        if value is not _MISSING and (is_valid is None or is_valid(value)):
+            self.hits += 1
+            return value
+        with self._stripe(key):
+            # another caller may have loaded it while this one waited
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING and (is_valid is None
+                                          or is_valid(value)):
+                self.hits += 1
+                return value
+            value = loader()
+            with self._write_lock:
+                self._data[key] = value
+                self.loads += 1
+            return value
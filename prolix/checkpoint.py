@@ -0,0 +1,92 @@
+"""
+Checkpoints of quiz, recall and flash card sessions.
+
+A run saves its state, its random state, the cards left in each pile or
+the question being asked and the questions left, to a small npz file
+when it is quit and every checkpoint_every inputs, and a new run of the
+same kind for the same user can resume from it instead of starting over.
+The file records the key (modification time, size and inode) of every
+deck csv the run draws from, and a checkpoint is ignored if any of them
+changed, since its row ids would refer to different words.
+"""
+import json
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+import prolix
+from prolix.store import _csv_key
+from prolix.utils import atomic_write
+
+# bump when the checkpoint layout changes so old files are ignored
+checkpoint_version = 2
+
+# inputs handled between periodic checkpoints
+checkpoint_every = 25
+
+
+def checkpoint_path(kind: str, user: Optional[str] = None) -> Path:
+    """ Return the file a run of kind for user is checkpointed to. """
+    name = f'{kind}_{user}' if user else kind
+    return Path(prolix.data_path) / 'checkpoints' / f'{name}.npz'
+
+
+def rng_state(rng: np.random.RandomState) -> Tuple[dict, np.ndarray]:
+    """ Return the state of rng as a json serializable dict and the key
+    array of the Mersenne Twister. """
+    _, keys, pos, has_gauss, cached = rng.get_state()
+    return dict(pos=int(pos), has_gauss=int(has_gauss),
+                cached_gaussian=float(cached)), keys
+
+
+def restore_rng(state: dict, keys: np.ndarray) -> np.random.RandomState:
+    """ Return a random state set to a state from rng_state. """
+    rng = np.random.RandomState()
+    rng.set_state(('MT19937', keys, state['pos'], state['has_gauss'],
+                   state['cached_gaussian']))
+    return rng
+
+
+def save(path, meta: dict, arrays: dict):
+    """
+    Write a checkpoint, replacing any older one atomically.
+
+    Parameters
+    ----------
+    path
+        The checkpoint file.
+    meta
+        Json serializable state, the version and deck keys are added.
+    arrays
+        Numpy arrays of state.
+    """
+    meta = dict(meta, version=checkpoint_version,
+                keys={x: list(_csv_key(x)) for x in meta['decks']})
+    encoded = np.frombuffer(json.dumps(meta).encode('utf8'), dtype=np.uint8)
+    with atomic_write(path) as fi:
+        np.savez(fi, meta=encoded, **arrays)
+
+
+def load(path) -> Optional[Tuple[dict, dict]]:
+    """
+    Return the state and arrays of a checkpoint, None if there is none or
+    it is unreadable, from another version or any of its decks changed.
+    """
+    try:
+        with np.load(str(path), allow_pickle=False) as data:
+            arrays = {x: data[x] for x in data.files}
+        meta = json.loads(arrays.pop('meta').tobytes().decode('utf8'))
+    except (OSError, ValueError, KeyError):
+        return None
+    if meta.get('version') != checkpoint_version:
+        return None
+    for deck, key in meta['keys'].items():
+        if list(_csv_key(deck)) != key:
+            return None
+    return meta, arrays
+
+
+def remove(path):
+    """ Delete a checkpoint if it exists. """
+    Path(path).unlink(missing_ok=True)
@@ -1,17 +1,99 @@
 """
 Command line interface for prolix
+
+Only click is imported at module level; everything else is imported by
+the command which needs it to keep startup fast.
 """
+import time
+
 import click
-import colorama
 
-from prolix.core import QuizRun, CardRun
+import prolix
+
+# the target time, in seconds, from importing prolix to running a command
+startup_target = 0.25
+
+
+def _startup_time() -> float:
+    """ Return the seconds since prolix started importing. """
+    return time.perf_counter() - prolix._import_time
+
+
+def _check_startup(ctx, param, value):
+    """ Print the cold start time and exit, with 1 if it misses the target. """
+    if not value or ctx.resilient_parsing:
+        return
+    elapsed = _startup_time()
+    click.echo(f'startup: {elapsed * 1000:.1f} ms '
+               f'(target {startup_target * 1000:.0f} ms)')
+    ctx.exit(int(elapsed > startup_target))
 
-colorama.init()
+
+data_path_help = ('directory holding the words, user database and event '
+                  'log, overrides PROLIX_DATA_PATH')
+profile_help = 'time the hot paths and print a summary at exit'
+profile_dump_help = 'also run cProfile and write its stats to this file'
+metrics_file_help = ('turn on metrics and write them in the Prometheus text '
+                     'format to this file, periodically and at exit')
+metrics_json_help = 'turn on metrics and write them as json at exit'
+metrics_port_help = 'turn on metrics and serve them at localhost:PORT/metrics'
 
 
 @click.group()
-def dispatch_cli():
-    pass
+@click.option('--startup-time', is_flag=True, expose_value=False,
+              is_eager=True, callback=_check_startup,
+              help='report the cold start time and exit')
+@click.option('--data-path', 'data_path', default=None, help=data_path_help)
+@click.option('--profile', 'profile', is_flag=True, help=profile_help)
+@click.option('--profile-dump', 'profile_dump', default=None,
+              help=profile_dump_help)
+@click.option('--metrics-file', 'metrics_file', default=None,
+              help=metrics_file_help)
+@click.option('--metrics-json', 'metrics_json', default=None,
+              help=metrics_json_help)
+@click.option('--metrics-port', 'metrics_port', default=None, type=int,
+              help=metrics_port_help)
+def dispatch_cli(data_path=None, profile=False, profile_dump=None,
+                 metrics_file=None, metrics_json=None, metrics_port=None):
+    import colorama
+    colorama.init()
+    if profile or profile_dump:
+        from prolix import profiling
+        profiling.enable(profile_dump)
+    if metrics_file or metrics_json or metrics_port is not None:
+        from prolix import metrics
+        metrics.enable(metrics_file, metrics_json, metrics_port)
+    if data_path is not None:
+        prolix.set_data_path(data_path)
+
+
+plain_help = 'read answers from stdin and write plain text to stdout'
+json_help = 'read answers from stdin and write json lines to stdout'
+seed_help = 'seed for choosing words, the same seed gives the same session'
+record_help = 'record the session to this file for prolix replay'
+resume_help = ('continue the last session of this kind that was quit before '
+               'it finished')
+deck_help = ('deck to draw words from, as NAME or NAME:WEIGHT, may be '
+             'given more than once to mix decks')
+tag_help = ('only draw words with this tag, may be given more than once to '
+            'draw words with any of the tags')
+all_tags_help = 'only draw words with all of the --tag tags'
+
+
+def _parse_decks(values) -> dict:
+    """ Return a mapping of deck names to weights from --deck values, None
+    if there are none. """
+    if not values:
+        return None
+    out = {}
+    for value in values:
+        name, _, weight = value.partition(':')
+        try:
+            out[name] = float(weight or 1)
+        except ValueError:
+            raise click.BadParameter(f'bad weight in {value!r}',
+                                     param_hint='--deck') from None
+    return out
 
 
 @dispatch_cli.command()
@@ -22,13 +104,65 @@ def dispatch_cli():
               help='number of definitions')
 @click.option('-o', '--on', 'quiz_on', default='word',
               help='quiz on word or definition')
-def quiz(name=None, question_count=15, def_count=4, quiz_on='word'):
+@click.option('--plain', 'plain', is_flag=True, help=plain_help)
+@click.option('--json', 'json_mode', is_flag=True, help=json_help)
+@click.option('-s', '--seed', 'seed', default=None, type=int, help=seed_help)
+@click.option('-r', '--record', 'record', default=None, help=record_help)
+@click.option('--deck', 'decks', multiple=True, help=deck_help)
+@click.option('--resume', 'resume', is_flag=True, help=resume_help)
+@click.option('-t', '--tag', 'tags', multiple=True, help=tag_help)
+@click.option('--all-tags', 'all_tags', is_flag=True, help=all_tags_help)
+def quiz(name=None, question_count=15, def_count=4, quiz_on='word',
+         plain=False, json_mode=False, seed=None, record=None, decks=(),
+         resume=False, tags=(), all_tags=False):
     """
     Quiz the user.
     """
+    from prolix.core import QuizRun
+    headless = plain or json_mode
     quiz_run = QuizRun(question_count=question_count, user=name,
-                       choice_count=def_count, quiz_on=quiz_on)
-    quiz_run()
+                       choice_count=def_count, quiz_on=quiz_on,
+                       headless=headless, seed=seed, record=record,
+                       decks=_parse_decks(decks), checkpoint=True,
+                       resume=resume, tags=tags,
+                       tag_mode='all' if all_tags else 'any')
+    if headless:
+        from prolix.headless import run_quiz
+        run_quiz(quiz_run, json_mode=json_mode)
+    else:
+        quiz_run()
+
+
+@dispatch_cli.command()
+@click.option('-n', '--name', 'name', default=None, help='name of user')
+@click.option('-q', '--questions', 'question_count', default=15,
+              help='number of questions in the quiz')
+@click.option('--plain', 'plain', is_flag=True, help=plain_help)
+@click.option('--json', 'json_mode', is_flag=True, help=json_help)
+@click.option('-s', '--seed', 'seed', default=None, type=int, help=seed_help)
+@click.option('-r', '--record', 'record', default=None, help=record_help)
+@click.option('--deck', 'decks', multiple=True, help=deck_help)
+@click.option('--resume', 'resume', is_flag=True, help=resume_help)
+@click.option('-t', '--tag', 'tags', multiple=True, help=tag_help)
+@click.option('--all-tags', 'all_tags', is_flag=True, help=all_tags_help)
+def recall(name=None, question_count=15, plain=False, json_mode=False,
+           seed=None, record=None, decks=(), resume=False, tags=(),
+           all_tags=False):
+    """
+    Show definitions and have the user type the words.
+    """
+    from prolix.core import RecallRun
+    headless = plain or json_mode
+    recall_run = RecallRun(question_count=question_count, user=name,
+                           headless=headless, seed=seed, record=record,
+                           decks=_parse_decks(decks), checkpoint=True,
+                           resume=resume, tags=tags,
+                           tag_mode='all' if all_tags else 'any')
+    if headless:
+        from prolix.headless import run_recall
+        run_recall(recall_run, json_mode=json_mode)
+    else:
+        recall_run()
 
 
 on_help = 'indicates if the cards should start on the word or definition side'
@@ -37,7 +171,17 @@ on_help = 'indicates if the cards should start on the word or definition side'
 @dispatch_cli.command()
 @click.option('-n', '--name', 'name', default=None, help='name of user')
 @click.option('-o', '--on', 'start_on', default='word', help=on_help)
-def cards(name=None, start_on='word'):
+@click.option('--plain', 'plain', is_flag=True, help=plain_help)
+@click.option('--json', 'json_mode', is_flag=True, help=json_help)
+@click.option('-s', '--seed', 'seed', default=None, type=int, help=seed_help)
+@click.option('-r', '--record', 'record', default=None, help=record_help)
+@click.option('--deck', 'decks', multiple=True, help=deck_help)
+@click.option('--resume', 'resume', is_flag=True, help=resume_help)
+@click.option('-t', '--tag', 'tags', multiple=True, help=tag_help)
+@click.option('--all-tags', 'all_tags', is_flag=True, help=all_tags_help)
+def cards(name=None, start_on='word', plain=False, json_mode=False,
+          seed=None, record=None, decks=(), resume=False, tags=(),
+          all_tags=False):
     """
     Show the user the flash cards.
 
@@ -50,5 +194,370 @@ def cards(name=None, start_on='word'):
     -------
 
     """
-    card_run = CardRun(start_on=start_on, user=name)
-    card_run()
+    from prolix.core import CardRun
+    headless = plain or json_mode
+    card_run = CardRun(start_on=start_on, user=name, headless=headless,
+                       seed=seed, record=record, decks=_parse_decks(decks),
+                       checkpoint=True, resume=resume, tags=tags,
+                       tag_mode='all' if all_tags else 'any')
+    if headless:
+        from prolix.headless import run_cards
+        run_cards(card_run, json_mode=json_mode)
+    else:
+        card_run()
+
+
+@dispatch_cli.command()
+def decks():
+    """
+    List the decks in the data directory and their word counts.
+    """
+    from prolix import store
+    for name in store.list_decks():
+        click.echo(f'{name}: {len(store.read_words(name))} words')
+
+
+@dispatch_cli.command()
+@click.argument('tag', required=False)
+@click.argument('words', nargs=-1)
+@click.option('--deck', 'deck', default=None,
+              help='the deck the words are in, the default deck if not given')
+@click.option('--remove', 'remove', is_flag=True,
+              help='untag WORDS, or delete TAG if no WORDS are given')
+def tags(tag=None, words=(), deck=None, remove=False):
+    """
+    Tag WORDS with TAG, or list the tags of a deck and their word counts.
+    """
+    from prolix import tags as tags_module
+    if remove:
+        if tag is None:
+            raise click.UsageError('--remove needs a TAG')
+        tags_module.untag_words(tag, words or None, deck=deck)
+    elif words:
+        tags_module.tag_words(tag, words, deck=deck)
+    elif tag is not None:
+        raise click.UsageError('give the WORDS to tag')
+    for name, count in tags_module.list_tags(deck).items():
+        click.echo(f'{name}: {count} words')
+
+
+@dispatch_cli.command('filter')
+@click.argument('words', nargs=-1)
+@click.option('-n', '--name', 'name', default=None, help='name of user')
+@click.option('--deck', 'deck', default=None,
+              help='the deck the words are in, the default deck if not given')
+@click.option('--remove', 'remove', is_flag=True,
+              help='stop filtering WORDS, or every word if no WORDS are given')
+def filter_words(words=(), name=None, deck=None, remove=False):
+    """
+    Leave WORDS out of a user's quizzes and flash cards, or list the words
+    left out.
+    """
+    user = prolix.User(name)
+    if user.name is None:
+        raise click.UsageError('give a user with --name')
+    filtered = user.get_filter(deck)
+    if remove:
+        filtered = [x for x in filtered if words and x not in words]
+        user.set_filter(filtered, deck)
+    elif words:
+        filtered = sorted(set(filtered) | set(words))
+        user.set_filter(filtered, deck)
+    for word in filtered:
+        click.echo(word)
+
+
+@dispatch_cli.command()
+@click.argument('paths', nargs=-1, required=True)
+@click.option('-n', '--name', 'name', default=None,
+              help='answer as this user instead of the recorded one')
+@click.option('-t', '--times', 'times', default=1,
+              help='number of times to replay each recording')
+@click.option('-p', '--processes', 'processes', default=1,
+              help='number of processes to replay in parallel')
+@click.option('--headless', 'headless', is_flag=True,
+              help='skip building widgets, for headless recordings')
+@click.option('--realtime', 'realtime', is_flag=True,
+              help='wait between inputs as long as the recorded session')
+def replay(paths, name=None, times=1, processes=1, headless=False,
+           realtime=False):
+    """
+    Replay the sessions recorded in PATHS and report how long they took.
+    """
+    from prolix import session
+    paths = list(paths) * times
+    start = time.perf_counter()
+    if processes > 1:
+        users = [name] * len(paths)
+        results = session.replay_many(paths, processes, users, headless)
+    else:
+        results = []
+        for path in paths:
+            out = session.replay(path, user=name, headless=headless,
+                                 realtime=realtime)
+            results.append(dict(out, path=path))
+    elapsed = time.perf_counter() - start
+    inputs = sum(x['inputs'] for x in results)
+    slowest = max(x['seconds'] for x in results)
+    click.echo(f'replayed {len(results)} sessions, {inputs} inputs in '
+               f'{elapsed:.3f} s (slowest session {slowest:.3f} s, '
+               f'{inputs / elapsed:.0f} inputs/s)')
+
+
+@dispatch_cli.command()
+@click.argument('path')
+@click.option('-k', '--kind', 'kind', default='quiz',
+              type=click.Choice(['quiz', 'cards']), help='what to export')
+@click.option('-n', '--sets', 'count', default=30,
+              help='number of quiz sets or card decks')
+@click.option('-f', '--format', 'format', default='markdown',
+              type=click.Choice(['markdown', 'csv', 'anki']),
+              help='file format of each set')
+@click.option('-s', '--seed', 'seed', default=0,
+              help='seed, the same seed gives the same sets')
+@click.option('-p', '--processes', 'processes', default=None, type=int,
+              help='number of worker processes, one per cpu by default')
+@click.option('-q', '--questions', 'questions', default=15,
+              help='number of questions in each quiz set')
+@click.option('-d', '--definitions', 'choices', default=4,
+              help='number of choices for each question')
+@click.option('-o', '--on', 'quiz_on', default='word',
+              type=click.Choice(['word', 'definition']),
+              help='quiz on word or definition')
+@click.option('-c', '--cards', 'deck_size', default=50,
+              help='number of cards in each deck')
+def export(path, kind='quiz', count=30, format='markdown', seed=0,
+           processes=None, questions=15, choices=4, quiz_on='word',
+           deck_size=50):
+    """
+    Write printable quiz sets or flash card decks to the directory PATH.
+    """
+    from prolix.export import export
+    start = time.perf_counter()
+    written = export(path, kind, count, format, seed, processes,
+                     questions=questions, choices=choices, quiz_on=quiz_on,
+                     deck_size=deck_size)
+    elapsed = time.perf_counter() - start
+    click.echo(f'wrote {written} {kind} files to {path} in {elapsed:.2f} s')
+
+
+@dispatch_cli.command()
+@click.argument('path')
+@click.option('-n', '--sets', 'sets', default=None, type=int,
+              help='number of sets exported, default the highest answered')
+@click.option('-s', '--seed', 'seed', default=0,
+              help='seed the sets were exported with')
+@click.option('-q', '--questions', 'questions', default=15,
+              help='number of questions per quiz set')
+@click.option('-d', '--definitions', 'choices', default=4,
+              help='number of choices per question')
+@click.option('--no-record', 'no_record', is_flag=True,
+              help="score the answers without adding them to users' stats")
+def grade(path, sets=None, seed=0, questions=15, choices=4, no_record=False):
+    """
+    Grade a csv answer sheet, with columns user, set, question and answer,
+    for quiz sets written by export.
+    """
+    from prolix.grading import grade_sheet
+    start = time.perf_counter()
+    scores = grade_sheet(path, sets, questions, choices, seed,
+                         record_results=not no_record)
+    elapsed = time.perf_counter() - start
+    for user, row in scores.iterrows():
+        click.echo(f'{user}: {row["correct"]}/{row["answered"]} '
+                   f'({row["score"]:.0%})')
+    click.echo(f'graded {scores["answered"].sum()} answers from '
+               f'{len(scores)} users in {elapsed:.2f} s')
+
+
+@dispatch_cli.command()
+@click.option('--host', 'host', default='127.0.0.1',
+              help='address to listen on')
+@click.option('-p', '--port', 'port', default=8080, help='port to listen on')
+@click.option('-s', '--seed', 'seed', default=None, type=int,
+              help='seed for the questions and cards served')
+def serve(host='127.0.0.1', port=8080, seed=None):
+    """
+    Serve questions, answers, cards and stats as HTTP/JSON for many users.
+    """
+    from prolix.server import serve
+
+    def _started(server):
+        click.echo(f'prolix serving {len(server.snapshot)} words on '
+                   f'http://{server.host}:{server.port} (ctrl-c to stop)')
+
+    serve(host, port, seed, on_start=_started)
+
+
+@dispatch_cli.command('load-test')
+@click.option('--host', 'host', default='127.0.0.1', help='server address')
+@click.option('-p', '--port', 'port', default=8080, help='server port')
+@click.option('-c', '--learners', 'learners', default=100,
+              help='number of concurrent learners')
+@click.option('-n', '--requests', 'requests', default=10_000,
+              help='total number of requests')
+@click.option('-t', '--duration', 'duration', default=None, type=float,
+              help='stop after this many seconds')
+@click.option('-u', '--user-prefix', 'user_prefix', default='load',
+              help='learners are users named this and a number')
+def load_test(host='127.0.0.1', port=8080, learners=100, requests=10_000,
+              duration=None, user_prefix='load'):
+    """
+    Load test a running prolix serve with learners answering questions.
+    """
+    from prolix.server import run_load
+    result = run_load(host, port, learners=learners, requests=requests,
+                      duration=duration, user_prefix=user_prefix)
+    click.echo(f'{result["requests"]} requests ({result["failures"]} failed) '
+               f'in {result["seconds"]:.2f} s, {result["rps"]:.0f} req/s')
+    click.echo('latency (ms): ' + ', '.join(
+        f'{x} {result[x] * 1e3:.2f}' for x in ('p50', 'p90', 'p99', 'max')))
+
+
+@dispatch_cli.command()
+@click.argument('query', nargs=-1, required=True)
+@click.option('-d', '--definitions', 'definitions', is_flag=True,
+              help='find words whose definitions contain every term')
+@click.option('-e', '--exact', 'exact', is_flag=True,
+              help='only words containing the query, rather than fuzzy')
+@click.option('-n', '--limit', 'limit', default=10,
+              help='maximum number of results')
+@click.option('--rebuild', 'rebuild', is_flag=True,
+              help='rebuild the search index first')
+def search(query, definitions=False, exact=False, limit=10, rebuild=False):
+    """
+    Search the words, or with -d their definitions, for QUERY.
+    """
+    from prolix.search import get_index, search
+    from prolix.utils import _format_defintion
+    if rebuild:
+        get_index(rebuild=True)
+    df = search(' '.join(query), limit=limit, definitions=definitions,
+                fuzzy=not exact)
+    if df.empty:
+        click.echo('no matches')
+    for word, row in df.iterrows():
+        definition = _format_defintion(row['definition']).replace(':\n', '; ')
+        click.echo(f'{word}: {definition}')
+
+
+format_help = 'parquet or arrow, inferred from the extension if not given'
+
+
+def _require_pyarrow():
+    """ Raise a usage error naming the extra to install if pyarrow, which
+    stats files are written with, is missing. """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise click.UsageError('stats files need pyarrow, install it with '
+                               'pip install "prolix[stats]"')
+
+
+@dispatch_cli.command('export-stats')
+@click.argument('path')
+@click.option('-f', '--format', 'format', default=None, help=format_help)
+@click.option('-c', '--chunk-size', 'chunk_size', default=50_000,
+              help='number of rows written at a time')
+def export_stats(path, format=None, chunk_size=50_000):
+    """
+    Export all users' stats and discarded words to PATH.
+    """
+    _require_pyarrow()
+    from prolix.user import export_stats
+    count = export_stats(path, format=format, chunk_size=chunk_size)
+    click.echo(f'exported {count} rows to {path}')
+
+
+@dispatch_cli.command('import-stats')
+@click.argument('path')
+@click.option('-f', '--format', 'format', default=None, help=format_help)
+@click.option('-r', '--replace', 'replace', is_flag=True,
+              help='replace the stats of imported users instead of adding')
+@click.option('-c', '--chunk-size', 'chunk_size', default=50_000,
+              help='number of rows read at a time')
+def import_stats(path, format=None, replace=False, chunk_size=50_000):
+    """
+    Import users' stats and discarded words from PATH.
+    """
+    _require_pyarrow()
+    from prolix.user import import_stats
+    count = import_stats(path, format=format, replace=replace,
+                         chunk_size=chunk_size)
+    click.echo(f'imported {count} rows from {path}')
+
+
+@dispatch_cli.command('sync-export')
+@click.argument('path')
+@click.option('-p', '--peer', 'peer', default=None,
+              help='device id of the machine the delta is for, only changes '
+                   'it has not seen are written')
+def sync_export(path, peer=None):
+    """
+    Write the stats, discards and events other machines haven't seen to
+    PATH.
+    """
+    from prolix.sync import device_id, export_delta
+    counts = export_delta(path, peer=peer)
+    click.echo(f'wrote {counts["counters"]} counters, {counts["discards"]} '
+               f'discards and {counts["segments"]} event segments from '
+               f'device {device_id()} to {path}')
+
+
+@dispatch_cli.command('sync-import')
+@click.argument('paths', nargs=-1, required=True)
+def sync_import(paths):
+    """
+    Merge deltas written by sync-export on other machines.
+    """
+    from prolix.sync import import_delta
+    for path in paths:
+        counts = import_delta(path)
+        click.echo(f'merged {path} from device {counts["device"]}: counts '
+                   f'of {counts["counted"]} and discards of '
+                   f'{counts["discarded"]} users changed, '
+                   f'{counts["segments"]} new event segments')
+
+
+@dispatch_cli.command()
+@click.option('-n', '--number', 'number', default=20,
+              help='number of words to show')
+@click.option('-c', '--confidence', 'confidence', default=0.95,
+              help='confidence level of the error rate intervals')
+@click.option('--rebuild', 'rebuild', is_flag=True,
+              help='recompute the summary from every user table first')
+def stats(number=20, confidence=0.95, rebuild=False):
+    """
+    Show the hardest words across all users.
+    """
+    import prolix.user
+    if rebuild:
+        prolix.user.rebuild_word_summary()
+    df = prolix.user.get_word_difficulty(confidence=confidence)
+    df = df.join(prolix.user.get_word_ratings()['difficulty'])
+    columns = ['attempts', 'users', 'error_rate', 'lower', 'upper',
+               'difficulty']
+    click.echo(df[columns].head(number).round(3).to_string())
+
+
+@dispatch_cli.command()
+@click.argument('path')
+@click.option('-w', '--words', 'words', default=10_000,
+              help='number of words in the deck')
+@click.option('-u', '--users', 'users', default=0,
+              help='number of users to create')
+@click.option('-a', '--answers', 'answers', default=200,
+              help='mean number of answers per user')
+@click.option('-s', '--seed', 'seed', default=None, type=int,
+              help='seed for the random number generator')
+def generate(path, words=10_000, users=0, answers=200, seed=None):
+    """
+    Create a synthetic data directory at PATH for scale testing.
+    """
+    from prolix.synth import generate
+    generate(path, words, users=users, answers=answers, seed=seed)
+    click.echo(f'wrote {words} words and {users} users to {path}')
+
+
+if __name__ == '__main__':
+    dispatch_cli()
@@ -2,8 +2,7 @@
 Core structures for the word quiz.
 """
 import abc
-import random
-from functools import lru_cache
+import time
 from itertools import cycle
 from string import ascii_lowercase
 from typing import List, Union
@@ -13,12 +12,19 @@ import numpy as np
 import urwid
 
 import prolix
-from prolix.utils import FakeLoop, _format_defintion
+from prolix import events, metrics, profiling
+from prolix.deck import Deck, DeckMix, get_deck
+from prolix.utils import FakeLoop
 
 _letter_num_map = {let: num for num, let in enumerate(ascii_lowercase)}
 _number_strings = {str(x) for x in range(10)}
 _quiz_on = ('word', 'definition')
 
+_questions = metrics.counter(
+    'prolix_questions_total', 'questions and flash cards shown, by mode',
+    labels=('mode',),
+)
+
 
 class ProlixUrWid:
     """ Base class for prolix classes that use urwid for GUI."""
@@ -31,6 +37,7 @@ class ProlixUrWid:
     ]
 
     _debug = False
+    _headless = False  # if True no widgets are built, see prolix.headless
     _main = None
     _loop = None  #
     _has_exited = False  # if the quiz has exited
@@ -38,19 +45,161 @@ class ProlixUrWid:
     _name = None
     _user = None
     _has_exited = False
+    _asked_at = 0.0  # time the current question or card was shown
+    _session = None  # a prolix.session.SessionRecorder if recording
+    _dispatching = False  # True while an input is being handled
+    _mix = None  # the prolix.deck.DeckMix words are drawn from
+    _masks = None  # prolix.masks.UserMasks of the words left out, by deck
+    _tags = None  # the row ids of the tagged words drawn from, by deck
+    _tagged = None  # if each deck of the mix has tagged words
+    _tag_names = None
+    _tag_mode = 'any'
+    _checkpoint_path = None  # the file the run is checkpointed to, if any
+    _inputs = 0  # the number of inputs handled, for periodic checkpoints
+    seed = None
+    _rng = np.random
+
+    def _seed(self, seed: Optional[int] = None):
+        """
+        Create the random state for the run. If seed is None one is drawn
+        from numpy's global state so every run can be reproduced.
+        """
+        if seed is None:
+            seed = int(np.random.randint(2 ** 31))
+        self.seed = seed
+        self._rng = np.random.RandomState(seed)
+
+    def _record(self, path, kind: str, **options):
+        """ Start recording the inputs of this run to path. """
+        if path is None:
+            return
+        from prolix.session import SessionRecorder
+        options['decks'] = self._mix.to_dict()
+        # record the words left out when the run started so a replay
+        # draws the same words whatever the user has answered since
+        options['exclude'] = False
+        if self._masks is not None:
+            options['exclude'] = {name: masks.state()
+                                  for name, masks in self._masks.items()}
+        if self._tags is not None:
+            options.update(tags=self._tag_names, tag_mode=self._tag_mode)
+        self._session = SessionRecorder(path, kind, self.seed, options)
+
+    def _exclude(self, decks, exclude):
+        """
+        Set the decks the run draws from and the masks of words it leaves
+        out. If exclude is True use the masks of the run's user, if it is
+        a dict use masks made by UserMasks.from_state from its values,
+        keyed by deck name, else leave nothing out.
+        """
+        from prolix import masks
+        self._mix = DeckMix(decks)
+        if exclude is True and self._user.name is not None:
+            self._masks = {x: masks.get_masks(self._user.name, x)
+                           for x in self._mix.names}
+        elif isinstance(exclude, dict):
+            self._masks = {x: masks.UserMasks.from_state(state, get_deck(x))
+                           for x, state in exclude.items()}
+
+    def _select_tags(self, tags, tag_mode: str = 'any'):
+        """
+        Limit the run to the words in any of tags, or in all of them if
+        tag_mode is 'all', see prolix.tags. If tags is empty or None draw
+        from every word of the decks.
+        """
+        if not tags:
+            return
+        from prolix.tags import tag_rows
+        self._tag_names, self._tag_mode = list(tags), tag_mode
+        self._tags = {x: tag_rows(tags, tag_mode, x) for x in self._mix.names}
+        self._tagged = np.array([len(self._tags[x]) > 0
+                                 for x in self._mix.names])
+        if not self._tagged.any():
+            raise ValueError(f'no words are tagged {", ".join(tags)}')
+
+    def _draw(self) -> tuple:
+        """ Return a deck from the mix and a random row id of it which is
+        not left out. """
+        name = self._mix.names[self._mix.choose(self._rng, self._tagged)]
+        deck = get_deck(name)
+        rows = self._tags[name] if self._tags is not None else None
+        masks = self._masks.get(name) if self._masks else None
+        if masks is not None:
+            return deck, masks.sample(self._rng, rows)
+        if rows is not None:
+            return deck, int(rows[self._rng.randint(len(rows))])
+        return deck, _get_random_row(deck, self._rng)
+
+    def _update_masks(self, deck: Deck, row: int, outcome: int):
+        """ Update the masks of deck with the outcome of a question. """
+        masks = self._masks.get(deck.name) if self._masks else None
+        if masks is not None:
+            masks.answer(row, outcome)
+
+    def _load_checkpoint(self, kind: str, checkpoint: bool, resume: bool,
+                         record=None) -> Optional[tuple]:
+        """
+        Checkpoint the run if checkpoint or resume is True. If resume is
+        True and the user has a valid checkpoint of this kind of run,
+        restore its random state and return its state and arrays, see
+        prolix.checkpoint.load, else return None.
+        """
+        if not (checkpoint or resume):
+            return None
+        from prolix.checkpoint import checkpoint_path, load, restore_rng
+        self._checkpoint_path = checkpoint_path(kind, self._user.name)
+        state = load(self._checkpoint_path) if resume else None
+        if state is not None:
+            if record is not None:
+                raise ValueError('a resumed run can not be recorded')
+            meta, arrays = state
+            self.seed = meta['seed']
+            self._rng = restore_rng(meta['rng'], arrays.pop('rng_keys'))
+        return state
+
+    def checkpoint(self):
+        """ Save the state of the run so a new run can resume it. """
+        from prolix.checkpoint import rng_state, save
+        meta, arrays = self._get_state()
+        rng, keys = rng_state(self._rng)
+        meta.update(seed=self.seed, rng=rng, decks=self._mix.to_dict(),
+                    tags=self._tag_names, tag_mode=self._tag_mode)
+        save(self._checkpoint_path, meta, dict(arrays, rng_keys=keys))
+        for masks in (self._masks or {}).values():
+            masks.save()
+
+    def _finished(self) -> bool:
+        """ Return True if the run has nothing left to ask. """
+        return True
 
     def __call__(self):
         """ start the urwid loop. """
         assert self._overlay is not None
         Loop = urwid.MainLoop if not self._debug else FakeLoop
-        kwargs = dict(palette=self.palette, unhandled_input=self._handle_input)
+        kwargs = dict(palette=self.palette, unhandled_input=self._on_key)
         self._loop = Loop(self._overlay, **kwargs)
+        if profiling.is_timing():
+            draw = self._loop.draw_screen
+            self._loop.draw_screen = profiling.timed('screen_draw')(draw)
         self._loop.run()
 
     def exit_program(self, button=None):
         """ Exit the GUI. """
         self._has_exited = True
-        if not self._debug:
+        if self._session is not None:
+            self._session.save()
+        if self._checkpoint_path is not None:
+            if self._finished():
+                prolix.checkpoint.remove(self._checkpoint_path)
+            else:
+                self.checkpoint()
+        for masks in (self._masks or {}).values():
+            masks.save()
+        # fold this session's answers into the user tables and make sure
+        # every queued write is committed before the program ends
+        prolix.user.compact_events_in_background()
+        prolix.user.flush()
+        if not (self._debug or self._headless):
             raise urwid.ExitMainLoop()
 
     @property
@@ -61,6 +210,57 @@ class ProlixUrWid:
         text = urwid.Text(name_block + user_block, align='center')
         return urwid.AttrMap(text, 'header_block')
 
+    def dispatch(self, kind: str, value):
+        """
+        Handle one input, recording it if this run is being recorded.
+
+        Parameters
+        ----------
+        kind
+            "key" for a key press or mouse event passed to _handle_input,
+            "choice" for the index of a quiz answer passed to item_chosen,
+            or "text" for a typed answer passed to submit_text.
+        value
+            The key, choice index or text.
+        """
+        # inputs caused by handling another input, eg a key press emitting
+        # a button click, are not recorded or they would replay twice
+        nested = self._dispatching
+        if self._session is not None and not nested:
+            self._session.add(kind, value)
+        self._dispatching = True
+        try:
+            if kind == 'key':
+                self._handle_input(value)
+            elif kind == 'choice':
+                self.item_chosen(None, value)
+            elif kind == 'text':
+                self.submit_text(value)
+            else:
+                raise ValueError(f'unknown input kind {kind}')
+        finally:
+            self._dispatching = nested
+        if not nested:
+            self._inputs += 1
+            every = prolix.checkpoint.checkpoint_every
+            if (self._checkpoint_path is not None and not self._has_exited
+                    and self._inputs % every == 0):
+                self.checkpoint()
+
+    def _on_key(self, key):
+        """ Urwid callback for input not handled by widgets. """
+        self.dispatch('key', key)
+
+    def _on_choice(self, button, choice: int):
+        """ Urwid callback for clicking an answer button. """
+        self.dispatch('choice', choice)
+
+    def item_chosen(self, button, choice):
+        """ Handle choosing an answer, only quizzes have answers. """
+
+    def submit_text(self, text: str):
+        """ Handle a typed answer, only recall runs take typed answers. """
+
     # --- abstract methods to be defined by subclass
 
     @abc.abstractmethod
@@ -68,6 +268,23 @@ class ProlixUrWid:
         """ A function to handle the input passed from user. """
         pass
 
+    @abc.abstractmethod
+    def _get_state(self) -> tuple:
+        """ Return a json serializable dict and a dict of arrays with the
+        state of the run, restored by _set_state. """
+        pass
+
+    @abc.abstractmethod
+    def _set_state(self, meta: dict, arrays: dict):
+        """ Restore the state returned by _get_state. """
+        pass
+
+    def _latency(self) -> float:
+        """ Return seconds since the question was shown and reset the timer. """
+        now = time.time()
+        latency, self._asked_at = now - self._asked_at, now
+        return latency
+
     def _get_footer(self):
         """ Return the urwid components to put in the bottom of the frame. """
         # Note this will return a black string if not overwritten
@@ -75,16 +292,55 @@ class ProlixUrWid:
         return urwid.Text(txt)
 
 
-def get_random_word(user=None) -> str:
+def get_random_word(user=None, rng=None) -> str:
     """
     Get a random word. If a user is specified favor words they have gotten
-    wrong in the past.
+    wrong in the past. rng is a numpy RandomState, if None the global state
+    is used.
+    """
+    deck = get_deck()
+    return deck.words[_get_random_row(deck, rng)]
+
+
+def _get_random_row(deck: Deck, rng=None) -> int:
+    """ Return a random row id of deck. """
+    rng = rng or np.random
+    return rng.randint(0, len(deck))
+
+
+def _get_definition_rows(deck: Deck, row: int, count=4, rng=None
+                         ) -> List[int]:
+    """
+    Return a list of count row ids, including row, for the definitions of
+    a quiz. See _get_definitions.
     """
-    df = prolix.read_words()
-    return df.iloc[np.random.randint(0, len(df))].name
+    rng = rng or np.random
+    inds = rng.randint(0, len(deck), count)
+    # make sure True ind is no in inds
+    inds_no_correct = list(set(inds) - {row})
+    # add correct ind and shuffle
+    inds = ([row] + inds_no_correct)[: count]
+    rng.shuffle(inds)
 
+    assert len(inds) == len(set(inds)), 'all index values must be unique'
+    assert row in inds, 'true index must be in index list'
+    return [int(x) for x in inds]
 
-def _get_definitions(word: str, count=4) -> List[str]:
+
+def _get_word_rows(deck: Deck, row: int, count=4, rng=None) -> List[int]:
+    """
+    Return a list of count row ids, including row, for the words of a
+    quiz. See _get_words.
+    """
+    rng = rng or np.random
+    choice = rng.choice(len(deck), count)
+    # words are sorted so sorting rows sorts the words
+    unique = ([row] + sorted(set(int(x) for x in choice) - {row}))[:count]
+    rng.shuffle(unique)
+    return unique
+
+
+def _get_definitions(word: str, count=4, rng=None) -> List[str]:
     """
     Return a list of definitions with the correct definition as a member.
 
@@ -95,24 +351,15 @@ def _get_definitions(word: str, count=4) -> List[str]:
     count
         The total number of definitions to return. If > 1 random definitions
         from other words will be mixed in.
+    rng
+        A numpy RandomState, if None the global state is used.
     """
-    df = prolix.read_words()
-    inds = np.random.randint(0, len(df), count)
-    # make sure the correct index is not mixed in
-    true_ind = np.argmax(df.index == word)
-    # make sure True ind is no in inds
-    inds_no_correct = list(set(inds) - {true_ind})
-    # add correct ind and shuffle
-    inds = ([true_ind] + inds_no_correct)[: count]
-    random.shuffle(inds)
+    deck = get_deck()
+    rows = _get_definition_rows(deck, deck.row(word), count, rng)
+    return [deck.definition(x) for x in rows]
 
-    assert len(inds) == len(set(inds)), 'all index values must be unique'
-    assert true_ind in inds, 'true index must be in index list'
-
-    return list(df.definition.values[inds])
 
-
-def _get_words(word: str, count=4) -> List[str]:
+def _get_words(word: str, count=4, rng=None) -> List[str]:
     """
     Return a list of words with the correct word included.
 
@@ -122,28 +369,63 @@ def _get_words(word: str, count=4) -> List[str]:
         The correct word to include.
     count
         The number of words to include in the list.
+    rng
+        A numpy RandomState, if None the global state is used.
     """
-    all_words = prolix.read_words().index
-    choice = list(np.random.choice(all_words, count))
-    unique = ([word] + list(set(choice) - {word}))[:count]
-    random.shuffle(unique)
-    return unique
+    deck = get_deck()
+    rows = _get_word_rows(deck, deck.row(word), count, rng)
+    return [deck.words[x] for x in rows]
 
 
 # ----------------- Word Quiz stuff
 
 class WordQuiz:
-    """ A class to quiz the user on a random, or selected word. """
-
-    def __init__(self, word: Optional[str] = None, count: int = 4):
-        # load the word list
-        df = prolix.read_words()
-        # get the True word and definition
-        self.word: str = word or get_random_word()
-        self.definition = df.loc[self.word].values[0]
+    """
+    A class to quiz the user on a random, or selected word.
+
+    Words and definitions are held as row ids of the shared deck, the
+    default deck unless another is given.
+    """
+
+    __slots__ = ('deck', 'row', 'word_rows', 'definition_rows')
+
+    @profiling.timed('question_build')
+    def __init__(self, word: Optional[str] = None, count: int = 4, rng=None,
+                 row: Optional[int] = None, deck: Optional[Deck] = None):
+        self.deck = deck = deck or get_deck()
+        # get the True word
+        if row is None:
+            row = deck.row(word) if word else _get_random_row(deck, rng)
+        self.row = row
         # mix in correct words/definition with randomly selected ones for quiz
-        self.quiz_words = _get_words(self.word, count)
-        self.quiz_definitions = _get_definitions(self.word, count)
+        self.word_rows = _get_word_rows(deck, self.row, count, rng)
+        self.definition_rows = _get_definition_rows(deck, self.row, count, rng)
+
+    @classmethod
+    def from_rows(cls, deck: Deck, row: int, word_rows: List[int],
+                  definition_rows: List[int]) -> 'WordQuiz':
+        """ Return a quiz of the given rows of deck, drawing nothing. """
+        quiz = cls.__new__(cls)
+        quiz.deck, quiz.row = deck, row
+        quiz.word_rows = list(word_rows)
+        quiz.definition_rows = list(definition_rows)
+        return quiz
+
+    @property
+    def word(self) -> str:
+        return self.deck.words[self.row]
+
+    @property
+    def definition(self) -> str:
+        return self.deck.definition(self.row)
+
+    @property
+    def quiz_words(self) -> List[str]:
+        return [self.deck.words[x] for x in self.word_rows]
+
+    @property
+    def quiz_definitions(self) -> List[str]:
+        return [self.deck.definition(x) for x in self.definition_rows]
 
     @property
     def word_df(self):
@@ -151,34 +433,33 @@ class WordQuiz:
         return prolix.read_words()
 
     @property
-    @lru_cache()
     def formatted_definition_list(self):
         """ Return a list of formatted definitions """
         # definition block, displays
-        out = [_format_defintion(x, n + 1)
-               for n, x in enumerate(self.quiz_definitions)]
-        return out
+        return [f'{n}. ' + self.deck.formatted(x)
+                for n, x in enumerate(self.definition_rows, 1)]
 
     @property
-    @lru_cache()
     def formatted_defintion(self):
         """ format only the correct definition. """
-        return _format_defintion(self.definition)
+        return self.deck.formatted(self.row)
 
     @property
     def _correct_def_index(self):
         """
         Return the index of the correct definition.
+
+        Some words share a definition, so this is the first choice with the
+        same text.
         """
-        wdef = self.word_df.loc[self.word].definition
-        return self.quiz_definitions.index(wdef)
+        return self.quiz_definitions.index(self.definition)
 
     @property
     def _correct_word_index(self):
         """
         Return the index of the correct word.
         """
-        return self.quiz_words.index(self.word)
+        return self.word_rows.index(self.row)
 
     def answer_def(self, number: Union[str, int]) -> bool:
         """
@@ -256,30 +537,97 @@ class QuizRun(ProlixUrWid):
         Indicates to quiz the user on words or definitions. If "word" then show
         once word and have the user select the definition. If "definition" then
         show the user a single definition and have the user select the word.
+    headless
+        If True don't build any widgets, the run is driven by prolix.headless.
+    seed
+        Seed for choosing the questions, if None one is drawn at random.
+        The seed of a run is available as its seed attribute.
+    record
+        If not None, the path of a file to record the run's inputs to so it
+        can be replayed with prolix.session.replay.
+    exclude
+        If True don't ask words the user discarded, mastered or filtered
+        out, see prolix.masks.
+    decks
+        The decks to ask words from, a name, list of names or mapping of
+        names to weights, see prolix.deck.DeckMix. If None the default deck.
+    checkpoint
+        If True save the state of the run when it is quit, and every
+        prolix.checkpoint.checkpoint_every inputs, so it can be resumed.
+    resume
+        If True continue the user's last checkpointed quiz, if it has
+        one and its decks haven't changed, rather than starting a new one.
+        Its seed, decks and options replace those given.
+    tags
+        If given, only ask words with any of these tags, see prolix.tags.
+    tag_mode
+        'any' to ask words with any of tags, 'all' for words with all of
+        them.
     """
 
     # set defaults
     _answered_correctly = True
     _name = 'Prolix Word Quiz'
 
-    def __init__(self, question_count=15, user=None, choice_count=4, quiz_on='word'):
-        self._remaining_questions = question_count
+    def __init__(self, question_count=15, user=None, choice_count=4, quiz_on='word',
+                 headless=False, seed=None, record=None, exclude=True,
+                 decks=None, checkpoint=False, resume=False, tags=None,
+                 tag_mode='any'):
+        self._headless = headless
+        self._seed(seed)
         self._user = prolix.User(user)
+        state = self._load_checkpoint('quiz', checkpoint, resume, record)
+        self._exclude(state[0]['decks'] if state else decks, exclude)
+        if state is not None:
+            tags, tag_mode = state[0]['tags'], state[0]['tag_mode']
+        self._select_tags(tags, tag_mode)
+        self._record(record, 'quiz', question_count=question_count,
+                     user=user, choice_count=choice_count, quiz_on=quiz_on)
+        self._remaining_questions = question_count
         self._buttons = []
         assert quiz_on in {'word', 'definition'}
         self._quiz_on = quiz_on
         self._def_count = choice_count
-        self._get_new_quiz()
+        if state is not None:
+            self._set_state(*state)
+        else:
+            self._get_new_quiz()
         self._create_display()
         self._quiz_on_cycle = cycle(_quiz_on)
 
         # map indices of buttons in the simple list walker
-        self._button_index = tuple(range(3, choice_count * 2 + 2, 2))
+        self._button_index = tuple(range(3, self._def_count * 2 + 2, 2))
+
+    def _get_state(self) -> tuple:
+        quiz = self.quiz
+        meta = dict(remaining=self._remaining_questions,
+                    answered_correctly=self._answered_correctly,
+                    quiz_on=self._quiz_on, deck=quiz.deck.name, row=quiz.row,
+                    word_rows=quiz.word_rows,
+                    definition_rows=quiz.definition_rows)
+        return meta, {}
+
+    def _set_state(self, meta: dict, arrays: dict):
+        self._remaining_questions = meta['remaining']
+        self._answered_correctly = meta['answered_correctly']
+        self._quiz_on = meta['quiz_on']
+        self._def_count = len(meta['word_rows'])
+        self.quiz = WordQuiz.from_rows(
+            get_deck(meta['deck']), meta['row'], meta['word_rows'],
+            meta['definition_rows'])
+        self._asked_at = time.time()
+
+    def _finished(self) -> bool:
+        return self._remaining_questions < 0
 
     def _get_new_quiz(self):
-        self.quiz = WordQuiz(count=self._def_count)
+        deck, row = self._draw()
+        self.quiz = WordQuiz(count=self._def_count, rng=self._rng, row=row,
+                             deck=deck)
+        _questions.inc(labels=(self._quiz_on,))
         self._remaining_questions -= 1
         self._answered_correctly = True
+        self._asked_at = time.time()
 
     def _get_title_and_choices(self):
         """ return a list of title to display and choices based on quiz type. """
@@ -292,8 +640,11 @@ class QuizRun(ProlixUrWid):
             choices = self.quiz.quiz_words
         return title, choices
 
+    @profiling.timed('widget_build')
     def _create_display(self):
         """ Create a menu to display quiz questions. """
+        if self._headless:
+            return
         # load title and choices, init header
         title, choices = self._get_title_and_choices()
         correct_ind = self.quiz._get_correct_ind(self._quiz_on)
@@ -307,7 +658,7 @@ class QuizRun(ProlixUrWid):
             # create buttons (each on is a definition that can be selected)
             button = urwid.Button(c)
             self._buttons.append(button)
-            urwid.connect_signal(button, 'click', self.item_chosen, ind)
+            urwid.connect_signal(button, 'click', self._on_choice, ind)
 
             if not self._answered_correctly and ind == correct_ind:
                 button_map = urwid.AttrMap(button, 'correct_def')
@@ -340,18 +691,28 @@ class QuizRun(ProlixUrWid):
         If so, got to next question else highlight correct answer.
         """
         is_correct = self.quiz.answer(choice, quiz_on=self._quiz_on)
+        self._record_answer(is_correct)
 
         if is_correct:
-            if self._answered_correctly:
-                self._user.correctly_answered_word(self.quiz.word)
             self._get_new_quiz()
         else:
             self._answered_correctly = False
-            self._user.incorrectly_answered_word(self.quiz.word)
-        if self._remaining_questions < 1:
+        if self._remaining_questions < 0:
             self.exit_program()
         self._create_display()
 
+    def _record_answer(self, is_correct: bool):
+        """ Append the answer to the current question to the event log. """
+        if not is_correct:
+            outcome = events.WRONG
+        elif self._answered_correctly:
+            outcome = events.RIGHT
+        else:  # right, but only after a wrong answer
+            outcome = events.RETRY
+        self._update_masks(self.quiz.deck, self.quiz.row, outcome)
+        self._user.record_answer(self.quiz.word, outcome, mode=self._quiz_on,
+                                 latency=self._latency())
+
     def _answer_correctly(self):
         """ Answer the current question correctly, used only for debugging. """
         if self._quiz_on == 'word':
@@ -390,30 +751,217 @@ class QuizRun(ProlixUrWid):
         return urwid.Text(txt)
 
 
+# -------------------- Typed recall stuff
+
+class RecallRun(ProlixUrWid):
+    """
+    A quiz in which the user types the word for a definition.
+
+    Answers are graded exact, close (a small typo) or wrong by
+    prolix.recall; close answers count as right.
+
+    Parameters
+    ----------
+    question_count
+       The number of questions to ask before exiting.
+    user
+       The name of the user, if None use the current user.
+    headless
+        If True don't build any widgets, the run is driven by prolix.headless.
+    seed
+        Seed for choosing the words, if None one is drawn at random.
+    record
+        If not None, the path of a file to record the run's inputs to.
+    exclude
+        If True don't ask words the user discarded, mastered or filtered
+        out, see prolix.masks.
+    decks
+        The decks to ask words from, see QuizRun.
+    checkpoint
+        If True save the state of the run so it can be resumed, see QuizRun.
+    resume
+        If True continue the user's last checkpointed recall quiz.
+    tags
+        If given, only ask words with these tags, see QuizRun.
+    tag_mode
+        How tags are combined, see QuizRun.
+    """
+    _name = 'Prolix Recall Quiz'
+    # outcome recorded in the event log for each grade
+    _outcomes = {'exact': events.RIGHT, 'close': events.CLOSE,
+                 'wrong': events.WRONG}
+
+    def __init__(self, question_count=15, user=None, headless=False,
+                 seed=None, record=None, exclude=True, decks=None,
+                 checkpoint=False, resume=False, tags=None, tag_mode='any'):
+        self._headless = headless
+        self._seed(seed)
+        self._user = prolix.User(user)
+        state = self._load_checkpoint('recall', checkpoint, resume, record)
+        self._exclude(state[0]['decks'] if state else decks, exclude)
+        if state is not None:
+            tags, tag_mode = state[0]['tags'], state[0]['tag_mode']
+        self._select_tags(tags, tag_mode)
+        self._record(record, 'recall', question_count=question_count,
+                     user=user)
+        self._remaining_questions = question_count
+        # the grade of the last answer, see submit_text
+        self.result = None
+        self._edit = None
+        if state is not None:
+            self._set_state(*state)
+        else:
+            self._get_new_question()
+        self._create_display()
+
+    def _get_state(self) -> tuple:
+        meta = dict(remaining=self._remaining_questions, deck=self.deck.name,
+                    row=self.row)
+        return meta, {}
+
+    def _set_state(self, meta: dict, arrays: dict):
+        self._remaining_questions = meta['remaining']
+        self.deck, self.row = deck, row = get_deck(meta['deck']), meta['row']
+        self.word = deck.words[row]
+        self.definition = deck.formatted(row)
+        self._asked_at = time.time()
+
+    def _finished(self) -> bool:
+        return self._remaining_questions < 0
+
+    def _get_new_question(self):
+        self.deck, self.row = deck, row = self._draw()
+        self.word = deck.words[row]
+        self.definition = deck.formatted(row)
+        _questions.inc(labels=('recall',))
+        self._remaining_questions -= 1
+        self._asked_at = time.time()
+
+    def submit_text(self, text: str):
+        """
+        Grade a typed answer, record it and move to the next question.
+
+        The grade is stored in the result attribute, a dict with the word,
+        the answer, the grade, the edit distance and, for wrong answers,
+        words close to what was typed.
+        """
+        from prolix import recall
+        grade, distance = recall.grade(text, self.word)
+        suggestions = []
+        if grade == recall.WRONG and text.strip():
+            suggestions = recall.did_you_mean(text, exclude={self.word},
+                                              deck=self.deck.name)
+        self.result = dict(word=self.word, answer=text, grade=grade,
+                           distance=distance, suggestions=suggestions)
+        outcome = self._outcomes[grade]
+        self._update_masks(self.deck, self.row, outcome)
+        self._user.record_answer(self.word, outcome, mode='recall',
+                                 latency=self._latency())
+        self._get_new_question()
+        if self._remaining_questions < 0:
+            self.exit_program()
+        self._create_display()
+
+    def _on_key(self, key):
+        # submit the typed text rather than the enter key so recordings
+        # replay without widgets
+        if key == 'enter' and self._edit is not None:
+            self.dispatch('text', self._edit.edit_text)
+        else:
+            self.dispatch('key', key)
+
+    def _handle_input(self, key):
+        """ Handle input not taken care of by the text box. """
+        if key in {'esc', 'Q'}:
+            self.exit_program(key)
+
+    def _feedback(self) -> str:
+        """ Return a line describing the grade of the last answer. """
+        result = self.result
+        if result is None:
+            return ''
+        if result['grade'] == 'exact':
+            return f'correct: {result["word"]}'
+        if result['grade'] == 'close':
+            return f'close, it is spelled {result["word"]}'
+        text = f'wrong, the word was {result["word"]}'
+        if result['suggestions']:
+            text += f' (did you mean {" or ".join(result["suggestions"])}?)'
+        return text
+
+    @profiling.timed('widget_build')
+    def _create_display(self):
+        """ Show the definition, the last answer's grade and a text box. """
+        if self._headless or self._has_exited:
+            return
+        self._edit = urwid.Edit('word: ')
+        body = [
+            urwid.Divider(),
+            urwid.AttrMap(urwid.Text(self.definition, align='center'),
+                          'title'),
+            urwid.Divider(),
+            self._edit,
+            urwid.Divider(),
+            urwid.Text(self._feedback()),
+        ]
+        list_box = urwid.ListBox(urwid.SimpleFocusListWalker(body))
+        list_box.set_focus(3)
+        if self._main is None:
+            self._main = urwid.Padding(list_box, left=2, right=2)
+        else:
+            self._main.original_widget = list_box
+        overlay = urwid.Overlay(self._main, urwid.SolidFill(u'\N{MEDIUM SHADE}'),
+                                align='center', width=('relative', 90),
+                                valign='middle', height=('relative', 60),
+                                min_width=40, min_height=20)
+        self._overlay = urwid.Frame(header=self._header, body=overlay,
+                                    footer=self._get_footer())
+
+    def _get_footer(self):
+        txt = 'type the word and press enter; esc: quit'
+        return urwid.Text(txt)
+
+
 # -------------------- Flash card stuff
 
 class Card:
-    """ A simple flash card. """
+    """ A simple flash card, holding the row id of its word in the deck,
+    the default deck unless another is given. """
+
+    __slots__ = ('deck', 'row', 'side')
+
+    @profiling.timed('card_build')
+    def __init__(self, word: Optional[str] = None, rng=None,
+                 row: Optional[int] = None, deck: Optional[Deck] = None):
+        self.deck = deck = deck or get_deck()
+        if row is None:
+            row = deck.row(word) if word else _get_random_row(deck, rng)
+        self.row = row
+        # the side currently displayed, "word" or "definition"
+        self.side = 'word'
+
+    @property
+    def word(self) -> str:
+        return self.deck.words[self.row]
 
-    def __init__(self, word: Optional[str] = None):
-        # load the word list
-        df = prolix.read_words()
-        # get the True word and definition
-        self.word: str = word or get_random_word()
-        self.definition = df.loc[self.word].values[0]
-        self.formated_definition = _format_defintion(self.definition)
+    @property
+    def definition(self) -> str:
+        return self.deck.definition(self.row)
 
-        self.side = 'word'
-        # iterators for flipping card
-        self.fliperator = cycle([self.formated_definition, self.word])
-        self.siderator = cycle(['definition', 'word'])
-        # the text currently displayed
-        self.displayed_text = self.word
+    @property
+    def formated_definition(self) -> str:
+        return self.deck.formatted(self.row)
+
+    @property
+    def displayed_text(self) -> str:
+        """ The text currently displayed. """
+        if self.side == 'word':
+            return self.word
+        return self.formated_definition
 
     def flip(self):
         """ Flip the card over. """
-        self.displayed_text = next(self.fliperator)
-        self.side = next(self.siderator)
+        self.side = 'definition' if self.side == 'word' else 'word'
 
 
 class CardRun(ProlixUrWid):
@@ -424,26 +972,120 @@ class CardRun(ProlixUrWid):
     ----------
     start_on
         Indicates if the flash cards should start on the word or definition.
+    user
+        The name of the user, if None use the current user.
+    headless
+        If True don't build any widgets, the run is driven by prolix.headless.
+    seed
+        Seed for drawing the cards, if None one is drawn at random.
+    record
+        If not None, the path of a file to record the run's inputs to so it
+        can be replayed with prolix.session.replay.
+    exclude
+        If True don't draw words the user discarded, mastered or filtered
+        out, see prolix.masks.
+    decks
+        The decks to draw cards from, see QuizRun.
+    checkpoint
+        If True save the state of the run so it can be resumed, see QuizRun.
+    resume
+        If True continue the user's last checkpointed flash card run, with
+        the cards it had left.
+    tags
+        If given, only draw cards of words with these tags, see QuizRun.
+    tag_mode
+        How tags are combined, see QuizRun.
     """
     card = None
     _name = 'Prolix Flash Cards'
 
-    def __init__(self, start_on='word', user: Optional[str] = None):
+    def __init__(self, start_on='word', user: Optional[str] = None,
+                 headless=False, seed=None, record=None, exclude=True,
+                 decks=None, checkpoint=False, resume=False, tags=None,
+                 tag_mode='any'):
         assert start_on in {'word', 'definition'}
+        self._headless = headless
+        self._seed(seed)
+        self._user = prolix.User(user)
+        state = self._load_checkpoint('cards', checkpoint, resume, record)
+        self._exclude(state[0]['decks'] if state else decks, exclude)
+        if state is not None:
+            tags, tag_mode = state[0]['tags'], state[0]['tag_mode']
+        self._select_tags(tags, tag_mode)
+        self._record(record, 'cards', start_on=start_on, user=user)
         self._side = start_on
-        self._user = user
-        self.words = list(prolix.read_words().index.values)
+        # a pile of the row ids of the cards left to draw for each deck
+        self._decks = self._mix.decks()
+        if state is not None:
+            self._set_state(*state)
+            self._create_display()
+            return
+        self._piles = []
+        for deck in self._decks:
+            masks = self._masks.get(deck.name) if self._masks else None
+            if masks is None:
+                pile = np.arange(len(deck), dtype=np.int32)
+            else:
+                pile = masks.eligible_rows()
+            if self._tags is not None:
+                pile = np.intersect1d(pile, self._tags[deck.name],
+                                      assume_unique=True)
+            self._piles.append(pile)
         self.draw_card()
         self._create_display()
 
+    @property
+    def words(self) -> np.ndarray:
+        """ Return the words of the cards left to draw. """
+        words = [x.words[y] for x, y in zip(self._decks, self._piles)]
+        return np.concatenate(words)
+
+    @property
+    def remaining(self) -> int:
+        """ Return the number of cards left to draw, without building
+        words. """
+        return sum(len(x) for x in self._piles)
+
+    def _get_state(self) -> tuple:
+        meta = dict(side=self._side, card_side=self.card.side,
+                    pile=self._pile, card_pos=self._card_pos)
+        # piles are sorted, so a bit per card of each deck stores them
+        left = np.zeros(sum(len(x) for x in self._decks), dtype=bool)
+        start = 0
+        for deck, pile in zip(self._decks, self._piles):
+            left[start + pile] = True
+            start += len(deck)
+        return meta, dict(left=np.packbits(left))
+
+    def _set_state(self, meta: dict, arrays: dict):
+        self._side = meta['side']
+        sizes = [len(x) for x in self._decks]
+        left = np.unpackbits(arrays['left'], count=sum(sizes)).astype(bool)
+        self._piles = [np.flatnonzero(x).astype(np.int32)
+                       for x in np.split(left, np.cumsum(sizes)[:-1])]
+        self._pile, self._card_pos = meta['pile'], meta['card_pos']
+        row = self._piles[self._pile][self._card_pos]
+        self.card = Card(row=int(row), deck=self._decks[self._pile])
+        self.card.side = meta['card_side']
+        self._asked_at = time.time()
+
+    def _finished(self) -> bool:
+        return not any(len(x) for x in self._piles)
+
     def draw_card(self):
         """ randomly draw a card from the candidate_words pile. """
-        if not self.words:  # no more cards to draw
+        sizes = np.array([len(x) for x in self._piles])
+        if not sizes.sum():  # no more cards to draw
             self.exit_program()
             return
-        # else randomly select a card
-        word = np.random.choice(self.words)
-        self.card = Card(word)
+        # else randomly select a deck with cards left, then a card
+        self._pile = self._mix.choose(self._rng, sizes > 0)
+        rows = self._piles[self._pile]
+        self._card_pos = self._rng.randint(len(rows))
+        self.card = Card(row=int(rows[self._card_pos]),
+                         deck=self._decks[self._pile])
+        _questions.inc(labels=('card',))
+        self._asked_at = time.time()
         # if the card is to start on the definition we need to flip it
         if self._side == 'definition':
             self.card.flip()
@@ -456,10 +1098,17 @@ class CardRun(ProlixUrWid):
             self.exit_program(key)
         # the user swipes right to keep the card
         elif key == 'right':
+            self._record_card(events.KEEP)
             self.draw_card()
         # the user swipes left to no longer be able to draw the card
         elif key == 'left':
-            self.words.remove(self.card.word)
+            self._record_card(events.DISCARD)
+            masks = self._masks.get(self.card.deck.name) \
+                if self._masks else None
+            if masks is not None:
+                masks.discard(self.card.row)
+            pile = self._piles[self._pile]
+            self._piles[self._pile] = np.delete(pile, self._card_pos)
             self.draw_card()
         # the user wants to flip the card over
         elif key == 'f' or mouse_clicked:
@@ -467,8 +1116,16 @@ class CardRun(ProlixUrWid):
             self._side = self.card.side
         self._create_display()
 
+    def _record_card(self, outcome: int):
+        """ Append keeping or discarding the current card to the event log. """
+        self._user.record_answer(self.card.word, outcome, mode='card',
+                                 latency=self._latency())
+
+    @profiling.timed('widget_build')
     def _create_display(self):
         """ Create a menu to display quiz questions. """
+        if self._headless:
+            return
         # only need to updated text
         txt_input = ('title', self.card.displayed_text)
         if self._main is not None:
@@ -0,0 +1,207 @@
+"""
+A compact, shared, in-memory representation of the word store.
+
+The deck holds the headwords as an array of interned strings, and every
+raw definition in one contiguous UTF-8 buffer with an array of offsets,
+so a definition costs its encoded bytes plus eight for its offset rather
+than a Python string object. Words are referred to by row id, their
+position in the sorted word store, and questions and cards hold row ids
+rather than copies of strings. Formatted definitions are cached, up to a
+bound, on the deck so every session shares them.
+
+Each named deck of the word store (see prolix.store) is loaded on first
+use. Loaded decks are kept until their total size passes
+deck_memory_budget, then the least recently used ones are dropped.
+Quizzes and flash cards draw from a DeckMix, a weighted mix of decks, by
+picking a deck and then a row of it, so decks are never concatenated.
+"""
+import sys
+from functools import lru_cache
+from itertools import count
+from typing import Iterable, List, Mapping, Optional, Union
+
+import numpy as np
+
+import prolix
+from prolix.cache import LoadingCache
+from prolix.store import default_deck
+from prolix.utils import _format_defintion
+
+# the most formatted definitions each deck keeps
+formatted_cache_size = 4096
+
+# the bytes of loaded decks above which the least recently used are dropped
+deck_memory_budget = 256 * 2 ** 20
+
+_DECKS = LoadingCache()
+# when each deck was last used, for dropping the least recently used
+_LAST_USED = {}
+_CLOCK = count()
+
+
+class Deck:
+    """
+    The words and raw definitions of the word store, by row id.
+
+    Parameters
+    ----------
+    words
+        The headwords, sorted.
+    definitions
+        The raw definition of each word.
+    name
+        The name of the deck in the word store.
+    """
+
+    __slots__ = ('words', 'name', '_buffer', '_offsets', '_nbytes',
+                 'formatted', '__weakref__')
+
+    def __init__(self, words: Iterable[str], definitions: Iterable[str],
+                 name: str = default_deck):
+        self.name = name
+        words = [sys.intern(str(x)) for x in words]
+        self.words = np.empty(len(words), dtype=object)
+        self.words[:] = words
+        encoded = [str(x).encode('utf-8') for x in definitions]
+        assert len(encoded) == len(words), 'need a definition for each word'
+        self._buffer = b''.join(encoded)
+        self._offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(x) for x in encoded], out=self._offsets[1:])
+        self.formatted = lru_cache(formatted_cache_size)(self._format)
+        self._nbytes = None
+
+    @classmethod
+    def from_frame(cls, df, name: str = default_deck) -> 'Deck':
+        """ Build a deck from a dataframe returned by read_words. """
+        return cls(df.index.values, df['definition'].values, name)
+
+    def __len__(self):
+        return len(self.words)
+
+    def row(self, word: str) -> int:
+        """ Return the row id of word, raise KeyError if it is not in the deck. """
+        row = int(np.searchsorted(self.words, word))
+        if row == len(self.words) or self.words[row] != word:
+            raise KeyError(word)
+        return row
+
+    def definition(self, row: int) -> str:
+        """ Return the raw definition of row. """
+        return self._buffer[self._offsets[row]: self._offsets[row + 1]] \
+            .decode('utf-8')
+
+    def _format(self, row: int) -> str:
+        return _format_defintion(self.definition(row))
+
+    def nbytes(self) -> int:
+        """ Return the approximate bytes held by the deck. """
+        if self._nbytes is None:
+            words = sum(sys.getsizeof(x) for x in self.words)
+            self._nbytes = (words + self.words.nbytes + len(self._buffer)
+                            + self._offsets.nbytes)
+        return self._nbytes
+
+
+def get_deck(name: Optional[str] = None) -> Deck:
+    """
+    Return a deck of the word store, loaded on first use and rebuilt if
+    its words change.
+
+    Parameters
+    ----------
+    name
+        The name of the deck, if None the default deck.
+    """
+    name = name or default_deck
+    df = prolix.read_words(name)
+    loads = _DECKS.loads
+    entry = _DECKS.get_or_load(name, lambda: (df, Deck.from_frame(df, name)),
+                               lambda entry: entry[0] is df)
+    _LAST_USED[name] = next(_CLOCK)
+    if _DECKS.loads != loads:
+        _evict(keep=name)
+    return entry[1]
+
+
+def loaded_decks() -> List[str]:
+    """ Return the names of the loaded decks, most recently used first. """
+    return sorted(_DECKS.keys(), key=lambda x: -_LAST_USED.get(x, -1))
+
+
+def _evict(keep: str):
+    """ Drop the least recently used decks, other than keep, until the
+    loaded decks fit in deck_memory_budget. """
+    names = loaded_decks()
+    sizes = {}
+    for name in names:
+        entry = _DECKS.get(name)
+        sizes[name] = entry[1].nbytes() if entry is not None else 0
+    total = sum(sizes.values())
+    for name in reversed(names):
+        if total <= deck_memory_budget:
+            break
+        if name == keep:
+            continue
+        _DECKS.pop(name)
+        prolix.store._word_cache.pop(name)
+        total -= sizes[name]
+
+
+def _reset():
+    """ Forget the decks so they are rebuilt from the new data path. """
+    _DECKS.clear()
+    _LAST_USED.clear()
+
+
+class DeckMix:
+    """
+    A weighted mix of decks to draw words from.
+
+    Parameters
+    ----------
+    decks
+        A deck name, a list of names weighted equally, or a mapping of
+        names to weights. If None only the default deck.
+    """
+
+    def __init__(self, decks: Union[None, str, Iterable[str],
+                                    Mapping[str, float]] = None):
+        if decks is None:
+            decks = [default_deck]
+        elif isinstance(decks, str):
+            decks = [decks]
+        if not isinstance(decks, Mapping):
+            decks = {x: 1.0 for x in decks}
+        weights = {str(k): float(v) for k, v in decks.items() if v}
+        if not weights or min(weights.values()) < 0:
+            raise ValueError('need at least one deck with a positive weight')
+        self.names = list(weights)
+        total = sum(weights.values())
+        self.probabilities = np.array(list(weights.values())) / total
+
+    def __len__(self):
+        return len(self.names)
+
+    def to_dict(self) -> dict:
+        """ Return the mix as a json serializable mapping of weights. """
+        return dict(zip(self.names, self.probabilities.tolist()))
+
+    def decks(self) -> List[Deck]:
+        """ Return the decks of the mix, loading them if needed. """
+        return [get_deck(x) for x in self.names]
+
+    def choose(self, rng=None, weights: Optional[np.ndarray] = None) -> int:
+        """
+        Return the index of a randomly chosen deck. A mix of one deck
+        draws nothing from rng, so single deck runs draw as they always
+        have. weights, if given, scale each deck's probability, eg to
+        leave out decks with no cards left.
+        """
+        if len(self.names) == 1:
+            return 0
+        rng = rng or np.random
+        probabilities = self.probabilities
+        if weights is not None:
+            probabilities = probabilities * weights
+            probabilities = probabilities / probabilities.sum()
+        return int(rng.choice(len(self.names), p=probabilities))
@@ -0,0 +1,282 @@
+"""
+An append-only log of answer events.
+
+Each event is packed into a small fixed-size binary record and appended to
+the active segment file in the events directory. Writes are buffered and
+never synced so logging an answer costs about as much as a memory copy.
+Once a segment is sealed it is never modified again; prolix.user folds
+sealed segments into the aggregate quiz tables when the log is compacted
+and then moves them to the compacted directory, where they are kept as
+history for analytics. Segments left active by processes which died are
+sealed before compaction.
+"""
+import atexit
+import hashlib
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+import prolix
+
+# the layout of a single event record
+event_dtype = np.dtype([
+    ('user', '<u8'),  # hash_name of the user name
+    ('word', '<u8'),  # hash_name of the word
+    ('correct', 'u1'),  # one of the outcome constants below
+    ('mode', 'u1'),  # index into modes
+    ('time', '<f8'),  # unix time of the answer
+    ('latency', '<f4'),  # seconds between showing the question and answering
+])
+_record = struct.Struct('<QQBBdf')
+assert _record.size == event_dtype.itemsize
+
+# the modes an event can be recorded in
+modes = ('word', 'definition', 'card', 'recall')
+
+# outcomes for quiz modes. RETRY is a correct answer after a miss, it is
+# not counted as right when the log is compacted. CLOSE is a typed answer
+# with a small typo, it is counted as right.
+WRONG, RIGHT, RETRY, CLOSE = 0, 1, 2, 3
+# outcomes for card mode
+KEEP, DISCARD = 0, 1
+
+# active segments are suffixed with .open, sealed ones with .seg
+_open_suffix = '.open'
+_sealed_suffix = '.seg'
+
+# the log used by this process, created on first use
+_LOG = None
+
+
+def default_event_path() -> Path:
+    """ Return the directory which holds the event segments. """
+    return Path(prolix.data_path) / 'events'
+
+
+def compacted_path(path: Optional[Path] = None) -> Path:
+    """ Return the directory which holds segments already compacted. """
+    return Path(path or default_event_path()) / 'compacted'
+
+
+def hash_name(name: str) -> int:
+    """
+    Return the 64 bit id used for a user or word in the event log. Two of
+    a million words share an id about once in 30 million decks, rather
+    than almost surely with a 32 bit id.
+    """
+    digest = hashlib.blake2b(name.encode('utf8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class EventLog:
+    """
+    Append events to segment files.
+
+    Parameters
+    ----------
+    path
+        The directory in which segments are stored.
+    max_bytes
+        The size at which the active segment is sealed and a new one started.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_bytes: int = 2 ** 22):
+        self.path = Path(path or default_event_path())
+        self.max_bytes = max_bytes
+        self._file = None
+        self._active = None
+        self._written = 0
+        self._segment_count = 0
+        self._lock = threading.Lock()
+
+    def _open_segment(self):
+        """ Start a new active segment. """
+        self.path.mkdir(parents=True, exist_ok=True)
+        name = f'{time.time_ns()}_{os.getpid()}_{self._segment_count}'
+        self._active = self.path / (name + _open_suffix)
+        self._file = self._active.open('ab')
+        self._written = 0
+        self._segment_count += 1
+
+    def append(self, user: str, word: str, correct: int, mode: str = 'word',
+               latency: float = 0.0, timestamp: Optional[float] = None):
+        """
+        Append an event to the active segment.
+
+        Parameters
+        ----------
+        user
+            The name of the user who answered.
+        word
+            The word which was asked.
+        correct
+            One of the outcome constants defined in this module.
+        mode
+            The mode the question was asked in, must be in modes.
+        latency
+            The number of seconds the user took to answer.
+        timestamp
+            The time of the answer, if None use the current time.
+        """
+        data = _record.pack(hash_name(user), hash_name(word), correct,
+                            modes.index(mode), timestamp or time.time(),
+                            latency)
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(data)
+            self._written += len(data)
+            if self._written >= self.max_bytes:
+                self._seal()
+
+    def flush(self):
+        """ Hand buffered events to the OS, the file is not synced. """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def _seal(self) -> Optional[Path]:
+        if self._file is None:
+            return None
+        self._file.close()
+        sealed = self._active.with_suffix(_sealed_suffix)
+        os.replace(self._active, sealed)
+        self._file, self._active = None, None
+        return sealed
+
+    def seal(self) -> Optional[Path]:
+        """
+        Close the active segment so it can be compacted.
+
+        Return the path to the sealed segment or None if nothing was written.
+        """
+        with self._lock:
+            return self._seal()
+
+
+def get_log() -> EventLog:
+    """ Return the event log used by this process. """
+    global _LOG
+    if _LOG is None:
+        _LOG = EventLog()
+        atexit.register(_LOG.seal)
+    return _LOG
+
+
+def log_event(user: str, word: str, correct: int, mode: str = 'word',
+              latency: float = 0.0):
+    """ Append an event to this process' event log. """
+    get_log().append(user, word, correct, mode=mode, latency=latency)
+
+
+def seal():
+    """ Seal the active segment of this process' log, if there is one. """
+    if _LOG is not None:
+        return _LOG.seal()
+
+
+def _alive(pid: int) -> bool:
+    """ Return True if a process with pid is running, or if that can't be
+    told on this platform. """
+    if pid == os.getpid():
+        return True
+    if os.name != 'posix':  # os.kill would end the process on windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # it runs as another user
+        return True
+    return True
+
+
+def seal_stale(path: Optional[Path] = None) -> List[Path]:
+    """
+    Seal the active segments of processes which are no longer running, such
+    as ones which crashed or were killed before their log was sealed at
+    exit. A partly written last record is ignored when the segment is read.
+
+    Return the paths to the sealed segments.
+    """
+    path = Path(path or default_event_path())
+    if not path.exists():
+        return []
+    out = []
+    for segment in path.glob('*' + _open_suffix):
+        # segments are named <time>_<pid>_<count>
+        try:
+            pid = int(segment.stem.split('_')[1])
+        except (IndexError, ValueError):
+            continue
+        if _alive(pid):
+            continue
+        sealed = segment.with_suffix(_sealed_suffix)
+        try:
+            os.replace(segment, sealed)
+        except FileNotFoundError:  # sealed by another process
+            continue
+        out.append(sealed)
+    return out
+
+
+def _reset():
+    """ Seal this process' log so the next event starts a new one. """
+    global _LOG
+    seal()
+    _LOG = None
+
+
+# --- reading
+
+
+def sealed_segments(path: Optional[Path] = None) -> List[Path]:
+    """ Return the sealed segments, oldest first. """
+    path = Path(path or default_event_path())
+    if not path.exists():
+        return []
+    return sorted(path.glob('*' + _sealed_suffix))
+
+
+def read_segment(path: Path) -> np.ndarray:
+    """
+    Read a segment into a structured array with dtype event_dtype.
+
+    Trailing bytes of a partially written record are ignored.
+    """
+    raw = np.fromfile(str(path), dtype=np.uint8)
+    usable = len(raw) - len(raw) % event_dtype.itemsize
+    return raw[:usable].view(event_dtype)
+
+
+def scan(path: Optional[Path] = None, include_open: bool = False,
+         include_compacted: bool = True) -> Iterator[np.ndarray]:
+    """
+    Yield a structured array of events for each segment in the log.
+
+    Parameters
+    ----------
+    path
+        The directory holding the segments.
+    include_open
+        If True also yield events from segments still being written.
+    include_compacted
+        If True also yield events from segments already compacted.
+    """
+    path = Path(path or default_event_path())
+    segments = sealed_segments(path)
+    if include_compacted:
+        segments += sealed_segments(compacted_path(path))
+    if include_open and path.exists():
+        segments += list(path.glob('*' + _open_suffix))
+    # segment names start with their creation time
+    segments = sorted(segments, key=lambda x: x.name)
+    for segment in segments:
+        events = read_segment(segment)
+        if len(events):
+            yield events
@@ -0,0 +1,304 @@
+"""
+Offline export of quiz sets and flash card decks.
+
+Each set is drawn from its own seeded random state, so a class can be
+given thousands of different but reproducible sets. Sets are built from a
+snapshot of the word store as arrays, rather than through WordQuiz and
+pandas lookups, and written by a pool of worker processes which share the
+snapshot taken by the parent, each worker streaming its sets to disk.
+
+Supported formats are markdown, csv, and anki, a tab separated text file
+which Anki's "Import File" reads as one note per line.
+"""
+import csv
+import io
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+import prolix
+from prolix.deck import get_deck
+from prolix.utils import _format_defintion
+
+# the file extension of each format
+formats = {'markdown': '.md', 'csv': '.csv', 'anki': '.txt'}
+kinds = ('quiz', 'cards')
+
+
+def _one_line(text: str) -> str:
+    """ Join the lines of a formatted definition. """
+    return '; '.join(x.strip() for x in text.split(':\n'))
+
+
+def _anki_field(text: str) -> str:
+    """ Escape text for a field of an Anki tab separated import. """
+    text = text.replace('\t', ' ').replace('\n', '<br>')
+    return text.replace(':<br>', '<br>')
+
+
+class _Snapshot:
+    """
+    The words and definitions of a read_words dataframe, as a compact deck,
+    with definitions formatted on first use.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.deck = get_deck()
+        self.words = self.deck.words
+        self._formatted = {}
+
+    def __len__(self):
+        return len(self.words)
+
+    def definition(self, ind: int) -> str:
+        """ Return the one line formatted definition of word number ind. """
+        out = self._formatted.get(ind)
+        if out is None:
+            out = _one_line(_format_defintion(self.deck.definition(ind)))
+            self._formatted[ind] = out
+        return out
+
+
+_SNAPSHOT = None
+
+
+def _get_snapshot() -> _Snapshot:
+    """ Return the snapshot of the current words, rebuilding if they changed. """
+    global _SNAPSHOT
+    df = prolix.read_words()
+    if _SNAPSHOT is None or _SNAPSHOT.df is not df:
+        _SNAPSHOT = _Snapshot(df)
+    return _SNAPSHOT
+
+
+def draw_questions(seed, questions: int = 15, choices: int = 4
+                   ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the word numbers of a quiz set's questions and choices.
+
+    Like WordQuiz, a question is a random word mixed in among other random
+    words, whose definitions (or the words themselves) are the choices.
+
+    Returns
+    -------
+    An array of the word number of each question, and an array with a row
+    of choice word numbers for each question.
+    """
+    size = len(_get_snapshot())
+    rng = np.random.RandomState(seed)
+    choices = min(choices, size)
+    words = np.empty(questions, dtype=np.int64)
+    options = np.empty((questions, choices), dtype=np.int64)
+    for num in range(questions):
+        words[num], options[num] = draw_question(rng, size, choices)
+    return words, options
+
+
+def draw_question(rng, size: int, choices: int = 4) -> Tuple[int, np.ndarray]:
+    """
+    Return a random word number below size and the word numbers of its
+    choices, which include it, drawn from the RandomState rng.
+    """
+    ind = rng.randint(size)
+    # draw other words until there are enough distinct ones, a few draws
+    # rather than a permutation of the deck
+    inds = [ind]
+    while len(inds) < choices:
+        other = rng.randint(size)
+        if other not in inds:
+            inds.append(other)
+    inds = np.array(inds, dtype=np.int64)
+    rng.shuffle(inds)
+    return ind, inds
+
+
+def quiz_set(seed, questions: int = 15, choices: int = 4,
+             quiz_on: str = 'word') -> list:
+    """
+    Return a list of question dicts for a quiz set.
+
+    Each dict has the word, the prompt, a list of choices and the index of
+    the correct choice.
+    """
+    assert quiz_on in {'word', 'definition'}
+    snap = _get_snapshot()
+    words, options = draw_questions(seed, questions, choices)
+    out = []
+    for ind, inds in zip(words, options):
+        if quiz_on == 'word':
+            prompt = snap.words[ind]
+            choice_text = [snap.definition(x) for x in inds]
+        else:
+            prompt = snap.definition(ind)
+            choice_text = list(snap.words[inds])
+        answer = int(np.flatnonzero(inds == ind)[0])
+        out.append(dict(word=snap.words[ind], prompt=prompt,
+                        choices=choice_text, answer=answer))
+    return out
+
+
+def card_deck(seed, size: int = 50) -> list:
+    """ Return a list of (word, definition) tuples for a card deck. """
+    snap = _get_snapshot()
+    rng = np.random.RandomState(seed)
+    inds = rng.choice(len(snap), min(size, len(snap)), replace=False)
+    return [(snap.words[x], snap.definition(x)) for x in inds]
+
+
+# --- renderers, each returns the text of one file
+
+
+def _letter(ind: int) -> str:
+    return chr(ord('a') + ind)
+
+
+def _quiz_markdown(questions: list, number: int) -> str:
+    lines = [f'# Prolix quiz {number}', '']
+    for num, question in enumerate(questions, 1):
+        lines.append(f'{num}. **{question["prompt"]}**')
+        for ind, choice in enumerate(question['choices']):
+            lines.append(f'    {_letter(ind)}. {choice}')
+        lines.append('')
+    lines += ['## Answers', '']
+    lines += [f'{num}. {_letter(question["answer"])}'
+              for num, question in enumerate(questions, 1)]
+    return '\n'.join(lines) + '\n'
+
+
+def _quiz_csv(questions: list, number: int) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    choice_count = max(len(x['choices']) for x in questions)
+    writer.writerow(['set', 'question', 'prompt']
+                    + [f'choice_{_letter(x)}' for x in range(choice_count)]
+                    + ['answer'])
+    for num, question in enumerate(questions, 1):
+        writer.writerow([number, num, question['prompt']]
+                        + question['choices']
+                        + [_letter(question['answer'])])
+    return out.getvalue()
+
+
+def _quiz_anki(questions: list, number: int) -> str:
+    lines = ['#separator:tab', '#html:true', '#tags column:3']
+    for question in questions:
+        choices = '<br>'.join(f'{_letter(ind)}. {_anki_field(choice)}'
+                              for ind, choice
+                              in enumerate(question['choices']))
+        front = f'<b>{_anki_field(question["prompt"])}</b><br><br>{choices}'
+        ind = question['answer']
+        back = f'{_letter(ind)}. {_anki_field(question["choices"][ind])}'
+        lines.append(f'{front}\t{back}\tprolix quiz_{number}')
+    return '\n'.join(lines) + '\n'
+
+
+def _cards_markdown(cards: list, number: int) -> str:
+    lines = [f'# Prolix flash cards {number}', '']
+    lines += [f'**{word}**: {definition}  ' for word, definition in cards]
+    return '\n'.join(lines) + '\n'
+
+
+def _cards_csv(cards: list, number: int) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['deck', 'word', 'definition'])
+    writer.writerows([number, word, definition] for word, definition in cards)
+    return out.getvalue()
+
+
+def _cards_anki(cards: list, number: int) -> str:
+    lines = ['#separator:tab', '#html:true', '#tags column:3']
+    lines += [f'{_anki_field(word)}\t{_anki_field(definition)}'
+              f'\tprolix deck_{number}' for word, definition in cards]
+    return '\n'.join(lines) + '\n'
+
+
+_renderers = {
+    ('quiz', 'markdown'): _quiz_markdown,
+    ('quiz', 'csv'): _quiz_csv,
+    ('quiz', 'anki'): _quiz_anki,
+    ('cards', 'markdown'): _cards_markdown,
+    ('cards', 'csv'): _cards_csv,
+    ('cards', 'anki'): _cards_anki,
+}
+
+
+def _export_one(job) -> str:
+    """ Build set number and write it to the output directory. """
+    path, kind, format, number, seed, options = job
+    if kind == 'quiz':
+        items = quiz_set([seed, number], **options)
+    else:
+        items = card_deck([seed, number], **options)
+    text = _renderers[(kind, format)](items, number)
+    out_path = Path(path) / f'{kind}_{number:05d}{formats[format]}'
+    out_path.write_text(text)
+    return str(out_path)
+
+
+def _init_worker(data_path):
+    """ Point a spawned worker at the parent's data directory. """
+    if Path(prolix.data_path) != Path(data_path):
+        prolix.set_data_path(data_path)
+    _get_snapshot()
+
+
+def export(path, kind: str = 'quiz', count: int = 30,
+           format: str = 'markdown', seed: int = 0,
+           processes: Optional[int] = None, questions: int = 15,
+           choices: int = 4, quiz_on: str = 'word',
+           deck_size: int = 50) -> int:
+    """
+    Write count quiz sets or card decks, one file each, to directory path.
+
+    Parameters
+    ----------
+    path
+        The output directory, created if needed.
+    kind
+        "quiz" or "cards".
+    count
+        The number of sets to write.
+    format
+        "markdown", "csv" or "anki".
+    seed
+        Set n is drawn with the seed (seed, n), so the same seed gives the
+        same sets.
+    processes
+        The number of worker processes, if None one per cpu. If 1 the sets
+        are written in this process.
+    questions, choices, quiz_on
+        The number of questions per quiz set, the number of choices per
+        question and whether the prompt is a word or a definition.
+    deck_size
+        The number of cards per deck.
+
+    Returns
+    -------
+    The number of files written.
+    """
+    if kind not in kinds:
+        raise ValueError(f'kind must be one of {kinds}, not {kind}')
+    if format not in formats:
+        raise ValueError(f'format must be one of {set(formats)}, not {format}')
+    if kind == 'quiz':
+        options = dict(questions=questions, choices=choices, quiz_on=quiz_on)
+    else:
+        options = dict(size=deck_size)
+    Path(path).mkdir(parents=True, exist_ok=True)
+    # take the snapshot before forking so workers share it
+    _get_snapshot()
+    jobs = [(str(path), kind, format, num, seed, options)
+            for num in range(1, count + 1)]
+    if processes == 1:
+        return len([_export_one(job) for job in jobs])
+    from multiprocessing import Pool
+    initargs = (str(prolix.data_path),)
+    processes = processes or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (4 * processes))
+    with Pool(processes, _init_worker, initargs) as pool:
+        written = pool.imap_unordered(_export_one, jobs, chunksize)
+        return sum(1 for _ in written)
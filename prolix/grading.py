@@ -0,0 +1,193 @@
+"""
+Bulk grading of answer sheets for exported quiz sets.
+
+A class handed sets from "prolix export" returns answer sheets of (user,
+set, question, letter) rows. Rather than rebuilding a WordQuiz for each
+row, the sets are redrawn from their seeds as arrays of word numbers and
+correct choices, so grading thousands of rows is one vectorized
+comparison, and the results are added to the users' stats in a single
+transaction on the database writer.
+"""
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import prolix
+from prolix.export import _get_snapshot, draw_questions
+
+# the columns of an answer sheet
+sheet_columns = ('user', 'set', 'question', 'answer')
+
+
+class QuizBatch:
+    """
+    The questions of a batch of exported quiz sets.
+
+    Question ids number the questions of every set in order, so question q
+    (from 1) of set s (from 1) has id (s - 1) * questions + q - 1.
+
+    Parameters
+    ----------
+    words
+        The word asked by each question.
+    answers
+        The index of the correct choice of each question.
+    questions
+        The number of questions per set.
+    """
+
+    def __init__(self, words: np.ndarray, answers: np.ndarray,
+                 questions: int = 15):
+        assert len(words) == len(answers)
+        self.words = words
+        self.answers = answers
+        self.questions = questions
+
+    def __len__(self):
+        return len(self.answers)
+
+    @classmethod
+    def generate(cls, sets: int, questions: int = 15, choices: int = 4,
+                 seed: int = 0) -> 'QuizBatch':
+        """
+        Redraw sets 1 to sets exported with seed, see prolix.export.export.
+
+        Whether the sets were quizzed on words or definitions doesn't
+        change which choice is correct.
+        """
+        snap = _get_snapshot()
+        inds = np.empty(sets * questions, dtype=np.int64)
+        answers = np.empty(sets * questions, dtype=np.int8)
+        for num in range(sets):
+            words, options = draw_questions([seed, num + 1], questions,
+                                            choices)
+            chunk = slice(num * questions, (num + 1) * questions)
+            inds[chunk] = words
+            answers[chunk] = np.argmax(options == words[:, None], axis=1)
+        return cls(snap.words[inds], answers, questions)
+
+    def question_ids(self, sets, questions) -> np.ndarray:
+        """ Return the question ids of set and question numbers. """
+        sets = np.asarray(sets, dtype=np.int64)
+        questions = np.asarray(questions, dtype=np.int64)
+        bad = (questions < 1) | (questions > self.questions) | (sets < 1)
+        ids = (sets - 1) * self.questions + questions - 1
+        bad |= ids >= len(self)
+        if bad.any():
+            ind = np.flatnonzero(bad)[0]
+            msg = f'set {sets[ind]} question {questions[ind]} is not in ' \
+                  f'the batch'
+            raise ValueError(msg)
+        return ids
+
+
+def choice_numbers(letters) -> np.ndarray:
+    """
+    Return the choice index of each answer letter, -1 for blank or
+    unreadable answers, which are graded wrong.
+    """
+    letters = pd.Series(np.asarray(letters, dtype=object))
+    letters = letters.astype(str).str.strip().str.lower()
+    numbers = letters.str.len().eq(1) & letters.str.match('[a-z]')
+    out = np.full(len(letters), -1, dtype=np.int64)
+    chosen = np.asarray(letters[numbers], dtype='U1')
+    out[numbers.values] = chosen.view(np.int32) - ord('a')
+    return out
+
+
+def grade(batch: QuizBatch, users: Sequence[str], question_ids,
+          letters) -> pd.DataFrame:
+    """
+    Grade answers against a batch.
+
+    Returns
+    -------
+    A dataframe with a row per answer and columns user, word and correct.
+    """
+    question_ids = np.asarray(question_ids, dtype=np.int64)
+    assert len(users) == len(question_ids) == len(letters)
+    correct = batch.answers[question_ids] == choice_numbers(letters)
+    return pd.DataFrame({
+        'user': np.asarray(users, dtype=object),
+        'word': batch.words[question_ids],
+        'correct': correct,
+    })
+
+
+def record(graded: pd.DataFrame):
+    """
+    Add graded answers, from grade, to the users' stats in one transaction.
+    """
+    if not len(graded):
+        return
+    rows = graded.itertuples(index=False, name=None)
+    prolix.user.get_writer().submit(prolix.user.add_answers, list(rows))
+    prolix.user.flush()
+
+
+def scores(graded: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return a dataframe indexed by user of the number of answers, the
+    number correct and the fraction correct.
+    """
+    out = graded.groupby('user')['correct'].agg(['size', 'sum'])
+    out.columns = ['answered', 'correct']
+    out['score'] = out['correct'] / out['answered']
+    return out
+
+
+def grade_answers(batch: QuizBatch, users: Sequence[str], question_ids,
+                  letters, record_results: bool = True) -> pd.DataFrame:
+    """
+    Grade answers, add them to the users' stats and return the scores.
+
+    Parameters
+    ----------
+    batch
+        The quiz sets answered.
+    users
+        The user who gave each answer.
+    question_ids
+        The question id of each answer, see QuizBatch.question_ids.
+    letters
+        The letter of the choice of each answer.
+    record_results
+        If False only score the answers.
+
+    Returns
+    -------
+    The scores of each user, see scores.
+    """
+    graded = grade(batch, users, question_ids, letters)
+    if record_results:
+        record(graded)
+    return scores(graded)
+
+
+def read_answer_sheet(path) -> pd.DataFrame:
+    """ Read a csv answer sheet with the columns in sheet_columns. """
+    df = pd.read_csv(Path(path), dtype={'user': str, 'answer': str},
+                     keep_default_na=False)
+    missing = set(sheet_columns) - set(df.columns)
+    if missing:
+        raise ValueError(f'{path} is missing columns {sorted(missing)}')
+    return df
+
+
+def grade_sheet(path, sets: Optional[int] = None, questions: int = 15,
+                choices: int = 4, seed: int = 0,
+                record_results: bool = True) -> pd.DataFrame:
+    """
+    Grade a csv answer sheet for quiz sets written by prolix.export.export
+    with the same questions, choices and seed. If sets is None it is the
+    highest set number on the sheet.
+    """
+    sheet = read_answer_sheet(path)
+    if sets is None:
+        sets = int(sheet['set'].max()) if len(sheet) else 0
+    batch = QuizBatch.generate(sets, questions, choices, seed)
+    ids = batch.question_ids(sheet['set'].values, sheet['question'].values)
+    return grade_answers(batch, sheet['user'].values, ids,
+                         sheet['answer'].values, record_results)
@@ -0,0 +1,221 @@
+"""
+Line oriented drivers for running quizzes and flash cards without urwid.
+
+Questions, cards and results are written to an output stream, either as
+plain text or as one JSON object per line, and answers are read from an
+input stream one per line. The same QuizRun, RecallRun and CardRun logic
+used by the terminal UI is driven, but no widgets are built.
+"""
+import json
+import sys
+from typing import Optional, TextIO
+
+from prolix.core import CardRun, QuizRun, RecallRun, _letter_num_map
+from prolix.utils import _format_defintion
+
+# commands accepted by the card driver and the keys they map to
+_card_commands = {
+    'f': 'f', 'flip': 'f',
+    'n': 'right', 'next': 'right', 'right': 'right',
+    'd': 'left', 'discard': 'left', 'left': 'left',
+    'q': 'q', 'quit': 'q',
+}
+
+
+class _Stream:
+    """ Reads commands and writes messages in plain or json format. """
+
+    def __init__(self, stdin: Optional[TextIO], stdout: Optional[TextIO],
+                 json_mode: bool):
+        self.stdin = stdin or sys.stdin
+        self.stdout = stdout or sys.stdout
+        self.json_mode = json_mode
+
+    def read(self) -> Optional[str]:
+        """ Return the next command, lower cased, or None at end of input. """
+        line = self.stdin.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if self.json_mode and line.startswith('{'):
+            try:
+                data = json.loads(line)
+            except ValueError:
+                return ''
+            line = str(data.get('answer', data.get('command', '')))
+        return line.lower()
+
+    def write(self, message: dict, text: str):
+        """ Write message as json or text, depending on the mode. """
+        out = json.dumps(message) if self.json_mode else text
+        self.stdout.write(out + '\n')
+        self.stdout.flush()
+
+
+def _parse_choice(answer: str, count: int) -> Optional[int]:
+    """ Return the 0 based index of a numbered or lettered choice. """
+    if answer.isdigit():
+        ind = int(answer) - 1
+    else:
+        ind = _letter_num_map.get(answer, -1)
+    return ind if 0 <= ind < count else None
+
+
+def _question(quiz_run: QuizRun) -> dict:
+    """ Return the prompt and choices of the current question. """
+    quiz = quiz_run.quiz
+    if quiz_run._quiz_on == 'word':
+        prompt = quiz.word
+        choices = [_format_defintion(x) for x in quiz.quiz_definitions]
+    else:
+        prompt = quiz.formatted_defintion
+        choices = list(quiz.quiz_words)
+    return dict(type='question', mode=quiz_run._quiz_on, prompt=prompt,
+                choices=choices)
+
+
+def run_quiz(quiz_run: QuizRun, stdin: Optional[TextIO] = None,
+             stdout: Optional[TextIO] = None, json_mode: bool = False) -> dict:
+    """
+    Run a quiz reading answers from stdin and writing to stdout.
+
+    If stdin or stdout are None the standard streams are used.
+
+    Answers are a choice number (1, 2, ...) or letter (a, b, ...); "f"
+    flips the quiz mode from the next question and "q" quits. In json mode
+    input lines may also be objects such as {"answer": 2}.
+
+    Returns
+    -------
+    A summary dict with the number of questions asked, the number answered
+    correctly on the first try and the number of wrong answers.
+    """
+    stream = _Stream(stdin, stdout, json_mode)
+    summary = dict(type='summary', asked=0, correct=0, wrong=0)
+    missed = False
+    ask = True
+    flip = False  # if the mode flips when the next question is asked
+    while not quiz_run._has_exited:
+        if ask:
+            if flip:
+                quiz_run.dispatch('key', 'f')
+                flip = False
+            question = _question(quiz_run)
+            summary['asked'] += 1
+            lines = [f'[{summary["asked"]}] {question["prompt"]}']
+            lines += [f'  {num}. {choice}' for num, choice
+                      in enumerate(question['choices'], 1)]
+            stream.write(dict(question, number=summary['asked']),
+                         '\n'.join(lines))
+            ask = False
+        answer = stream.read()
+        if answer is None or answer in {'q', 'quit'}:
+            quiz_run.dispatch('key', 'q')
+            break
+        if answer == 'f':
+            flip = not flip
+            continue
+        choice = _parse_choice(answer, len(question['choices']))
+        if choice is None:
+            stream.write(dict(type='error', input=answer),
+                         f'invalid answer: {answer}')
+            continue
+        word = quiz_run.quiz.word
+        correct_ind = quiz_run.quiz._get_correct_ind(quiz_run._quiz_on)
+        is_correct = choice == correct_ind
+        quiz_run.dispatch('choice', choice)
+        if is_correct:
+            summary['correct'] += not missed
+            missed, ask = False, True
+        else:
+            summary['wrong'] += 1
+            missed = True
+        result = dict(type='result', word=word, correct=is_correct,
+                      answer=correct_ind + 1)
+        text = 'correct' if is_correct else f'wrong, answer: {correct_ind + 1}'
+        stream.write(result, text)
+    stream.write(summary, 'asked: {asked} correct: {correct} '
+                          'wrong: {wrong}'.format(**summary))
+    return summary
+
+
+def run_cards(card_run: CardRun, stdin: Optional[TextIO] = None,
+              stdout: Optional[TextIO] = None, json_mode: bool = False
+              ) -> dict:
+    """
+    Show flash cards reading commands from stdin and writing to stdout.
+
+    If stdin or stdout are None the standard streams are used.
+
+    Commands are "f" (flip), "n" (next card, keep this one), "d" (discard
+    this card) and "q" (quit).
+
+    Returns
+    -------
+    A summary dict with the number of cards shown and discarded.
+    """
+    stream = _Stream(stdin, stdout, json_mode)
+    summary = dict(type='summary', shown=0, discarded=0)
+    show, last_card = True, None
+    while not card_run._has_exited:
+        card = card_run.card
+        if show:
+            summary['shown'] += card is not last_card
+            last_card = card
+            message = dict(type='card', word=card.word, side=card.side,
+                           text=card.displayed_text,
+                           remaining=card_run.remaining)
+            stream.write(message, card.displayed_text)
+            show = False
+        command = stream.read()
+        if command is None:
+            command = 'q'
+        key = _card_commands.get(command)
+        if key is None:
+            stream.write(dict(type='error', input=command),
+                         f'invalid command: {command}')
+            continue
+        card_run.dispatch('key', key)
+        summary['discarded'] += key == 'left'
+        show = True
+    stream.write(summary, 'shown: {shown} discarded: {discarded}'
+                          .format(**summary))
+    return summary
+
+
+def run_recall(recall_run: RecallRun, stdin: Optional[TextIO] = None,
+               stdout: Optional[TextIO] = None, json_mode: bool = False
+               ) -> dict:
+    """
+    Run a typed recall quiz reading answers from stdin and writing to stdout.
+
+    If stdin or stdout are None the standard streams are used.
+
+    Each line of input is a typed answer, except "q" which quits. In json
+    mode input lines may also be objects such as {"answer": "abate"}.
+
+    Returns
+    -------
+    A summary dict with the number of questions asked and the number of
+    exact, close and wrong answers.
+    """
+    stream = _Stream(stdin, stdout, json_mode)
+    summary = dict(type='summary', asked=0, exact=0, close=0, wrong=0)
+    while not recall_run._has_exited:
+        summary['asked'] += 1
+        stream.write(dict(type='question', mode='recall',
+                          prompt=recall_run.definition,
+                          number=summary['asked']),
+                     f'[{summary["asked"]}] {recall_run.definition}')
+        answer = stream.read()
+        if answer is None or answer in {'q', 'quit'}:
+            summary['asked'] -= 1
+            recall_run.dispatch('key', 'esc')
+            break
+        recall_run.dispatch('text', answer)
+        result = recall_run.result
+        summary[result['grade']] += 1
+        stream.write(dict(result, type='result'), recall_run._feedback())
+    stream.write(summary, 'asked: {asked} exact: {exact} close: {close} '
+                          'wrong: {wrong}'.format(**summary))
+    return summary
@@ -0,0 +1,436 @@
+"""
+Per-user masks of the words left out of quizzes and flash cards.
+
+Each user has three masks over the row ids of the deck: the words they
+discarded, the words they have mastered (answered right mastery_streak
+times in a row) and the words they filtered out. The masks are combined
+with bitwise operations into one excluded array which is updated in place
+as the user answers, so drawing an eligible word is a random row and one
+lookup rather than a pass over the deck. Each deck has its own masks,
+saved to masks/<deck>/<user>.npz in the data directory and rebuilt from
+the user's tables and filter, kept by word in filters/<deck>/<user>.txt,
+when the deck's csv changes. Answers and discards which arrive other than
+through a run, from the server, grading, imports or syncs, are applied to
+the loaded and saved masks in place.
+"""
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import prolix
+from prolix import events
+from prolix.cache import LoadingCache
+from prolix.deck import Deck, get_deck
+from prolix.store import _csv_key, default_deck
+from prolix.utils import atomic_write
+
+# bump when the mask layout changes so old files are rebuilt
+masks_version = 1
+
+# right answers in a row after which a word is mastered
+mastery_streak = 3
+
+# random draws tried before picking from the eligible rows directly
+_sample_tries = 8
+
+_MASKS = LoadingCache()
+
+
+class UserMasks:
+    """
+    The discarded, mastered and filtered words of a user, by row id.
+
+    Parameters
+    ----------
+    deck
+        The deck the masks index.
+    user
+        The name of the user, if None the masks are never saved.
+    key
+        The version and deck csv key the masks were built for.
+    """
+
+    __slots__ = ('deck', 'user', 'key', 'discarded', 'filtered', 'streak',
+                 'excluded', 'excluded_count', 'dirty', '_lock')
+
+    def __init__(self, deck: Deck, user: Optional[str] = None,
+                 key: tuple = ()):
+        size = len(deck)
+        self.deck = deck
+        self.user = user
+        self.key = key
+        self.discarded = np.zeros(size, dtype=bool)
+        self.filtered = np.zeros(size, dtype=bool)
+        # consecutive right answers, a word is mastered at mastery_streak
+        self.streak = np.zeros(size, dtype=np.uint8)
+        self.excluded = np.zeros(size, dtype=bool)
+        self.excluded_count = 0
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.excluded)
+
+    @property
+    def mastered(self) -> np.ndarray:
+        """ Return the mask of mastered words. """
+        return self.streak >= mastery_streak
+
+    def combine(self):
+        """ Recompute the excluded mask from the discarded, mastered and
+        filtered masks. """
+        with self._lock:
+            np.logical_or(self.discarded, self.filtered, out=self.excluded)
+            self.excluded |= self.mastered
+            self.excluded_count = int(np.count_nonzero(self.excluded))
+
+    def eligible_rows(self) -> np.ndarray:
+        """ Return the row ids of the words which are not excluded. """
+        return np.flatnonzero(~self.excluded).astype(np.int32)
+
+    def sample(self, rng=None, rows: Optional[np.ndarray] = None) -> int:
+        """
+        Return a random eligible row id, or any row if every word is
+        excluded. With nothing excluded this draws the same row, from the
+        same random stream, as an unmasked draw. If rows, an array of row
+        ids, is given the row is drawn from them.
+        """
+        rng = rng or np.random
+        if rows is not None:
+            return self._sample_rows(rng, rows)
+        size = len(self.excluded)
+        if self.excluded_count >= size:
+            return int(rng.randint(0, size))
+        for _ in range(_sample_tries):
+            row = rng.randint(0, size)
+            if not self.excluded[row]:
+                return int(row)
+        rows = self.eligible_rows()
+        return int(rows[rng.randint(0, len(rows))])
+
+    def _sample_rows(self, rng, rows: np.ndarray) -> int:
+        """ Return a random eligible row id of rows, or any of them if
+        every one is excluded. """
+        for _ in range(_sample_tries):
+            row = rows[rng.randint(0, len(rows))]
+            if not self.excluded[row]:
+                return int(row)
+        eligible = rows[~self.excluded[rows]]
+        if not len(eligible):
+            eligible = rows
+        return int(eligible[rng.randint(0, len(eligible))])
+
+    def _update(self, row: int):
+        """ Update the excluded mask at row, the lock must be held. """
+        excluded = bool(self.discarded[row] or self.filtered[row]
+                        or self.streak[row] >= mastery_streak)
+        if excluded != self.excluded[row]:
+            self.excluded[row] = excluded
+            self.excluded_count += 1 if excluded else -1
+        self.dirty = True
+
+    def answer(self, row: int, outcome: int):
+        """ Update the streak of row with an outcome from prolix.events. """
+        with self._lock:
+            if outcome in (events.RIGHT, events.CLOSE):
+                self.streak[row] = min(int(self.streak[row]) + 1, 255)
+            elif outcome == events.WRONG:
+                self.streak[row] = 0
+            else:  # a retry doesn't count as right or break the streak
+                return
+            self._update(row)
+
+    def discard(self, row: int):
+        """ Mark row as discarded. """
+        with self._lock:
+            self.discarded[row] = True
+            self._update(row)
+
+    def discard_words(self, words: Iterable[str]):
+        """ Mark words as discarded, ignoring words not in the deck. """
+        for row in _rows(self.deck, words):
+            self.discard(row)
+
+    def answer_words(self, answers: Iterable[Tuple[str, int]]):
+        """ Update the streaks with (word, outcome) tuples, oldest first,
+        ignoring words not in the deck. """
+        for word, outcome in answers:
+            for row in _rows(self.deck, [word]):
+                self.answer(row, outcome)
+
+    def add_counts(self, counts: Iterable[Tuple[str, int, int]]):
+        """
+        Update the streaks with (word, right, wrong) counts of answers whose
+        order is unknown. A word answered wrong loses its streak, as its
+        wrong answers may have come last, and the others extend theirs by
+        their right answers.
+        """
+        for word, right, wrong in counts:
+            for row in _rows(self.deck, [word]):
+                with self._lock:
+                    streak = 0 if wrong else int(self.streak[row]) + right
+                    self.streak[row] = min(streak, 255)
+                    self._update(row)
+
+    def clear(self):
+        """ Forget the discarded words and streaks, keeping the filter. """
+        with self._lock:
+            self.discarded[:] = False
+            self.streak[:] = 0
+            self.dirty = True
+        self.combine()
+
+    def set_filter(self, words: Iterable[str] = ()):
+        """ Exclude only the given words, on top of discarded and mastered
+        words. An empty filter excludes nothing. """
+        rows = list(_rows(self.deck, words))
+        with self._lock:
+            self.filtered[:] = False
+            self.filtered[rows] = True
+            self.dirty = True
+        self.combine()
+
+    def state(self) -> dict:
+        """
+        Return the excluded words and the streaks of words not yet
+        mastered as a json serializable dict, see from_state.
+        """
+        words = self.deck.words
+        partial = np.flatnonzero((self.streak > 0) & ~self.excluded)
+        return dict(excluded=list(words[self.excluded]),
+                    streaks={words[x]: int(self.streak[x]) for x in partial})
+
+    @classmethod
+    def from_state(cls, state: dict, deck: Optional[Deck] = None
+                   ) -> 'UserMasks':
+        """ Return masks, which are not saved, from a dict made by state. """
+        masks = cls(deck or get_deck())
+        masks.filtered[list(_rows(masks.deck, state['excluded']))] = True
+        for word, streak in state['streaks'].items():
+            masks.streak[list(_rows(masks.deck, [word]))] = streak
+        masks.combine()
+        return masks
+
+    def save(self, path=None):
+        """ Save the masks if they changed since they were loaded. """
+        if self.user is None or not self.dirty:
+            return
+        path = path or _masks_path(self.user, self.deck.name)
+        with self._lock, atomic_write(path) as fi:
+            np.savez(fi, key=np.array(self.key, dtype=np.int64),
+                     discarded=np.packbits(self.discarded),
+                     filtered=np.packbits(self.filtered),
+                     streak=self.streak)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path, deck: Deck, user: str, key: tuple
+             ) -> Optional['UserMasks']:
+        """ Load masks saved with save, None if they were saved for another
+        version or deck csv. """
+        with np.load(str(path), allow_pickle=False) as data:
+            if tuple(data['key']) != key:
+                return None
+            masks = cls(deck, user, key)
+            size = len(deck)
+            masks.discarded[:] = np.unpackbits(data['discarded'])[:size]
+            masks.filtered[:] = np.unpackbits(data['filtered'])[:size]
+            masks.streak[:] = data['streak']
+        masks.combine()
+        return masks
+
+
+def _rows(deck: Deck, words: Iterable[str]) -> Iterable[int]:
+    """ Yield the row ids of the words which are in deck. """
+    for word in words:
+        try:
+            yield deck.row(word)
+        except KeyError:
+            continue
+
+
+def _masks_path(user: str, deck: Optional[str] = None) -> Path:
+    """ Return the file the masks of user for a deck are saved to. """
+    return Path(prolix.data_path) / 'masks' / (deck or default_deck) \
+        / f'{user}.npz'
+
+
+def _build(deck: Deck, user: str, key: tuple) -> UserMasks:
+    """ Build the masks of user from their discarded and quiz tables and
+    their filter. A rebuilt streak is the word's right answers less its
+    wrong ones. """
+    from prolix.user import _USER_CACHE, _add_user_to_db, flush
+    flush()
+    _add_user_to_db(user, set_current=False)
+    discarded_table, quiz_table = _USER_CACHE[user]
+    masks = UserMasks(deck, user, key)
+    discarded = [x.word for x in discarded_table.select(discarded_table.word)]
+    masks.discarded[list(_rows(deck, discarded))] = True
+    query = quiz_table.select(quiz_table.word, quiz_table.right,
+                              quiz_table.wrong).tuples()
+    for word, right, wrong in query:
+        for row in _rows(deck, [word]):
+            masks.streak[row] = min(max(right - wrong, 0), 255)
+    masks.filtered[list(_rows(deck, read_filter(user, deck.name)))] = True
+    masks.combine()
+    return masks
+
+
+def get_masks(user: str, deck: Optional[str] = None) -> UserMasks:
+    """
+    Return the masks of user for a deck, if None the default deck.
+
+    The masks are loaded from disk if they were saved for the deck's
+    current csv, else they are rebuilt from the user's tables.
+    """
+    deck = deck or default_deck
+    key = (masks_version, *_csv_key(deck))
+
+    def _load():
+        words = get_deck(deck)
+        path = _masks_path(user, deck)
+        masks = None
+        if path.exists():
+            masks = UserMasks.load(path, words, user, key)
+        return masks if masks is not None else _build(words, user, key)
+
+    return _MASKS.get_or_load((user, deck), _load, lambda x: x.key == key)
+
+
+def _loaded(user: str) -> dict:
+    """ Return the loaded masks of user by deck name. """
+    out = {}
+    for name, deck in _MASKS.keys():
+        masks = _MASKS.get((name, deck))
+        if name == user and masks is not None:
+            out[deck] = masks
+    return out
+
+
+def save_masks():
+    """ Save the masks of every user which changed. """
+    for key in _MASKS.keys():
+        masks = _MASKS.get(key)
+        if masks is not None:
+            masks.save()
+
+
+def update_masks(user: str, answers: Iterable[Tuple[str, int]] = (),
+                 counts: Iterable[Tuple[str, int, int]] = (),
+                 discarded: Iterable[str] = (), clear: bool = False):
+    """
+    Update the masks of user in place after their tables changed other than
+    through a run, such as answers from the server or an import. The loaded
+    masks, which open runs share, and the saved masks of other decks are
+    updated and saved, so streaks carry on rather than being rebuilt.
+
+    Parameters
+    ----------
+    answers
+        (word, outcome) tuples, oldest first, see UserMasks.answer_words.
+    counts
+        (word, right, wrong) tuples of answers whose order is unknown, see
+        UserMasks.add_counts.
+    discarded
+        Words the user discarded.
+    clear
+        If True forget the discarded words and streaks first, when the
+        user's tables were replaced.
+    """
+    answers, counts, discarded = list(answers), list(counts), list(discarded)
+
+    def _apply(masks: UserMasks):
+        if clear:
+            masks.clear()
+        masks.discard_words(discarded)
+        masks.add_counts(counts)
+        masks.answer_words(answers)
+        masks.save()
+
+    for masks in _user_masks(user):
+        _apply(masks)
+
+
+def _user_masks(user: str, deck: Optional[str] = None
+                ) -> Iterator[UserMasks]:
+    """
+    Yield the loaded masks of user and their saved masks of other decks,
+    loaded from disk but not kept, only those of deck if given. Saved masks
+    of an old deck csv are removed instead, they are rebuilt when used.
+    """
+    loaded = _loaded(user)
+    for name, masks in loaded.items():
+        if deck is None or name == deck:
+            yield masks
+    for path in Path(prolix.data_path).glob(f'masks/*/{user}.npz'):
+        name = path.parent.name
+        if name in loaded or deck is not None and name != deck:
+            continue
+        key = (masks_version, *_csv_key(name))
+        masks = UserMasks.load(path, get_deck(name), user, key)
+        if masks is None:
+            path.unlink(missing_ok=True)
+        else:
+            yield masks
+
+
+def discard_words(user: str, words: Iterable[str]):
+    """ Mark words discarded in the loaded and saved masks of user. """
+    update_masks(user, discarded=words)
+
+
+def _filter_path(user: str, deck: Optional[str] = None) -> Path:
+    """ Return the file the filtered words of user for a deck are kept
+    in. """
+    return Path(prolix.data_path) / 'filters' / (deck or default_deck) \
+        / f'{user}.txt'
+
+
+def read_filter(user: str, deck: Optional[str] = None) -> List[str]:
+    """ Return the words user filtered out of a deck, if None the default
+    deck. """
+    try:
+        with _filter_path(user, deck).open(encoding='utf8') as fi:
+            return [x for x in fi.read().split('\n') if x]
+    except FileNotFoundError:
+        return []
+
+
+def set_filter(user: str, words: Iterable[str] = (),
+               deck: Optional[str] = None):
+    """
+    Filter words out of the quizzes and flash cards of user on a deck, if
+    None the default deck, replacing their filter. No words clears it.
+
+    The words are kept by word in filters/<deck>/<user>.txt in the data
+    directory, so the filter outlives changes to the deck's csv, and the
+    user's loaded and saved masks of the deck are updated.
+    """
+    deck = deck or default_deck
+    words = sorted({str(x) for x in words})
+    path = _filter_path(user, deck)
+    if words:
+        with atomic_write(path, 'w') as fi:
+            fi.write(''.join(f'{x}\n' for x in words))
+    else:
+        path.unlink(missing_ok=True)
+    for masks in _user_masks(user, deck):
+        masks.set_filter(words)
+        masks.save()
+
+
+def forget(user: str):
+    """ Drop the masks and filters of user, used when the user is
+    deleted. """
+    for deck in _loaded(user):
+        _MASKS.pop((user, deck))
+    for pattern in (f'masks/*/{user}.npz', f'filters/*/{user}.txt'):
+        for path in Path(prolix.data_path).glob(pattern):
+            path.unlink(missing_ok=True)
+
+
+def _reset():
+    """ Forget the masks so they are loaded from the new data path. """
+    _MASKS.clear()
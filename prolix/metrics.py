@@ -0,0 +1,383 @@
+"""
+Opt-in metrics for long running sessions and server deployments.
+
+Counters, gauges and histograms are declared by the modules which update
+them (questions served, word cache hits, database write latency, screen
+redraw time, server requests and so on) and registered here by name. Set
+the PROLIX_METRICS environment variable, or pass one of the --metrics
+options on the command line, to turn them on. They can be exported in the
+Prometheus text format to a file, which is rewritten every
+write_interval seconds and at exit, or served from a local endpoint, and
+dumped as json at exit:
+
+    PROLIX_METRICS_FILE=FILE   Prometheus text, eg for node_exporter's
+                               textfile collector
+    PROLIX_METRICS_PORT=PORT   serve GET /metrics on 127.0.0.1:PORT
+    PROLIX_METRICS_JSON=FILE   json at exit
+
+prolix serve turns metrics on and serves them at GET /metrics.
+
+When metrics are off updates return after checking a flag, and metrics
+read from a callback, like the writer's queue depth, cost nothing until
+they are exported. The phases timed by prolix.profiling, such as screen
+draws, database commits and compaction, are observed in the
+prolix_phase_seconds histogram, labelled by phase.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Sequence
+
+# the default upper bounds, in seconds, of histogram buckets
+default_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# seconds between rewrites of the metrics file
+write_interval = 15.0
+
+_enabled = False
+_registered = False
+_file_path = None
+_json_path = None
+_writer = None
+_server = None
+
+
+class Metric:
+    """
+    A named metric with a value for each combination of label values.
+
+    Parameters
+    ----------
+    name
+        The Prometheus name of the metric.
+    help
+        A description of the metric.
+    labels
+        The names of the labels values are kept apart by.
+    func
+        If given, called at export with no arguments to read the values,
+        a number, or a dict of label value tuples to numbers, instead of
+        them being updated.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 func: Optional[Callable] = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.func = func
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def clear(self):
+        """ Forget all values. """
+        with self._lock:
+            self._values = {}
+
+    def values(self) -> dict:
+        """ Return a dict of label value tuples to values. """
+        if self.func is None:
+            with self._lock:
+                return dict(self._values)
+        values = self.func()
+        return values if isinstance(values, dict) else {(): values}
+
+    def samples(self):
+        """ Yield the name, label value tuple and value of each sample. """
+        for labels, value in sorted(self.values().items()):
+            yield self.name, labels, value
+
+    def to_dict(self) -> dict:
+        """ Return the values as a json serializable dict. """
+        return {','.join(map(str, labels)): value
+                for labels, value in sorted(self.values().items())}
+
+
+class Counter(Metric):
+    """ A count which only goes up. """
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        """ Add amount to the count of labels. """
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """ A value which can go up and down. """
+    kind = 'gauge'
+
+    def set(self, value: float, labels: tuple = ()):
+        """ Set the value of labels. """
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        """ Add amount, which may be negative, to the value of labels. """
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Histogram(Metric):
+    """
+    Counts of observations, usually seconds, in buckets by upper bound,
+    with their count and sum.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = default_buckets):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: tuple = ()):
+        """ Add an observation of value for labels. """
+        if not _enabled:
+            return
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bucket] += 1
+            counts[-1] += value
+
+    def values(self) -> dict:
+        with self._lock:
+            return {x: list(y) for x, y in self._values.items()}
+
+    def samples(self):
+        for labels, counts in sorted(self.values().items()):
+            total = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                total += count
+                yield (self.name + '_bucket', labels + (_number(bound),),
+                       total)
+            yield self.name + '_count', labels, total
+            yield self.name + '_sum', labels, counts[-1]
+
+    def to_dict(self) -> dict:
+        out = {}
+        for labels, counts in sorted(self.values().items()):
+            count = sum(counts[:-1])
+            out[','.join(map(str, labels))] = dict(
+                count=count, sum=counts[-1],
+                mean=counts[-1] / (count or 1),
+                buckets=dict(zip(map(_number, (*self.buckets, math.inf)),
+                                 counts[:-1])),
+            )
+        return out
+
+
+# --- registry
+
+
+# metrics keyed by name
+registry: Dict[str, Metric] = {}
+
+
+def _register(cls, name: str, *args, **kwargs) -> Metric:
+    """ Return the metric called name, creating it if needed. """
+    metric = registry.get(name)
+    if metric is None:
+        metric = registry.setdefault(name, cls(name, *args, **kwargs))
+    if not isinstance(metric, cls):
+        raise ValueError(f'{name} is already registered as a {metric.kind}')
+    return metric
+
+
+def counter(name: str, help: str, labels: Sequence[str] = (),
+            func: Optional[Callable] = None) -> Counter:
+    """ Return the counter called name, creating it if needed. """
+    return _register(Counter, name, help, labels, func)
+
+
+def gauge(name: str, help: str, labels: Sequence[str] = (),
+          func: Optional[Callable] = None) -> Gauge:
+    """ Return the gauge called name, creating it if needed. """
+    return _register(Gauge, name, help, labels, func)
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (),
+              buckets: Sequence[float] = default_buckets) -> Histogram:
+    """ Return the histogram called name, creating it if needed. """
+    return _register(Histogram, name, help, labels, buckets)
+
+
+def is_enabled() -> bool:
+    """ Return True if metrics are on. """
+    return _enabled
+
+
+def reset():
+    """ Forget the values of every metric which is updated. """
+    for metric in registry.values():
+        metric.clear()
+
+
+# --- export
+
+
+def _number(value) -> str:
+    """ Format a number the way Prometheus expects. """
+    if value == math.inf:
+        return '+Inf'
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def to_prometheus() -> str:
+    """ Return every metric in the Prometheus text exposition format. """
+    lines = []
+    for name in sorted(registry):
+        metric = registry[name]
+        lines.append(f'# HELP {name} {_escape(metric.help)}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        names = metric.labels
+        if metric.kind == 'histogram':
+            names = names + ('le',)
+        for sample, labels, value in metric.samples():
+            text = ','.join(f'{x}="{_escape(y)}"' for x, y in
+                            zip(names, labels))
+            text = f'{{{text}}}' if text else ''
+            lines.append(f'{sample}{text} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def to_dict() -> dict:
+    """ Return every metric as a json serializable dict. """
+    return {name: dict(type=registry[name].kind, help=registry[name].help,
+                       labels=list(registry[name].labels),
+                       values=registry[name].to_dict())
+            for name in sorted(registry)}
+
+
+def write_prometheus(path):
+    """ Write the metrics in the Prometheus text format, replacing the
+    file atomically so scrapers never see part of it. """
+    from prolix.utils import atomic_write
+    with atomic_write(path, 'w') as fi:
+        fi.write(to_prometheus())
+
+
+def write_json(path):
+    """ Write the metrics as json. """
+    from prolix.utils import atomic_write
+    with atomic_write(path, 'w') as fi:
+        json.dump(to_dict(), fi, indent=1)
+
+
+def serve(port: int = 9464, host: str = '127.0.0.1'):
+    """
+    Serve the metrics at GET /metrics on a daemon thread, return the
+    server, whose server_address has the port if 0 was given.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = to_prometheus().encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever,
+                              name='prolix-metrics', daemon=True)
+    thread.start()
+    return server
+
+
+# the content type of the Prometheus text format
+content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _write_periodically(stop: threading.Event):
+    while not stop.wait(write_interval):
+        write_prometheus(_file_path)
+
+
+def enable(path=None, json_path=None, port: Optional[int] = None):
+    """
+    Turn on metrics.
+
+    Parameters
+    ----------
+    path
+        If given, write the metrics in the Prometheus text format to this
+        file every write_interval seconds and at exit.
+    json_path
+        If given, write the metrics as json to this file at exit.
+    port
+        If given, serve the metrics at GET /metrics on this local port.
+    """
+    global _enabled, _registered, _file_path, _json_path, _writer, _server
+    _enabled = True
+    if path is not None:
+        _file_path = str(path)
+        if _writer is None:
+            _writer = threading.Event()
+            threading.Thread(target=_write_periodically, args=(_writer,),
+                             name='prolix-metrics-file', daemon=True).start()
+    if json_path is not None:
+        _json_path = str(json_path)
+    if port is not None and _server is None:
+        _server = serve(port)
+    if not _registered:
+        atexit.register(_write_at_exit)
+        _registered = True
+
+
+def disable():
+    """ Turn off metrics, stop writing and serving them. The collected
+    values are kept. """
+    global _enabled, _writer, _server
+    _enabled = False
+    if _writer is not None:
+        _writer.set()
+        _writer = None
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+
+
+def _write_at_exit():
+    if _file_path:
+        write_prometheus(_file_path)
+    if _json_path:
+        write_json(_json_path)
+
+
+if any(os.environ.get(x) for x in ('PROLIX_METRICS', 'PROLIX_METRICS_FILE',
+                                   'PROLIX_METRICS_JSON',
+                                   'PROLIX_METRICS_PORT')):
+    enable(os.environ.get('PROLIX_METRICS_FILE') or None,
+           os.environ.get('PROLIX_METRICS_JSON') or None,
+           int(os.environ.get('PROLIX_METRICS_PORT') or 0) or None)
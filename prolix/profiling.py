@@ -0,0 +1,233 @@
+"""
+Opt-in timing of the hot paths of a session.
+
+Set the PROLIX_PROFILE environment variable, or pass --profile on the
+command line, to count and time the key phases of a run (loading the word
+snapshot, building questions, formatting definitions, building widgets,
+drawing the screen and writing to the database). A summary is written to
+stderr at exit. Set PROLIX_PROFILE_DUMP, or pass --profile-dump, to also
+run cProfile and write its stats to a file readable by pstats.
+
+The same phases feed the prolix_phase_seconds histogram of prolix.metrics,
+labelled by phase, when metrics are on. When both are off the timed
+functions only check two flags before calling through.
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Callable, Dict, Optional, TextIO
+
+from prolix import metrics
+
+# the number of histogram buckets, bucket n holds latencies under 2**n us
+bucket_count = 32
+
+# the phases timed by prolix, in the order they are reported
+phases = (
+    'snapshot_load',
+    'question_build',
+    'card_build',
+    'format_definition',
+    'widget_build',
+    'screen_draw',
+    'database_write',
+    'compaction',
+)
+
+_enabled = False
+_registered = False
+_profiler = None
+_dump_path = None
+_null = nullcontext()
+
+_phase_seconds = metrics.histogram(
+    'prolix_phase_seconds', 'seconds taken by each phase of a session',
+    labels=('phase',))
+
+
+class Timer:
+    """ A counter and latency histogram for one phase. """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """ Forget all measurements. """
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * bucket_count
+
+    def record(self, seconds: float):
+        """ Add one measurement of seconds to the timer. """
+        bucket = min(int(seconds * 1e6).bit_length(), bucket_count - 1)
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.buckets[bucket] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Return the upper bound, in seconds, of the bucket holding the given
+        fraction of measurements.
+        """
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min((2 ** bucket) / 1e6, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """ Return a dict of the count and latencies, in seconds. """
+        return dict(
+            count=self.count,
+            total=self.total,
+            mean=self.total / (self.count or 1),
+            p50=self.percentile(0.5),
+            p99=self.percentile(0.99),
+            max=self.max,
+        )
+
+
+# timers keyed by phase name
+timers: Dict[str, Timer] = {}
+
+
+def get_timer(name: str) -> Timer:
+    """ Return the timer for name, creating it if needed. """
+    timer = timers.get(name)
+    if timer is None:
+        timer = timers.setdefault(name, Timer(name))
+    return timer
+
+
+def is_enabled() -> bool:
+    """ Return True if profiling is on. """
+    return _enabled
+
+
+def is_timing() -> bool:
+    """ Return True if phases are timed, for profiling or for metrics. """
+    return _enabled or metrics.is_enabled()
+
+
+def _record(timer: Timer, seconds: float):
+    """ Record seconds spent in the phase of timer for whichever of
+    profiling and metrics is on. """
+    if _enabled:
+        timer.record(seconds)
+    _phase_seconds.observe(seconds, (timer.name,))
+
+
+def enable(dump_path=None):
+    """
+    Turn on timing, and cProfile if dump_path is given.
+
+    The summary, and the cProfile stats, are written at exit.
+    """
+    global _enabled, _registered, _profiler, _dump_path
+    _enabled = True
+    if dump_path is not None and _profiler is None:
+        import cProfile
+        _dump_path = str(dump_path)
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if not _registered:
+        atexit.register(_write_at_exit)
+        _registered = True
+
+
+def disable():
+    """ Turn off timing and cProfile, the collected timings are kept. """
+    global _enabled, _profiler
+    _enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(_dump_path)
+        _profiler = None
+
+
+def reset():
+    """ Forget all collected timings. """
+    for timer in timers.values():
+        timer.clear()
+
+
+def timed(name: str) -> Callable:
+    """ Decorator to time each call of a function as the phase name. """
+
+    def _decorator(func):
+        timer = get_timer(name)
+
+        @wraps(func)
+        def _wrap(*args, **kwargs):
+            if not is_timing():
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(timer, time.perf_counter() - start)
+
+        return _wrap
+
+    return _decorator
+
+
+def phase(name: str):
+    """ Return a context manager timing its block as the phase name. """
+    if not is_timing():
+        return _null
+    return _timed_block(get_timer(name))
+
+
+@contextmanager
+def _timed_block(timer: Timer):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(timer, time.perf_counter() - start)
+
+
+def summary() -> Dict[str, dict]:
+    """ Return a dict of phase name to its count and latencies. """
+    order = {name: num for num, name in enumerate(phases)}
+    names = sorted(timers, key=lambda x: (order.get(x, len(order)), x))
+    return {name: timers[name].summary() for name in names
+            if timers[name].count}
+
+
+def write_summary(stream: Optional[TextIO] = None):
+    """ Write a table of phase timings, in milliseconds, to stream. """
+    stream = stream or sys.stderr
+    stats = summary()
+    if not stats:
+        return
+    header = ('phase', 'count', 'total', 'mean', 'p50', 'p99', 'max')
+    lines = ['{:<18}{:>8}{:>11}{:>9}{:>9}{:>9}{:>9}'.format(*header)]
+    for name, stat in stats.items():
+        ms = [stat[x] * 1e3 for x in header[2:]]
+        lines.append('{:<18}{:>8}{:>11.2f}{:>9.3f}{:>9.3f}{:>9.3f}{:>9.3f}'
+                     .format(name, stat['count'], *ms))
+    stream.write('prolix profile (ms)\n' + '\n'.join(lines) + '\n')
+    if _dump_path:
+        stream.write(f'cProfile stats written to {_dump_path}\n')
+
+
+def _write_at_exit():
+    disable()
+    write_summary()
+
+
+if os.environ.get('PROLIX_PROFILE') or os.environ.get('PROLIX_PROFILE_DUMP'):
+    enable(os.environ.get('PROLIX_PROFILE_DUMP') or None)
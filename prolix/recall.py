@@ -0,0 +1,205 @@
+"""
+Grading typed answers with typo tolerance.
+
+A typed answer is graded exact, close (within a small edit distance of
+the word) or wrong. Near misses against the rest of the vocabulary, for
+"did you mean" hints, are found with a BK-tree: a tree over the words in
+which each child is keyed by its edit distance to its parent, so by the
+triangle inequality a search within distance k of a query only visits
+children keyed within k of the parent's distance to the query. A tree is
+kept per deck, so suggestions come from the deck the word was asked from.
+"""
+from typing import List, Optional, Tuple
+
+import prolix
+from prolix.cache import LoadingCache
+from prolix.store import default_deck
+
+# grades of a typed answer
+EXACT, CLOSE, WRONG = 'exact', 'close', 'wrong'
+
+# deck name to (word store, tree)
+_TREES = LoadingCache()
+
+
+def _pattern(word: str) -> Tuple[dict, int]:
+    """
+    Return the bit masks of each character's positions in word, and its
+    length, for _distance.
+    """
+    masks = {}
+    for ind, char in enumerate(word):
+        masks[char] = masks.get(char, 0) | (1 << ind)
+    return masks, len(word)
+
+
+def _distance(pattern: Tuple[dict, int], other: str) -> int:
+    """
+    Return the edit distance between a word, prepared by _pattern, and other.
+
+    Uses Myers' bit-parallel algorithm, as formulated by Hyyrö, which
+    updates a whole column of the dynamic programming matrix with a few
+    integer operations per character of other.
+    """
+    masks, length = pattern
+    if not length:
+        return len(other)
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    plus, minus, score = full, 0, length
+    for char in other:
+        eq = masks.get(char, 0)
+        xv = eq | minus
+        xh = ((((eq & plus) + plus) & full) ^ plus) | eq
+        hplus = minus | (~(xh | plus) & full)
+        hminus = plus & xh
+        if hplus & last:
+            score += 1
+        elif hminus & last:
+            score -= 1
+        hplus = ((hplus << 1) | 1) & full
+        hminus = (hminus << 1) & full
+        plus = hminus | (~(xv | hplus) & full)
+        minus = hplus & xv
+    return score
+
+
+def levenshtein(first: str, second: str,
+                max_distance: Optional[int] = None) -> int:
+    """
+    Return the edit distance between two strings.
+
+    If max_distance is given, return max_distance + 1 if the distance is
+    larger, which is known without comparing when the lengths differ by
+    more than max_distance.
+    """
+    if first == second:
+        return 0
+    if max_distance is not None:
+        if abs(len(first) - len(second)) > max_distance:
+            return max_distance + 1
+        return min(_distance(_pattern(first), second), max_distance + 1)
+    return _distance(_pattern(first), second)
+
+
+def close_distance(word: str) -> int:
+    """ Return the largest edit distance graded close for word. """
+    if len(word) <= 3:
+        return 0
+    return 1 if len(word) <= 6 else 2
+
+
+def grade(answer: str, word: str) -> Tuple[str, int]:
+    """
+    Grade a typed answer for word.
+
+    Returns
+    -------
+    The grade, one of EXACT, CLOSE or WRONG, and the edit distance, capped
+    at one more than the close distance.
+    """
+    answer = answer.strip().lower()
+    word = str(word).lower()
+    if answer == word:
+        return EXACT, 0
+    limit = close_distance(word)
+    distance = levenshtein(answer, word, limit)
+    return (CLOSE if distance <= limit else WRONG), distance
+
+
+class BKTree:
+    """
+    A BK-tree over words for edit distance searches.
+
+    Nodes are held in flat lists, node 0 is the root and each node's
+    children are a dict of distance to child node number.
+    """
+
+    def __init__(self, words=()):
+        self.words: List[str] = []
+        self.children: List[dict] = []
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, word: str):
+        """ Add word to the tree, if it is not already in it. """
+        word = str(word)
+        if not self.words:
+            self.words.append(word)
+            self.children.append({})
+            return
+        pattern = _pattern(word)
+        node = 0
+        while True:
+            distance = _distance(pattern, self.words[node])
+            if distance == 0:
+                return
+            child = self.children[node].get(distance)
+            if child is None:
+                self.children[node][distance] = len(self.words)
+                self.words.append(word)
+                self.children.append({})
+                return
+            node = child
+
+    def search(self, word: str, max_distance: int = 2
+               ) -> List[Tuple[int, str]]:
+        """ Return (distance, word) for words within max_distance of word. """
+        if not self.words:
+            return []
+        pattern = _pattern(word)
+        words, children = self.words, self.children
+        out = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            distance = _distance(pattern, words[node])
+            if distance <= max_distance:
+                out.append((distance, words[node]))
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for key, child in children[node].items()
+                         if low <= key <= high)
+        return sorted(out)
+
+
+def get_tree(deck: Optional[str] = None) -> BKTree:
+    """
+    Return a BK-tree over the words of a deck, built on first use and
+    rebuilt if the deck's word store changes.
+
+    Parameters
+    ----------
+    deck
+        The name of the deck, if None the default deck.
+    """
+    deck = deck or default_deck
+    df = prolix.read_words(deck)
+    entry = _TREES.get_or_load(deck, lambda: (df, BKTree(df.index.values)),
+                               lambda entry: entry[0] is df)
+    return entry[1]
+
+
+def _reset():
+    """ Forget the trees so they are rebuilt from the new data path. """
+    _TREES.clear()
+
+
+def did_you_mean(answer: str, limit: int = 3,
+                 max_distance: Optional[int] = None, exclude=(),
+                 deck: Optional[str] = None) -> List[str]:
+    """
+    Return up to limit words of a deck closest to answer, nearest first.
+
+    If max_distance is None it is the close distance of the answer, so
+    short answers only match words they are nearly the same as. If deck is
+    None the words of the default deck are searched.
+    """
+    answer = answer.strip().lower()
+    if max_distance is None:
+        max_distance = close_distance(answer)
+    exclude = set(exclude)
+    found = get_tree(deck).search(answer, max_distance)
+    return [word for _, word in found if word not in exclude][:limit]
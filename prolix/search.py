@@ -0,0 +1,309 @@
+"""
+Indexed search over words and their definitions.
+
+Two indices are built from a snapshot of the word store: an inverted
+index from each token in the definitions to the words whose definitions
+contain it, and a trigram index from each three letter sequence of the
+headwords to the words containing it. Both are stored as sorted
+vocabularies with CSR style offsets into one postings array of word
+numbers, so lookups are a binary search and a slice, and are saved to
+words.index.npz next to the word csv to be reloaded until the csv
+changes.
+"""
+import re
+from array import array
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import prolix
+from prolix.store import _csv_key, get_word_csv_path
+from prolix.utils import atomic_write
+
+# bump when the index layout changes so old files are rebuilt
+index_version = 1
+
+_token_re = re.compile(r'[a-z]+')
+_term_re = re.compile(r'[a-z]+\*?')
+# the part of speech keys in the stringified definition dicts
+_pos_key_re = re.compile(r"'[A-Za-z ]+':")
+
+_INDEX = None
+
+
+def _tokens(definition: str) -> set:
+    """ Return the set of lower case tokens in a raw definition. """
+    return set(_token_re.findall(_pos_key_re.sub(' ', definition).lower()))
+
+
+def _trigrams(word: str) -> set:
+    """ Return the trigrams of word, padded to mark its start and end. """
+    padded = f'${word}$'
+    return {padded[i: i + 3] for i in range(len(padded) - 2)}
+
+
+def _inner_trigrams(text: str) -> set:
+    """ Return the trigrams of text without padding, for substrings. """
+    return {text[i: i + 3] for i in range(len(text) - 2)}
+
+
+def _build_postings(keys_per_word) -> Tuple[np.ndarray, ...]:
+    """
+    Return the sorted vocabulary, offsets and postings of an inverted index.
+
+    keys_per_word is an iterable with the set of keys of each word. Keys
+    are numbered as they are first seen so only one copy of each is held
+    while building.
+    """
+    numbers = {}
+    flat, counts = array('i'), array('q')
+    for keys in keys_per_word:
+        flat.extend([numbers.setdefault(x, len(numbers)) for x in keys])
+        counts.append(len(keys))
+    vocab = np.array(sorted(numbers), dtype=str)
+    # renumber the keys in sorted order
+    renumber = np.empty(len(vocab), dtype=np.int32)
+    renumber[[numbers[x] for x in vocab]] = np.arange(len(vocab))
+    key_ids = renumber[np.frombuffer(flat, dtype=np.int32)]
+    word_ids = np.repeat(np.arange(len(counts), dtype=np.int32),
+                         np.frombuffer(counts, dtype=np.int64))
+    # stable sort keeps the word numbers of each key in ascending order
+    postings = word_ids[np.argsort(key_ids, kind='stable')]
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(key_ids, minlength=len(vocab)), out=offsets[1:])
+    return vocab, offsets, postings
+
+
+class SearchIndex:
+    """
+    Token and trigram indices over a snapshot of the word store.
+
+    Parameters
+    ----------
+    words
+        The words, in word number order.
+    arrays
+        A dict of the index arrays, as made by build.
+    key
+        Identifies the word csv the index was built from.
+    """
+
+    def __init__(self, words: np.ndarray, arrays: dict, key=(0, 0)):
+        self.words = words
+        self.key = tuple(key)
+        self.token_vocab = arrays['token_vocab']
+        self.token_offsets = arrays['token_offsets']
+        self.token_postings = arrays['token_postings']
+        self.trigram_vocab = arrays['trigram_vocab']
+        self.trigram_offsets = arrays['trigram_offsets']
+        self.trigram_postings = arrays['trigram_postings']
+        self.trigram_counts = arrays['trigram_counts']
+
+    def __len__(self):
+        return len(self.words)
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, key=(0, 0)) -> 'SearchIndex':
+        """ Build the indices for a dataframe returned by read_words. """
+        words = np.array(df.index.values, dtype=str)
+        tokens = (_tokens(x) for x in df['definition'].values)
+        token_vocab, token_offsets, token_postings = _build_postings(tokens)
+        trigrams = (_trigrams(x) for x in words)
+        tri_vocab, tri_offsets, tri_postings = _build_postings(trigrams)
+        arrays = dict(
+            token_vocab=token_vocab,
+            token_offsets=token_offsets,
+            token_postings=token_postings,
+            trigram_vocab=tri_vocab,
+            trigram_offsets=tri_offsets,
+            trigram_postings=tri_postings,
+            trigram_counts=np.bincount(
+                tri_postings, minlength=len(words)).astype(np.int32),
+        )
+        return cls(words, arrays, key)
+
+    def save(self, path):
+        """ Save the index to an npz file at path. """
+        arrays = {name: getattr(self, name) for name in (
+            'words', 'token_vocab', 'token_offsets', 'token_postings',
+            'trigram_vocab', 'trigram_offsets', 'trigram_postings',
+            'trigram_counts',
+        )}
+        key = np.array([index_version, *self.key], dtype=np.int64)
+        with atomic_write(path) as fi:
+            np.savez(fi, key=key, **arrays)
+
+    @classmethod
+    def load(cls, path) -> Optional['SearchIndex']:
+        """ Load an index saved with save, None if it is an old version. """
+        with np.load(str(path), allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        version, *key = arrays.pop('key')
+        if version != index_version:
+            return None
+        return cls(arrays.pop('words'), arrays, key)
+
+    # --- lookups
+
+    def _postings(self, kind: str, key: str) -> np.ndarray:
+        """ Return the word numbers of key in the token or trigram index. """
+        vocab = getattr(self, f'{kind}_vocab')
+        offsets = getattr(self, f'{kind}_offsets')
+        ind = np.searchsorted(vocab, key)
+        if ind == len(vocab) or vocab[ind] != key:
+            return np.array([], dtype=np.int32)
+        postings = getattr(self, f'{kind}_postings')
+        return postings[offsets[ind]: offsets[ind + 1]]
+
+    def _prefix_postings(self, prefix: str) -> np.ndarray:
+        """ Return the word numbers of tokens starting with prefix. """
+        vocab = self.token_vocab
+        start = np.searchsorted(vocab, prefix)
+        stop = np.searchsorted(vocab, prefix + '\uffff')
+        postings = self.token_postings
+        out = postings[self.token_offsets[start]: self.token_offsets[stop]]
+        # the postings of a single token are already sorted and unique
+        return out if stop - start == 1 else np.unique(out)
+
+    def definition_matches(self, query: str) -> np.ndarray:
+        """
+        Return the word numbers whose definitions contain every term in
+        query. A term ending in * matches any token starting with it.
+        """
+        terms = _term_re.findall(query.lower())
+        if not terms:
+            return np.array([], dtype=np.int32)
+        out = None
+        for term in terms:
+            if term.endswith('*'):
+                found = self._prefix_postings(term[:-1])
+            else:
+                found = self._postings('token', term)
+            out = found if out is None else np.intersect1d(out, found, True)
+            if not len(out):
+                break
+        return out
+
+    def substring_matches(self, text: str) -> np.ndarray:
+        """ Return the word numbers of words containing text. """
+        text = text.lower()
+        trigrams = _inner_trigrams(text)
+        if trigrams:
+            candidates = None
+            for trigram in trigrams:
+                found = self._postings('trigram', trigram)
+                candidates = found if candidates is None else \
+                    np.intersect1d(candidates, found, True)
+                if not len(candidates):
+                    return candidates
+        else:  # too short for trigrams, check every word
+            candidates = np.arange(len(self.words))
+        keep = np.char.find(self.words[candidates], text) >= 0
+        return candidates[keep]
+
+    def fuzzy_scores(self, text: str, limit: int = 10
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the word numbers and scores of the words most like text.
+
+        The score is the Jaccard similarity of the padded trigram sets.
+        """
+        trigrams = _trigrams(text.lower())
+        found = [self._postings('trigram', x) for x in trigrams]
+        if not any(len(x) for x in found):
+            return np.array([], dtype=np.int32), np.array([])
+        shared = np.bincount(np.concatenate(found), minlength=len(self))
+        candidates = np.flatnonzero(shared)
+        shared = shared[candidates]
+        union = len(trigrams) + self.trigram_counts[candidates] - shared
+        scores = shared / union
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -scores))
+        return candidates[order], scores[order]
+
+
+def _index_path() -> Path:
+    """ Return the path the index of the current word csv is saved to. """
+    return get_word_csv_path().with_suffix('.index.npz')
+
+
+def get_index(rebuild: bool = False) -> SearchIndex:
+    """
+    Return the search index of the current words.
+
+    The index is loaded from disk if it was built from the current word
+    csv, else it is built and saved.
+    """
+    global _INDEX
+    key = _csv_key()
+    if not rebuild and _INDEX is not None and _INDEX.key == key:
+        return _INDEX
+    path = _index_path()
+    index = None
+    if not rebuild and path.exists():
+        index = SearchIndex.load(path)
+        if index is not None and index.key != key:
+            index = None
+    if index is None:
+        index = SearchIndex.build(prolix.read_words(), key)
+        if any(key):
+            index.save(path)
+    _INDEX = index
+    return index
+
+
+def _reset():
+    """ Forget the index so it is reloaded from the new data path. """
+    global _INDEX
+    _INDEX = None
+
+
+def _result_df(index: SearchIndex, inds, scores=None) -> pd.DataFrame:
+    words = index.words[inds]
+    df = prolix.read_words()
+    # the index was built from the same csv so word numbers are positions
+    assert len(df) == len(index), 'search index does not match the words'
+    definitions = df['definition'].values[inds]
+    out = pd.DataFrame({'definition': definitions},
+                       index=pd.Index(words, name='word'))
+    if scores is not None:
+        out.insert(0, 'score', np.round(scores, 3))
+    return out
+
+
+def search(query: str, limit: int = 10, definitions: bool = False,
+           fuzzy: bool = True) -> pd.DataFrame:
+    """
+    Search the words, or their definitions.
+
+    Parameters
+    ----------
+    query
+        For words, a word or part of a word. For definitions, terms which
+        must all appear in the definition, a term ending in * matches
+        tokens starting with it.
+    limit
+        The maximum number of results.
+    definitions
+        If True search the definitions rather than the words.
+    fuzzy
+        When searching words, if True rank words by trigram similarity to
+        the query, so misspellings still match, else return the words
+        containing the query.
+
+    Returns
+    -------
+    A dataframe indexed by word with a definition column, and a score
+    column for fuzzy searches.
+    """
+    index = get_index()
+    if definitions:
+        return _result_df(index, index.definition_matches(query)[:limit])
+    if not fuzzy:
+        return _result_df(index, index.substring_matches(query)[:limit])
+    inds, scores = index.fuzzy_scores(query, limit)
+    return _result_df(index, inds, scores)
@@ -0,0 +1,618 @@
+"""
+A local HTTP/JSON server so many learners can share one prolix process.
+
+The server runs on asyncio with a small HTTP/1.1 implementation from the
+standard library, so it needs no web framework. Every request is served
+from one shared array snapshot of the word store (see prolix.export), and
+answers are pooled in memory and handed to the database writer in
+batches, so hundreds of concurrent learners cost one snapshot and a few
+transactions a second.
+
+Endpoints, all of which return JSON:
+
+    GET  /health                   word count and server counters
+    POST /question {user, choices, on}
+                                   a multiple choice question with an id
+    POST /answer {id, choice}      grade a question, choice is an index or
+                                   letter, and record the answer
+    POST /card {user}              a random flash card the user has not
+                                   discarded
+    POST /discard {user, word}     discard a flash card
+    GET  /stats?user=NAME          the user's answer counts and ability
+    GET  /metrics                  prolix metrics in the Prometheus text
+                                   format, see prolix.metrics
+
+The load test client, run_load, drives a server with concurrent learners
+answering questions and reports the request rate and latency percentiles.
+"""
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import prolix
+from prolix import metrics
+from prolix.export import _get_snapshot, draw_question
+
+# the largest request body accepted, in bytes
+max_body = 64 * 1024
+# the most header lines accepted in a request
+max_headers = 100
+
+_user_re = re.compile(r'^[\w.-]{1,64}$')
+
+_requests = metrics.counter(
+    'prolix_server_requests_total', 'requests served by path and status',
+    labels=('path', 'status'),
+)
+_request_seconds = metrics.histogram(
+    'prolix_server_request_seconds', 'seconds taken to serve a request',
+    labels=('path',),
+)
+
+_reasons = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class HTTPError(Exception):
+    """ Raised by a handler to respond with an error status. """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _check_user(user) -> str:
+    """ Return user if it is a usable name, else raise a 400 error. """
+    if not isinstance(user, str) or not _user_re.match(user):
+        msg = 'user must be 1 to 64 letters, digits, "_", "-" or "."'
+        raise HTTPError(400, msg)
+    return user
+
+
+def _choice_index(choice, count: int) -> int:
+    """ Return the index of a choice given as an index or a letter. """
+    if isinstance(choice, str) and len(choice) == 1 and choice.isalpha():
+        choice = ord(choice.lower()) - ord('a')
+    if isinstance(choice, bool) or not isinstance(choice, int) \
+            or not 0 <= choice < count:
+        raise HTTPError(400, f'choice must be an index below {count} or '
+                             f'a letter')
+    return choice
+
+
+# --- http
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[tuple]:
+    """
+    Read one request from reader.
+
+    Returns
+    -------
+    None if the connection closed, else the method, path, query dict,
+    headers dict, body bytes and whether to keep the connection open.
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, 'malformed request line')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= max_headers:
+            raise HTTPError(400, 'too many headers')
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HTTPError(400, 'malformed content-length')
+    if length > max_body:
+        raise HTTPError(413, f'request bodies are limited to {max_body} bytes')
+    body = await reader.readexactly(length) if length else b''
+    url = urlsplit(target)
+    query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version == 'HTTP/1.1' \
+        else connection == 'keep-alive'
+    return method.upper(), url.path, query, headers, body, keep_alive
+
+
+def _response(status: int, payload, keep_alive: bool = True) -> bytes:
+    """ Return the bytes of a JSON response, or of a text response if
+    payload is a string. """
+    if isinstance(payload, str):
+        body, content_type = payload.encode('utf8'), metrics.content_type
+    else:
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        content_type = 'application/json'
+    head = (
+        f'HTTP/1.1 {status} {_reasons.get(status, "")}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+    )
+    return head.encode('latin-1') + body
+
+
+# --- answers
+
+
+class AnswerPool:
+    """
+    Collect answers and hand them to the database writer in batches.
+
+    Parameters
+    ----------
+    batch_size
+        Submit as soon as this many answers are waiting.
+    interval
+        The most seconds an answer waits before it is submitted.
+    """
+
+    def __init__(self, batch_size: int = 500, interval: float = 0.1):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = []
+        self.submitted = 0
+        self._task = None
+
+    def add(self, user: str, word: str, correct: bool):
+        """ Add an answer, submitting the pool if it is full. """
+        self.pending.append((user, word, correct))
+        if len(self.pending) >= self.batch_size:
+            self.submit()
+
+    def submit(self):
+        """ Hand the waiting answers to the database writer. """
+        if self.pending:
+            answers, self.pending = self.pending, []
+            prolix.user.get_writer().submit(prolix.user.add_answers, answers)
+            self.submitted += len(answers)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.submit()
+
+    def start(self):
+        """ Start submitting the pool every interval. """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """ Stop the periodic task and submit what is waiting. """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.submit()
+
+
+def _read_stats(user: str) -> dict:
+    """ Return a user's answer counts and ability, from the database. """
+    from peewee import fn
+    from prolix.user import UserRating, _USER_CACHE, _add_user_to_db
+    prolix.user.flush()
+    _add_user_to_db(user, set_current=False)
+    table = _USER_CACHE[user][1]
+    query = table.select(fn.SUM(table.right), fn.SUM(table.wrong))
+    right, wrong = query.tuples().get()
+    rating = UserRating.get_or_none(UserRating.user == user)
+    right, wrong = right or 0, wrong or 0
+    return dict(user=user, answered=right + wrong, right=right, wrong=wrong,
+                ability=rating.ability if rating else 0.0)
+
+
+def _read_discarded(user: str) -> set:
+    """ Return the words user discarded, from the database. """
+    from prolix.user import _USER_CACHE, _add_user_to_db
+    prolix.user.flush()
+    _add_user_to_db(user, set_current=False)
+    table = _USER_CACHE[user][0]
+    return {x for (x,) in table.select(table.word).tuples()}
+
+
+def _write_discards(user: str, words: list):
+    """ Add discarded words to the user's table and masks, run on the
+    database writer thread. """
+    prolix.user._add_discarded_words(user, words)
+    prolix.masks.discard_words(user, words)
+
+
+def _count_words(words: np.ndarray, found: set) -> int:
+    """ Return how many of the sorted array words are in found. """
+    if not len(words) or not found:
+        return 0
+    found = np.array(sorted(found), dtype=object)
+    rows = np.minimum(np.searchsorted(words, found), len(words) - 1)
+    return int(np.count_nonzero(words[rows] == found))
+
+
+# --- server
+
+
+class ProlixServer:
+    """
+    Serve questions, answers, cards and stats over HTTP.
+
+    Parameters
+    ----------
+    host, port
+        The address to listen on, a port of 0 picks a free port.
+    seed
+        Seeds the questions and cards drawn, if None they are random.
+    max_pending
+        The most questions waiting for an answer, after which the oldest
+        are forgotten.
+    batch_size, interval
+        When answers are written, see AnswerPool.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8080,
+                 seed: Optional[int] = None, max_pending: int = 100_000,
+                 batch_size: int = 500, interval: float = 0.1):
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.answers = AnswerPool(batch_size, interval)
+        self._rng = np.random.RandomState(seed)
+        self._questions = OrderedDict()
+        self._next_id = 0
+        self._discarded = {}
+        # database reads run one at a time off the event loop
+        self._executor = ThreadPoolExecutor(1, 'prolix-server-db')
+        self._server = None
+        self.requests = 0
+        self.errors = 0
+        self._routes = {
+            ('GET', '/health'): self.health,
+            ('POST', '/question'): self.question,
+            ('POST', '/answer'): self.answer,
+            ('POST', '/card'): self.card,
+            ('POST', '/discard'): self.discard,
+            ('GET', '/stats'): self.stats,
+            ('GET', '/metrics'): self.metrics,
+        }
+        self._paths = {x[1] for x in self._routes}
+
+    async def start(self):
+        """ Take the word snapshot and start listening. """
+        self.snapshot = _get_snapshot()
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, backlog=1024,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.answers.start()
+
+    async def serve_forever(self):
+        """ Start, if needed, and serve until cancelled. """
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """ Stop listening and write every pooled answer. """
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        await self.answers.stop()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, prolix.user.flush)
+
+    async def _handle(self, reader, writer):
+        """ Serve the requests of one connection. """
+        try:
+            while True:
+                keep_alive = False
+                path = None
+                try:
+                    request = await _read_request(reader)
+                    if request is None:
+                        break
+                    start = time.perf_counter()
+                    method, path, query, _, body, keep_alive = request
+                    status, payload = 200, await self._dispatch(
+                        method, path, query, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': e.message}
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:  # a bug, not the client's fault
+                    status, payload = 500, {'error': repr(e)}
+                self.requests += 1
+                self.errors += status != 200
+                if metrics.is_enabled():
+                    # unknown paths share a label to bound the series
+                    path = path if path in self._paths else 'other'
+                    _requests.inc(labels=(path, str(status)))
+                    if status == 200:
+                        _request_seconds.observe(
+                            time.perf_counter() - start, labels=(path,))
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, query, body):
+        handler = self._routes.get((method, path))
+        if handler is None:
+            if any(x[1] == path for x in self._routes):
+                raise HTTPError(405, f'{method} is not allowed on {path}')
+            raise HTTPError(404, f'{path} not found')
+        if method == 'GET':
+            return await handler(query)
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, 'the body must be JSON')
+        if not isinstance(data, dict):
+            raise HTTPError(400, 'the body must be a JSON object')
+        return await handler(data)
+
+    # --- handlers
+
+    async def health(self, query: dict) -> dict:
+        return dict(
+            words=len(self.snapshot),
+            requests=self.requests,
+            errors=self.errors,
+            pending_questions=len(self._questions),
+            answers_written=self.answers.submitted,
+        )
+
+    async def question(self, data: dict) -> dict:
+        user = _check_user(data.get('user'))
+        quiz_on = data.get('on', 'word')
+        if quiz_on not in {'word', 'definition'}:
+            raise HTTPError(400, 'on must be "word" or "definition"')
+        choices = data.get('choices', 4)
+        if not isinstance(choices, int) or not 2 <= choices <= 26:
+            raise HTTPError(400, 'choices must be between 2 and 26')
+        snap = self.snapshot
+        ind, inds = draw_question(self._rng, len(snap),
+                                  min(choices, len(snap)))
+        if quiz_on == 'word':
+            prompt = snap.words[ind]
+            options = [snap.definition(x) for x in inds]
+        else:
+            prompt = snap.definition(ind)
+            options = [str(x) for x in snap.words[inds]]
+        self._next_id += 1
+        qid = str(self._next_id)
+        answer = int(np.flatnonzero(inds == ind)[0])
+        self._questions[qid] = (user, str(snap.words[ind]), answer,
+                                len(options))
+        if len(self._questions) > self.max_pending:
+            self._questions.popitem(last=False)
+        return dict(id=qid, prompt=str(prompt), choices=options)
+
+    async def answer(self, data: dict) -> dict:
+        question = self._questions.pop(str(data.get('id')), None)
+        if question is None:
+            raise HTTPError(400, 'unknown or already answered question id')
+        user, word, answer, count = question
+        try:
+            choice = _choice_index(data.get('choice'), count)
+        except HTTPError:
+            self._questions[str(data.get('id'))] = question
+            raise
+        correct = choice == answer
+        self.answers.add(user, word, correct)
+        return dict(correct=correct, answer=answer, word=word)
+
+    async def _get_discarded(self, user: str) -> set:
+        discarded = self._discarded.get(user)
+        if discarded is None:
+            loop = asyncio.get_running_loop()
+            discarded = await loop.run_in_executor(
+                self._executor, _read_discarded, user)
+            discarded = self._discarded.setdefault(user, discarded)
+        return discarded
+
+    async def card(self, data: dict) -> dict:
+        user = _check_user(data.get('user'))
+        discarded = await self._get_discarded(user)
+        snap = self.snapshot
+        # discarded words can have been dropped from the words since, so
+        # only count the ones still in the snapshot
+        if len(discarded) >= len(snap) \
+                and _count_words(snap.words, discarded) >= len(snap):
+            raise HTTPError(404, 'every card has been discarded')
+        while True:  # redraw discarded words, which are few
+            ind = self._rng.randint(len(snap))
+            if snap.words[ind] not in discarded:
+                break
+        return dict(word=str(snap.words[ind]),
+                    definition=snap.definition(ind))
+
+    async def discard(self, data: dict) -> dict:
+        user = _check_user(data.get('user'))
+        word = data.get('word')
+        if not isinstance(word, str) or not word:
+            raise HTTPError(400, 'word must be given')
+        discarded = await self._get_discarded(user)
+        if word not in discarded:
+            discarded.add(word)
+            prolix.user.get_writer().submit(_write_discards, user, [word])
+        return dict(user=user, word=word, discarded=len(discarded))
+
+    async def stats(self, query: dict) -> dict:
+        user = _check_user(query.get('user'))
+        self.answers.submit()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _read_stats, user)
+
+    async def metrics(self, query: dict) -> str:
+        return metrics.to_prometheus()
+
+
+def serve(host: str = '127.0.0.1', port: int = 8080,
+          seed: Optional[int] = None, on_start=None):
+    """
+    Run a server until interrupted, with metrics turned on.
+
+    on_start, if given, is called with the server once it is listening.
+    """
+    metrics.enable()
+
+    async def _main():
+        server = ProlixServer(host, port, seed)
+        await server.start()
+        if on_start is not None:
+            on_start(server)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
+
+
+# --- load testing
+
+
+class _Client:
+    """ A keep-alive HTTP/JSON connection for the load test. """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader = self._writer = None
+
+    async def request(self, method: str, path: str, data=None):
+        """
+        Return the status and decoded body of a request, or a status of 0
+        and None if the connection failed or was closed by the server, in
+        which case the next request reconnects.
+        """
+        body = b'' if data is None else json.dumps(data).encode()
+        head = (f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n\r\n')
+        try:
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_connection(
+                    self.host, self.port)
+            self._writer.write(head.encode('latin-1') + body)
+            await self._writer.drain()
+            line = await self._reader.readline()
+            if not line:
+                raise ConnectionResetError('server closed the connection')
+            status = int(line.split()[1])
+            length = 0
+            while True:
+                line = await self._reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            return status, json.loads(await self._reader.readexactly(length))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            return 0, None
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+async def _learner(client: _Client, user: str, rng, deadline: float,
+                   budget: list, latencies: list, failures: list):
+    """ Answer questions until the deadline or the request budget runs out. """
+    while budget[0] > 0 and time.perf_counter() < deadline:
+        budget[0] -= 2
+        start = time.perf_counter()
+        status, question = await client.request(
+            'POST', '/question', {'user': user})
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            failures.append(status)
+            continue
+        choice = int(rng.randint(len(question['choices'])))
+        start = time.perf_counter()
+        status, _ = await client.request(
+            'POST', '/answer', {'id': question['id'], 'choice': choice})
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            failures.append(status)
+
+
+async def load_test(host: str = '127.0.0.1', port: int = 8080,
+                    learners: int = 100, requests: int = 10_000,
+                    duration: Optional[float] = None,
+                    user_prefix: str = 'load', seed: int = 0) -> dict:
+    """
+    Drive a server with concurrent learners answering questions.
+
+    Parameters
+    ----------
+    host, port
+        The server address.
+    learners
+        The number of concurrent learners, each with its own connection
+        and user, named user_prefix and a number.
+    requests
+        The total number of requests to make.
+    duration
+        If given, stop after this many seconds even if requests remain.
+    seed
+        Seeds the learners' choices.
+
+    Returns
+    -------
+    A dict of the requests made, failures, seconds taken, requests per
+    second and latency percentiles in seconds.
+    """
+    rng = np.random.RandomState(seed)
+    deadline = time.perf_counter() + (duration or float('inf'))
+    budget, latencies, failures = [requests], [], []
+    clients = [_Client(host, port) for _ in range(learners)]
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            _learner(client, f'{user_prefix}{num}', rng, deadline, budget,
+                     latencies, failures)
+            for num, client in enumerate(clients)
+        ))
+    finally:
+        for client in clients:
+            client.close()
+    seconds = time.perf_counter() - start
+    latency = np.array(latencies or [0.0])
+    p50, p90, p99 = np.percentile(latency, [50, 90, 99])
+    return dict(
+        requests=len(latencies), failures=len(failures), seconds=seconds,
+        rps=len(latencies) / seconds if seconds else 0.0,
+        p50=float(p50), p90=float(p90), p99=float(p99),
+        max=float(latency.max()),
+    )
+
+
+def run_load(host: str = '127.0.0.1', port: int = 8080, **kwargs) -> dict:
+    """ Run load_test in a new event loop, see load_test. """
+    return asyncio.run(load_test(host, port, **kwargs))
@@ -0,0 +1,174 @@
+"""
+Recording and replaying quiz and flash card sessions.
+
+A recording holds the seed and options a run was created with, and every
+input it handled with its offset from the start of the run. Because the
+seed fixes the questions and cards a run draws, feeding the inputs back
+through QuizRun.dispatch or CardRun.dispatch reproduces the session
+exactly, which makes recordings useful both as regression tests and,
+replayed at full speed from many processes, as a load generator.
+
+Recordings are compact JSON:
+
+    {"format": 1, "kind": "quiz", "seed": 12, "options": {...},
+     "inputs": [[0.84, "choice", 2], [1.9, "key", "q"], ...]}
+"""
+import json
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import prolix
+
+# the version of the recording format
+session_format = 1
+
+# the run class for each kind of session
+_kinds = {'quiz': 'QuizRun', 'cards': 'CardRun', 'recall': 'RecallRun'}
+
+
+class SessionRecorder:
+    """
+    Collect the inputs of a run and write them to a file.
+
+    Parameters
+    ----------
+    path
+        The file the recording is saved to.
+    kind
+        "quiz", "cards" or "recall".
+    seed
+        The seed of the run.
+    options
+        The keyword arguments, other than the seed, the run was created with.
+    """
+
+    def __init__(self, path, kind: str, seed: int, options: dict):
+        assert kind in _kinds, f'kind must be one of {set(_kinds)}'
+        self.path = Path(path)
+        self.kind = kind
+        self.seed = seed
+        self.options = options
+        self.inputs = []
+        self._start = time.perf_counter()
+
+    def add(self, kind: str, value):
+        """ Add an input with the time since the recording started. """
+        offset = round(time.perf_counter() - self._start, 3)
+        self.inputs.append([offset, kind, value])
+
+    def to_dict(self) -> dict:
+        """ Return the recording as a json serializable dict. """
+        return dict(format=session_format, kind=self.kind, seed=self.seed,
+                    options=self.options, inputs=self.inputs)
+
+    def save(self) -> Path:
+        """ Write the recording to its path and return the path. """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open('w') as fi:
+            json.dump(self.to_dict(), fi, separators=(',', ':'))
+        return self.path
+
+
+def load_session(path) -> dict:
+    """ Read a recording, raise ValueError if it is not one prolix can play. """
+    with Path(path).open() as fi:
+        session = json.load(fi)
+    if session.get('format') != session_format:
+        msg = f'{path} is not a version {session_format} prolix recording'
+        raise ValueError(msg)
+    if session.get('kind') not in _kinds:
+        raise ValueError(f'{path} has unknown session kind {session["kind"]}')
+    return session
+
+
+def _value(value):
+    """ Json turns mouse event tuples into lists, turn them back. """
+    return tuple(value) if isinstance(value, list) else value
+
+
+def replay(path, user: Optional[str] = None, headless: bool = False,
+           realtime: bool = False) -> dict:
+    """
+    Replay a recorded session.
+
+    Parameters
+    ----------
+    path
+        The recording file.
+    user
+        The user the answers are recorded for, if None the recorded user.
+    headless
+        If True don't build widgets. This is faster but only works for
+        sessions recorded headless, whose inputs are answers rather than
+        navigation keys. Otherwise widgets are built for each input and
+        drawn to a FakeLoop rather than the screen.
+    realtime
+        If True wait between inputs as long as the original session did,
+        else replay as fast as possible.
+
+    Returns
+    -------
+    A dict with the run, the number of inputs replayed and the seconds the
+    replay took.
+    """
+    session = load_session(path)
+    options = dict(session['options'])
+    if user is not None:
+        options['user'] = user
+    cls = getattr(prolix, _kinds[session['kind']])
+    start = time.perf_counter()
+    if headless:
+        run = cls(seed=session['seed'], headless=True, **options)
+    else:
+        run = cls(seed=session['seed'], **options)
+        run._debug = True
+    count = 0
+    for offset, kind, value in session['inputs']:
+        if run._has_exited:
+            break
+        if realtime:
+            time.sleep(max(0.0, offset - (time.perf_counter() - start)))
+        run.dispatch(kind, _value(value))
+        count += 1
+    prolix.user.flush()
+    duration = time.perf_counter() - start
+    return dict(run=run, inputs=count, seconds=duration)
+
+
+def _replay_worker(args) -> dict:
+    """ Replay one recording in a worker process. """
+    path, user, headless = args
+    out = replay(path, user=user, headless=headless)
+    out.pop('run')
+    return dict(out, path=str(path), user=user)
+
+
+def replay_many(paths: Sequence, processes: Optional[int] = None,
+                users: Optional[Sequence[str]] = None,
+                headless: bool = False) -> List[dict]:
+    """
+    Replay recordings in parallel processes, eg to generate load.
+
+    Parameters
+    ----------
+    paths
+        The recordings to replay, a path may be repeated.
+    processes
+        The number of worker processes, if None one per cpu.
+    users
+        The user each replay answers as, if None the recorded users.
+    headless
+        If True don't build widgets, see replay.
+
+    Returns
+    -------
+    A list with a dict for each replay, with the path, user, number of
+    inputs and seconds taken.
+    """
+    from multiprocessing import Pool
+    users = users if users is not None else [None] * len(paths)
+    assert len(users) == len(paths), 'need a user for each path'
+    jobs = [(str(path), user, headless) for path, user in zip(paths, users)]
+    with Pool(processes) as pool:
+        return pool.map(_replay_worker, jobs)
@@ -1,22 +1,88 @@
 """
 A module for storing words.
+
+Words are kept in named decks, each a csv of words and definitions. The
+default deck is words.csv in the data directory and other decks are
+decks/<name>.csv, so vocabularies such as GRE, SAT or domain specific
+lists can be kept apart and mixed when quizzing.
+
+Deck csvs are never written in place. A new csv is written to a temporary
+file and renamed over the old one, so a reader in any process opens
+either the old file or the new one, and writers, in this process or
+others, take an advisory lock on <csv>.lock so concurrent imports don't
+lose each other's words.
 """
-import time
+import os
+import threading
 import warnings
+from contextlib import contextmanager
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 import pandas as pd
 
-# a simple cache for the csv. Keys are "df" and "read_time". The latter is
-# just the system time when the file was read. Useful to caching.
-_word_cache = {}
+import prolix
+from prolix import metrics, profiling
+from prolix.cache import LoadingCache
+from prolix.utils import atomic_write
+
+try:  # advisory file locks are only available on unix
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# a cache of the deck csvs, keyed by deck name, of the dataframe and the
+# key of the file it was read from, so it is read again if the file is
+# replaced.
+_word_cache = LoadingCache()
+
+_read_words = metrics.counter(
+    'prolix_read_words_total',
+    'read_words calls by whether the cached words were still valid',
+    labels=('result',),
+    func=lambda: {('hit',): _word_cache.hits, ('miss',): _word_cache.loads},
+)
+
+# the store lock of each csv path, see store_lock
+_LOCKS = {}
+_LOCKS_LOCK = threading.Lock()
 
 # init pydictionaries main classs
 
-# paths to default csv store and default dataframe columns
-default_word_csv_path = Path(__file__).parent / 'data' / 'words.csv'
+# the columns of the word store
 word_columns = ['definition']
 
+# the name of the deck stored in words.csv
+default_deck = 'default'
+
+
+def get_word_csv_path(deck: Optional[str] = None) -> Path:
+    """
+    Return the path to the csv of a deck in the current data directory.
+
+    Parameters
+    ----------
+    deck
+        The name of the deck, if None the default deck.
+    """
+    if deck is None or deck == default_deck:
+        return Path(prolix.data_path) / 'words.csv'
+    if not deck or not deck.replace('_', '').replace('-', '').isalnum():
+        raise ValueError(f'{deck!r} is not a valid deck name')
+    return Path(prolix.data_path) / 'decks' / f'{deck}.csv'
+
+
+def list_decks() -> List[str]:
+    """ Return the names of the decks in the current data directory. """
+    path = Path(prolix.data_path) / 'decks'
+    names = sorted(x.stem for x in path.glob('*.csv'))
+    return [default_deck] + [x for x in names if x != default_deck]
+
+
+def _reset():
+    """ Clear the word cache so words are read from the new data path. """
+    _word_cache.clear()
+
 
 def _read_economist_words(path: Path):
     path = Path(path)
@@ -45,71 +111,132 @@ def _read_textlist(path: Path):
     return out
 
 
-def add_words(words) -> pd.DataFrame:
-    """ Read the words in the words.txt file, generate csv. """
+def add_words(words, deck: Optional[str] = None) -> pd.DataFrame:
+    """
+    Look up the definitions of words and add them to a deck's csv. The
+    deck's store lock is held throughout so importers run one at a time.
+    """
     # ensure words are in a sequence, not a single str
     from autocorrect import spell
 
     words = words if isinstance(words, str) else words
     out = []
-    existing_words = read_words()
-    pydict = None
-    for word in words:
-        corrected_word = spell(word)
-        if corrected_word in existing_words.index:
-            continue
-        # pydict is rather heavy, only import it when needed
-        from PyDictionary import PyDictionary
-        pydic = pydict or PyDictionary()
-
-        if word != corrected_word:
-            msg = f'{word} not valid, correcting to {corrected_word}'
-            warnings.warn(msg)
-        print(f'fetching definition for word: {word}')
-        out.append(dict(
-            word=corrected_word,
-            definition=pydic.meaning(corrected_word),
-        ))
-    if out:  # if there are any new words to add
-        df = pd.DataFrame(out).set_index('word').sort_index()
-        _commit_word_db(df)
-
-
-def read_words():
-    """ return a dataframe of words. """
-    # determine if cache is to be used
-    if _word_cache:
-        assert {'df', 'read_time'}.issubset(_word_cache)
-        last_modified = default_word_csv_path.stat().st_mtime
-        cache_time = _word_cache.get('read_time', 0)
-        # if file has been updated since last cache clear cache and return
-        if last_modified > cache_time:
-            _word_cache.clear()
-            return read_words()
-        else:
-            df = _word_cache['df']
-            assert not df.definition.isnull().any(), 'missing definitions'
-            return df
+    with store_lock(deck):
+        existing_words = read_words(deck)
+        pydict = None
+        for word in words:
+            corrected_word = spell(word)
+            if corrected_word in existing_words.index:
+                continue
+            # pydict is rather heavy, only import it when needed
+            from PyDictionary import PyDictionary
+            pydic = pydict or PyDictionary()
+
+            if word != corrected_word:
+                msg = f'{word} not valid, correcting to {corrected_word}'
+                warnings.warn(msg)
+            print(f'fetching definition for word: {word}')
+            out.append(dict(
+                word=corrected_word,
+                definition=pydic.meaning(corrected_word),
+            ))
+        if out:  # if there are any new words to add
+            df = pd.DataFrame(out).set_index('word').sort_index()
+            _commit_word_db(df, deck=deck)
+
+
+def _stat_key(stat: os.stat_result) -> Tuple[int, int, int]:
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _csv_key(deck: Optional[str] = None) -> Tuple[int, int, int]:
+    """
+    Return the modification time, size and inode of a deck csv, zeros if it
+    is missing. Every write replaces the file, so the key changes with it.
+    """
     try:
-        df = pd.read_csv(default_word_csv_path)
+        return _stat_key(get_word_csv_path(deck).stat())
     except FileNotFoundError:
-        df = pd.DataFrame(columns=word_columns)
-    else:
-        # remove unnamed columns
-        df = df.loc[:, ~df.columns.str.contains('^Unnamed')].set_index('word')
-        # remove words with no definitions
-        df = df[~df.definition.isnull()]
-    assert set(df.columns) == set(word_columns)
-    # add df to cache
-    _word_cache['df'] = df.sort_index()
-    _word_cache['read_time'] = time.time()
-    return read_words()
-
-
-def _commit_word_db(df, append=True):
-    """ Commit a dataframe back to word store. """
-    if append:
-        df_old = read_words()
-        df = pd.concat([df_old, df])
-    df = df[~df.index.duplicated(keep='first')]
-    df.to_csv(default_word_csv_path)
+        return (0, 0, 0)
+
+
+def _load_words(deck: Optional[str] = None) -> tuple:
+    """ Read a deck csv, return the dataframe and the key of the file it
+    was read from. """
+    with profiling.phase('snapshot_load'):
+        try:
+            with get_word_csv_path(deck).open('rb') as fi:
+                # the key of the open file, which a writer can replace but
+                # not change
+                key = _stat_key(os.fstat(fi.fileno()))
+                df = pd.read_csv(fi)
+        except FileNotFoundError:
+            df = pd.DataFrame(columns=word_columns)
+            key = (0, 0, 0)
+        else:
+            # remove unnamed columns
+            unnamed = df.columns.str.contains('^Unnamed')
+            df = df.loc[:, ~unnamed].set_index('word')
+            # remove words with no definitions
+            df = df[~df.definition.isnull()]
+        assert set(df.columns) == set(word_columns)
+        return df.sort_index(), key
+
+
+def read_words(deck: Optional[str] = None):
+    """
+    Return a dataframe of words.
+
+    Parameters
+    ----------
+    deck
+        The name of the deck, if None the default deck.
+    """
+    deck = deck or default_deck
+    # reuse the cached dataframe unless the file was replaced since
+    key = _csv_key(deck)
+    df, _ = _word_cache.get_or_load(
+        deck, lambda: _load_words(deck), lambda entry: entry[1] == key,
+    )
+    return df
+
+
+@contextmanager
+def store_lock(deck: Optional[str] = None):
+    """
+    Hold the lock on a deck's csv, which serializes writers across threads
+    and processes. The lock is reentrant within a thread. Readers don't
+    need it.
+    """
+    path = get_word_csv_path(deck)
+    with _LOCKS_LOCK:
+        state = _LOCKS.setdefault(str(path), [threading.RLock(), 0, None])
+    with state[0]:
+        if not state[1]:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            state[2] = open(str(path) + '.lock', 'a+b')
+            if fcntl is not None:
+                fcntl.flock(state[2].fileno(), fcntl.LOCK_EX)
+        state[1] += 1
+        try:
+            yield
+        finally:
+            state[1] -= 1
+            if not state[1]:
+                if fcntl is not None:
+                    fcntl.flock(state[2].fileno(), fcntl.LOCK_UN)
+                state[2].close()
+                state[2] = None
+
+
+def _commit_word_db(df, append=True, deck: Optional[str] = None):
+    """ Commit a dataframe back to a deck's word store. """
+    with store_lock(deck):
+        if append:
+            # read the csv as it is now, another writer may have replaced
+            # it since this process last read it
+            df_old = read_words(deck)
+            df = pd.concat([df_old, df])
+        df = df[~df.index.duplicated(keep='first')]
+        with atomic_write(get_word_csv_path(deck), 'w') as fi:
+            df.to_csv(fi)
@@ -0,0 +1,531 @@
+"""
+Mergeable stats sync between machines.
+
+Every database is a device with a random id. Each device's share of a
+user's right and wrong counts for a word is a grow-only counter, and the
+value a device shows is the sum of every device's share, so merging two
+copies is taking the larger share of each device and never overwrites
+counts from elsewhere. Discarded words are a grow-only set and event log
+segments, which are never modified once sealed, are shared by name.
+
+A device numbers its exports, and every counter, discard and segment it
+owns carries the number of the export in which it last changed. The
+highest number seen from each device is the device's version vector. A
+delta file holds the rows newer than what a peer reported in its last
+delta, or everything if the peer is unknown, so a sync moves only what
+changed since, and importing a delta costs time proportional to its
+size. Deltas are idempotent: importing one twice, or out of order,
+leaves the same result.
+
+Counts are folded into the local quiz tables as they are merged. The
+local device's share is whatever the quiz tables hold beyond the other
+devices' shares, found when a delta is exported, so answers made in any
+way are synced. Writes to the quiz and discarded tables note the words
+they changed, and an export reads only those, so its cost follows what
+changed rather than the size of the database. Shares never shrink, so
+deleting a user locally doesn't delete their counts on other devices.
+"""
+import json
+import uuid
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+import peewee
+
+import prolix
+from prolix import events, user
+from prolix.utils import atomic_write
+
+# bump when the delta layout changes, deltas of other versions are refused
+sync_version = 1
+
+# parameters bound in a single IN query
+_chunk_size = 500
+
+
+# --- tables
+
+
+class _SyncModel(peewee.Model):
+    """ Base class of the sync tables. """
+    Meta = user.Meta
+
+
+class SyncDevice(_SyncModel):
+    """ The highest export number seen from each device. """
+    device = peewee.CharField(unique=True)
+    seq = peewee.IntegerField(default=0)
+    local = peewee.BooleanField(default=False)
+
+
+class SyncCounter(_SyncModel):
+    """ Each device's share of the right and wrong counts of a word. """
+    user = peewee.CharField()
+    word = peewee.CharField()
+    device = peewee.CharField()
+    right = peewee.IntegerField(default=0)
+    wrong = peewee.IntegerField(default=0)
+    seq = peewee.IntegerField()
+
+    class Meta:
+        indexes = ((('user', 'word', 'device'), True),
+                   (('device', 'seq'), False))
+
+
+class SyncDiscard(_SyncModel):
+    """ Discarded words and the device which first discarded them. """
+    user = peewee.CharField()
+    word = peewee.CharField()
+    device = peewee.CharField()
+    seq = peewee.IntegerField()
+
+    class Meta:
+        indexes = ((('user', 'word'), True), (('device', 'seq'), False))
+
+
+class SyncSegment(_SyncModel):
+    """ Event log segments and the device which wrote them. """
+    name = peewee.CharField(unique=True)
+    device = peewee.CharField()
+    seq = peewee.IntegerField()
+
+    class Meta:
+        indexes = ((('device', 'seq'), False),)
+
+
+class SyncPeer(_SyncModel):
+    """ The version vector each peer reported in its last delta. """
+    peer = peewee.CharField()
+    device = peewee.CharField()
+    seq = peewee.IntegerField(default=0)
+
+    class Meta:
+        indexes = ((('peer', 'device'), True),)
+
+
+_tables = (SyncDevice, SyncCounter, SyncDiscard, SyncSegment, SyncPeer)
+
+
+def _create_tables():
+    """ Create the sync tables if they do not exist. """
+    for table in _tables:
+        user._create_table(table)
+
+
+def _name(table) -> str:
+    """ Return the quoted name of a sync table. """
+    return user._quote(table._meta.table_name)
+
+
+# --- version vectors
+
+
+def device_id() -> str:
+    """ Return the id of this database, creating one on first use. """
+    _create_tables()
+    row = SyncDevice.get_or_none(SyncDevice.local == True)  # noqa: E712
+    if row is None:
+        row = SyncDevice.create(device=uuid.uuid4().hex, local=True)
+    return row.device
+
+
+def version_vector() -> dict:
+    """ Return the highest export number seen from each device. """
+    _create_tables()
+    return {x.device: x.seq for x in SyncDevice.select()}
+
+
+def _peer_vector(peer: Optional[str]) -> dict:
+    """ Return the version vector peer last reported, empty if unknown. """
+    if peer is None:
+        return {}
+    query = SyncPeer.select().where(SyncPeer.peer == peer)
+    return {x.device: x.seq for x in query}
+
+
+def _merge_vectors(peer: str, vector: dict, local: str):
+    """ Raise the seen export numbers, and those peer reported, to the ones
+    in the vector of its delta. """
+    user._executemany(
+        f'INSERT INTO {_name(SyncDevice)} ("device", "seq", "local") '
+        f'VALUES (?, ?, 0) ON CONFLICT ("device") DO UPDATE SET '
+        f'"seq" = max("seq", excluded."seq")',
+        [(x, int(seq)) for x, seq in vector.items() if x != local],
+    )
+    user._executemany(
+        f'INSERT INTO {_name(SyncPeer)} ("peer", "device", "seq") '
+        f'VALUES (?, ?, ?) ON CONFLICT ("peer", "device") DO UPDATE SET '
+        f'"seq" = max("seq", excluded."seq")',
+        [(peer, x, int(seq)) for x, seq in vector.items()],
+    )
+
+
+# --- local changes
+
+
+def _read_all_discards() -> pd.DataFrame:
+    """ Return the discarded words of every user. """
+    rows = []
+    for name in user._get_user_names():
+        user._add_user_to_db(name, set_current=False)
+        table = user._USER_CACHE[name][0]
+        rows += [(name, x) for (x,) in table.select(table.word).tuples()]
+    return pd.DataFrame(rows, columns=['user', 'word'])
+
+
+_share_columns = ['user', 'word', 'device', 'right', 'wrong']
+
+
+def _read_all() -> tuple:
+    """
+    Return the quiz rows and discards of every user, every device's
+    shares and the claimed discards, for a device's first export.
+    """
+    shares = pd.DataFrame(
+        list(SyncCounter.select(SyncCounter.user, SyncCounter.word,
+                                SyncCounter.device, SyncCounter.right,
+                                SyncCounter.wrong).tuples()),
+        columns=_share_columns)
+    claimed = set(SyncDiscard.select(SyncDiscard.user,
+                                     SyncDiscard.word).tuples())
+    return user._read_all_quiz_rows(), _read_all_discards(), shares, claimed
+
+
+def _read_changed() -> tuple:
+    """
+    Return the quiz rows, discards, shares and claimed discards of the
+    words which changed since the last export, see user.ChangedWords.
+    """
+    changed = user.ChangedWords
+    query = changed.select(changed.user, changed.word).tuples()
+    by_user = {}
+    for name, word in query:
+        by_user.setdefault(name, []).append(word)
+    names = set(user._get_user_names())
+    quiz, discards, shares, claimed = [], [], [], set()
+    for name, words in by_user.items():
+        if name not in names:  # deleted since, their shares are kept
+            continue
+        user._add_user_to_db(name, set_current=False)
+        discarded, table = user._USER_CACHE[name]
+        for start in range(0, len(words), _chunk_size):
+            chunk = words[start: start + _chunk_size]
+            quiz += [(name, *x) for x in table.select(
+                table.word, table.right, table.wrong,
+            ).where(table.word.in_(chunk)).tuples()]
+            discards += [(name, x) for (x,) in discarded.select(
+                discarded.word).where(discarded.word.in_(chunk)).tuples()]
+            shares += list(SyncCounter.select(
+                SyncCounter.user, SyncCounter.word, SyncCounter.device,
+                SyncCounter.right, SyncCounter.wrong,
+            ).where(SyncCounter.user == name,
+                    SyncCounter.word.in_(chunk)).tuples())
+            claimed.update((name, x) for x in _known(
+                SyncDiscard, 'word', chunk, user=name))
+    return (pd.DataFrame(quiz, columns=['user', 'word', 'right', 'wrong']),
+            pd.DataFrame(discards, columns=['user', 'word']),
+            pd.DataFrame(shares, columns=_share_columns), claimed)
+
+
+def _record_local(device: str, seq: int, full: bool = False) -> bool:
+    """
+    Give the local device's changes since the last export the number seq.
+    Only the words noted in user.ChangedWords are read, unless full, when
+    every user's tables are. Return True if anything changed.
+    """
+    quiz, discarded, shares, claimed = _read_all() if full \
+        else _read_changed()
+    # the local share is what the quiz tables hold beyond other devices'
+    totals = quiz.astype({'right': 'int64', 'wrong': 'int64'})
+    totals = totals.groupby(['user', 'word'])[['right', 'wrong']].sum()
+    is_local = shares['device'] == device
+    local = shares[is_local].set_index(['user', 'word'])[['right', 'wrong']]
+    remote = shares[~is_local].groupby(['user', 'word'])[['right', 'wrong']]
+    share = totals.sub(remote.sum(), fill_value=0).clip(lower=0)
+    share = share.astype('int64')
+    old = local.reindex(share.index, fill_value=0).astype('int64')
+    grown = (share['right'] > old['right']) | (share['wrong'] > old['wrong'])
+    share = np.maximum(share[grown], old[grown])
+    user._executemany(
+        f'INSERT INTO {_name(SyncCounter)} ("user", "word", "device", '
+        f'"right", "wrong", "seq") VALUES (?, ?, ?, ?, ?, ?) '
+        f'ON CONFLICT ("user", "word", "device") DO UPDATE SET '
+        f'"right" = excluded."right", "wrong" = excluded."wrong", '
+        f'"seq" = excluded."seq"',
+        [(name, word, device, int(right), int(wrong), seq)
+         for (name, word), right, wrong in share.itertuples()],
+    )
+    # discards no device has claimed yet are the local device's
+    discards = [(name, word, device, seq) for name, word in
+                discarded.itertuples(index=False)
+                if (name, word) not in claimed]
+    user._executemany(
+        f'INSERT INTO {_name(SyncDiscard)} ("user", "word", "device", "seq") '
+        f'VALUES (?, ?, ?, ?)', discards)
+    # and so are compacted segments which did not come from another device,
+    # once they have been moved to the compacted directory
+    compacted = user.CompactedSegments
+    query = compacted.select(compacted.name).where(
+        compacted.name.not_in(SyncSegment.select(SyncSegment.name)))
+    history = events.compacted_path()
+    segments = [(x, device, seq) for (x,) in query.tuples()
+                if (history / x).exists()]
+    user._executemany(
+        f'INSERT INTO {_name(SyncSegment)} ("name", "device", "seq") '
+        f'VALUES (?, ?, ?)', segments)
+    user.ChangedWords.delete().execute()
+    return bool(len(share) or discards or segments)
+
+
+# --- export
+
+
+def _newer(table, since: dict, devices) -> list:
+    """ Return the rows of table newer than the export numbers in since,
+    device by device. """
+    rows = []
+    for device in devices:
+        query = table.select().where((table.device == device)
+                                     & (table.seq > since.get(device, 0)))
+        rows += list(query.dicts())
+    return rows
+
+
+def _codes(values, labels: dict) -> np.ndarray:
+    """ Return the index of each value in labels, adding new values. """
+    return np.array([labels.setdefault(x, len(labels)) for x in values],
+                    dtype=np.int32)
+
+
+def export_delta(path, peer: Optional[str] = None) -> dict:
+    """
+    Write the changes a peer hasn't seen to a delta file.
+
+    The event log is compacted first so every answer is in the counts.
+
+    Parameters
+    ----------
+    path
+        The delta file to write.
+    peer
+        The device id of the peer the delta is for. Only changes newer than
+        the version vector of the peer's last imported delta are written.
+        If None, or the peer is unknown, the whole state is written.
+
+    Returns
+    -------
+    The number of counters, discards and segments written.
+    """
+    user.compact_events()
+    user.flush()
+    device = device_id()
+    # take the write lock first, so no change is noted between reading and
+    # clearing the changed words
+    with user.database.atomic('IMMEDIATE'):
+        seq = version_vector()[device] + 1
+        # words changed before the first export were not all noted
+        if _record_local(device, seq, full=seq == 1):
+            SyncDevice.update(seq=seq).where(
+                SyncDevice.device == device).execute()
+        vector = version_vector()
+        since = _peer_vector(peer)
+        counters = pd.DataFrame(
+            _newer(SyncCounter, since, vector),
+            columns=['user', 'word', 'device', 'right', 'wrong', 'seq'])
+        discards = pd.DataFrame(_newer(SyncDiscard, since, vector),
+                                columns=['user', 'word', 'device', 'seq'])
+        segments = pd.DataFrame(_newer(SyncSegment, since, vector),
+                                columns=['name', 'device', 'seq'])
+    # users, words and devices are stored once and referred to by index
+    devices = {x: num for num, x in enumerate(vector)}
+    users, words = {}, {}
+    history = events.compacted_path()
+    data = [np.fromfile(str(history / x), dtype=np.uint8)
+            for x in segments['name']]
+    arrays = dict(
+        counter_device=_codes(counters['device'], devices),
+        counter_user=_codes(counters['user'], users),
+        counter_word=_codes(counters['word'], words),
+        counter_right=counters['right'].to_numpy(dtype=np.int64),
+        counter_wrong=counters['wrong'].to_numpy(dtype=np.int64),
+        counter_seq=counters['seq'].to_numpy(dtype=np.int64),
+        discard_device=_codes(discards['device'], devices),
+        discard_user=_codes(discards['user'], users),
+        discard_word=_codes(discards['word'], words),
+        discard_seq=discards['seq'].to_numpy(dtype=np.int64),
+        segment_name=np.array(list(segments['name']), dtype=str),
+        segment_device=_codes(segments['device'], devices),
+        segment_seq=segments['seq'].to_numpy(dtype=np.int64),
+        segment_size=np.array([len(x) for x in data], dtype=np.int64),
+        segment_data=np.concatenate([np.zeros(0, dtype=np.uint8), *data]),
+        devices=np.array(list(devices), dtype=str),
+        users=np.array(list(users), dtype=str),
+        words=np.array(list(words), dtype=str),
+    )
+    meta = dict(version=sync_version, device=device, vector=vector)
+    encoded = np.frombuffer(json.dumps(meta).encode('utf8'), dtype=np.uint8)
+    with atomic_write(path) as fi:
+        np.savez_compressed(fi, meta=encoded, **arrays)
+    return dict(counters=len(counters), discards=len(discards),
+                segments=len(segments))
+
+
+# --- import
+
+
+def _read_delta(path) -> tuple:
+    """ Return the meta data and arrays of a delta file. """
+    with np.load(str(path), allow_pickle=False) as data:
+        arrays = {x: data[x] for x in data.files}
+    meta = json.loads(arrays.pop('meta').tobytes().decode('utf8'))
+    if meta.get('version') != sync_version:
+        msg = (f'{path} is a version {meta.get("version")} delta, expected '
+               f'version {sync_version}')
+        raise ValueError(msg)
+    return meta, arrays
+
+
+def _known(table, column, values: list, **where) -> set:
+    """ Return the values of column which have rows in table. """
+    out = set()
+    field = getattr(table, column)
+    for start in range(0, len(values), _chunk_size):
+        query = table.select(field).where(
+            field.in_(values[start: start + _chunk_size]),
+            *[getattr(table, x) == y for x, y in where.items()])
+        out.update(x for (x,) in query.tuples())
+    return out
+
+
+def _merge_counters(counters: pd.DataFrame) -> Dict[str, list]:
+    """
+    Merge counter rows, taking the larger share of each device, and add
+    what grew to the quiz tables and ratings. Return a dict of the users
+    whose counts changed to the (word, right, wrong) counts they grew by.
+    """
+    changed, answers = {}, []
+    for (name, device), rows in counters.groupby(['user', 'device']):
+        rows = rows.set_index('word')
+        old = []
+        for start in range(0, len(rows), _chunk_size):
+            query = SyncCounter.select(
+                SyncCounter.word, SyncCounter.right, SyncCounter.wrong,
+            ).where(SyncCounter.user == name, SyncCounter.device == device,
+                    SyncCounter.word.in_(
+                        list(rows.index[start: start + _chunk_size])))
+            old += list(query.tuples())
+        old = pd.DataFrame(old, columns=['word', 'right', 'wrong'])
+        old = old.set_index('word').reindex(rows.index, fill_value=0)
+        grown = (rows[['right', 'wrong']] - old).clip(lower=0)
+        grown = grown[(grown['right'] > 0) | (grown['wrong'] > 0)]
+        if grown.empty:
+            continue
+        user._executemany(
+            f'INSERT INTO {_name(SyncCounter)} ("user", "word", "device", '
+            f'"right", "wrong", "seq") VALUES (?, ?, ?, ?, ?, ?) '
+            f'ON CONFLICT ("user", "word", "device") DO UPDATE SET '
+            f'"right" = max("right", excluded."right"), '
+            f'"wrong" = max("wrong", excluded."wrong"), '
+            f'"seq" = max("seq", excluded."seq")',
+            [(name, word, device, int(right), int(wrong), int(seq))
+             for word, right, wrong, seq in
+             rows.loc[grown.index, ['right', 'wrong', 'seq']].itertuples()],
+        )
+        user._add_word_counts(name, grown)
+        changed.setdefault(name, []).extend(grown.itertuples(name=None))
+        for word, right, wrong in grown.itertuples():
+            answers += [(name, word, True)] * int(right)
+            answers += [(name, word, False)] * int(wrong)
+    user.update_ratings(answers)
+    return changed
+
+
+def _merge_discards(discards: pd.DataFrame) -> Dict[str, list]:
+    """ Add discards not seen before, return a dict of the users who
+    discarded to their new discarded words. """
+    changed = {}
+    for name, rows in discards.groupby('user'):
+        rows = rows[~rows['word'].isin(
+            _known(SyncDiscard, 'word', list(rows['word']), user=name))]
+        if rows.empty:
+            continue
+        user._executemany(
+            f'INSERT INTO {_name(SyncDiscard)} ("user", "word", "device", '
+            f'"seq") VALUES (?, ?, ?, ?)',
+            [(name, word, device, int(seq)) for word, device, seq in
+             rows[['word', 'device', 'seq']].itertuples(index=False)],
+        )
+        user._add_discarded_words(name, list(rows['word']))
+        changed[name] = list(rows['word'])
+    return changed
+
+
+def _merge_segments(arrays: dict) -> int:
+    """ Save segments not seen before to the compacted event history, the
+    answers in them already arrived as counters. Return how many. """
+    names = [str(x) for x in arrays['segment_name']]
+    known = _known(SyncSegment, 'name', names)
+    history = events.compacted_path()
+    ends = np.cumsum(arrays['segment_size'])
+    new = []
+    for num, name in enumerate(names):
+        if name in known:
+            continue
+        data = arrays['segment_data'][ends[num] - arrays['segment_size'][num]:
+                                      ends[num]]
+        history.mkdir(parents=True, exist_ok=True)
+        with atomic_write(history / name) as fi:
+            fi.write(data.tobytes())
+        device = arrays['devices'][arrays['segment_device'][num]]
+        new.append((name, str(device), int(arrays['segment_seq'][num])))
+    user._executemany(
+        f'INSERT INTO {_name(SyncSegment)} ("name", "device", "seq") '
+        f'VALUES (?, ?, ?)', new)
+    return len(new)
+
+
+def import_delta(path) -> dict:
+    """
+    Merge a delta file written by export_delta on another device.
+
+    Counters take the larger share of each device and what grew is added
+    to the quiz tables and ratings, discards are added and event segments
+    are saved to the compacted event history, all in one transaction.
+    Rows the local device owns are skipped, it always has the latest.
+
+    Returns
+    -------
+    The device the delta came from, and the number of users whose counts
+    or discards changed and of segments which were new.
+    """
+    meta, arrays = _read_delta(path)
+    device = device_id()
+    if meta['device'] == device:
+        raise ValueError(f'{path} was exported from this device')
+    devices, users, words = arrays['devices'], arrays['users'], arrays['words']
+    counters = pd.DataFrame({
+        'user': users[arrays['counter_user']],
+        'word': words[arrays['counter_word']],
+        'device': devices[arrays['counter_device']],
+        'right': arrays['counter_right'],
+        'wrong': arrays['counter_wrong'],
+        'seq': arrays['counter_seq'],
+    })
+    discards = pd.DataFrame({
+        'user': users[arrays['discard_user']],
+        'word': words[arrays['discard_word']],
+        'device': devices[arrays['discard_device']],
+        'seq': arrays['discard_seq'],
+    })
+    user.flush()
+    with user.database.atomic():
+        counted = _merge_counters(counters[counters['device'] != device])
+        discarded = _merge_discards(discards[discards['device'] != device])
+        segments = _merge_segments(arrays)
+        _merge_vectors(meta['device'], meta['vector'], device)
+    for name in counted.keys() | discarded.keys():
+        prolix.masks.update_masks(name, counts=counted.get(name, ()),
+                                  discarded=discarded.get(name, ()))
+    return dict(device=meta['device'], counted=len(counted),
+                discarded=len(discarded), segments=segments)
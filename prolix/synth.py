@@ -0,0 +1,208 @@
+"""
+Generators for synthetic decks and user bases, used for scale testing.
+
+Decks have made up, pronounceable headwords and definitions in the same
+format PyDictionary produces, a stringified dict mapping parts of speech
+to lists of senses. Users answer words following a one parameter IRT
+model so harder words are missed more often, and their answers are
+written both to the quiz tables and, as compacted history, to the event
+log.
+"""
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import prolix
+
+_onsets = ['b', 'c', 'd', 'f', 'g', 'l', 'm', 'n', 'p', 'qu', 'r', 's', 't',
+           'v', 'br', 'cl', 'pr', 'st', 'tr', 'ph', 'sc', 'gr', '']
+_vowels = ['a', 'e', 'i', 'o', 'u', 'ae', 'ou', 'io']
+_codas = ['', '', '', 'n', 'r', 's', 'l', 'ct', 'nt', 'x', 'm']
+_suffixes = ['', '', 'ous', 'ate', 'ity', 'ent', 'ism', 'ify', 'ive', 'ly']
+
+# parts of speech, how often they occur and the words used for their senses
+_parts_of_speech = {
+    'Noun': 0.5,
+    'Verb': 0.25,
+    'Adjective': 0.2,
+    'Adverb': 0.05,
+}
+_sense_words = {
+    'Noun': ['a', 'state', 'person', 'quality', 'of', 'the', 'condition',
+             'act', 'group', 'being', 'something', 'that', 'which', 'lacks',
+             'excessive', 'manner', 'place', 'feeling', 'small', 'formal'],
+    'Verb': ['to', 'make', 'cause', 'become', 'less', 'more', 'reduce',
+             'praise', 'express', 'strongly', 'with', 'move', 'and', 'give',
+             'disapproval', 'in', 'someone', 'weaken', 'gradually', 'seek'],
+    'Adjective': ['marked', 'by', 'having', 'showing', 'lacking', 'not',
+                  'easily', 'full', 'of', 'characterized', 'great', 'very',
+                  'harsh', 'calm', 'inclined', 'to', 'overly', 'deeply'],
+    'Adverb': ['in', 'a', 'manner', 'that', 'is', 'without', 'with',
+               'great', 'care', 'ease', 'haste', 'restraint', 'openly'],
+}
+
+
+def _make_headwords(size: int, rng: np.random.RandomState) -> np.ndarray:
+    """ Return size unique made up words. """
+    words = np.array([], dtype=object)
+    while len(words) < size:
+        count = int((size - len(words)) * 1.2) + 10
+        syllables = rng.randint(2, 5, count)
+        out = []
+        for num in syllables:
+            parts = [
+                _onsets[rng.randint(len(_onsets))]
+                + _vowels[rng.randint(len(_vowels))]
+                + _codas[rng.randint(len(_codas))]
+                for _ in range(num)
+            ]
+            suffix = _suffixes[rng.randint(len(_suffixes))]
+            out.append(''.join(parts) + suffix)
+        out = np.array(out, dtype=object)
+        words = pd.unique(np.concatenate([words, out]))
+    return np.sort(words[:size])
+
+
+def _make_definition(rng: np.random.RandomState) -> str:
+    """ Return a definition in PyDictionary's stringified dict format. """
+    names = list(_parts_of_speech)
+    probs = np.array(list(_parts_of_speech.values()))
+    count = 1 + (rng.rand() < 0.3)
+    chosen = rng.choice(names, count, replace=False, p=probs)
+    out = {}
+    for pos in chosen:
+        lexicon = _sense_words[pos]
+        senses = []
+        for _ in range(rng.randint(1, 4)):
+            inds = rng.randint(len(lexicon), size=rng.randint(3, 11))
+            senses.append(' '.join(lexicon[x] for x in inds))
+        out[str(pos)] = senses
+    return repr(out)
+
+
+def generate_deck(size: int, seed: Optional[int] = None) -> pd.DataFrame:
+    """
+    Return a synthetic deck of size words.
+
+    The dataframe has a "word" column and a "definition" column, like the
+    word store's csv.
+    """
+    rng = np.random.RandomState(seed)
+    words = _make_headwords(size, rng)
+    definitions = [_make_definition(rng) for _ in range(size)]
+    return pd.DataFrame({'word': words, 'definition': definitions})
+
+
+def write_deck(path, size: int, seed: Optional[int] = None,
+               deck: Optional[str] = None) -> Path:
+    """
+    Write a synthetic deck to the words.csv file in the data directory path,
+    or to decks/<deck>.csv if a deck name is given.
+
+    Return the path to the csv.
+    """
+    path = Path(path)
+    csv_path = path / 'words.csv'
+    if deck is not None:
+        csv_path = path / 'decks' / f'{deck}.csv'
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    generate_deck(size, seed).to_csv(csv_path, index=False)
+    return csv_path
+
+
+def populate_users(user_count: int, answers: int = 200,
+                   seed: Optional[int] = None, days: float = 60.0) -> int:
+    """
+    Create users with answer histories in the current data directory.
+
+    Each user gets an ability and each word a difficulty. Users are quizzed
+    on words drawn with a Zipf like skew, and answer them right with the
+    probability given by a one parameter IRT model. Answers are stored in
+    the quiz tables and as compacted event log segments, and a few words
+    per user are discarded. The word summary and ratings are rebuilt
+    at the end.
+
+    Parameters
+    ----------
+    user_count
+        The number of users to create, named synth_0, synth_1, ...
+    answers
+        The mean number of answers per user.
+    seed
+        A seed for the random number generator.
+    days
+        The answers are spread over this many days before now.
+
+    Returns
+    -------
+    The total number of answers written.
+    """
+    from prolix import events, user as prolix_user
+
+    rng = np.random.RandomState(seed)
+    words = np.asarray(prolix.read_words().index)
+    word_ids = np.array([events.hash_name(x) for x in words], dtype='<u8')
+    difficulty = rng.normal(0, 1, len(words))
+    # word popularity follows a Zipf like curve over a random order
+    weights = 1 / np.arange(1, len(words) + 1) ** 0.8
+    weights = weights[rng.permutation(len(words))]
+    weights /= weights.sum()
+    history_path = events.compacted_path()
+    history_path.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    total = 0
+    for num in range(user_count):
+        name = f'synth_{num}'
+        count = max(1, rng.poisson(answers))
+        asked = rng.choice(len(words), count, p=weights)
+        ability = rng.normal(0, 1)
+        p = 1 / (1 + np.exp(difficulty[asked] - ability))
+        correct = rng.rand(count) < p
+        array = np.zeros(count, dtype=events.event_dtype)
+        array['user'] = events.hash_name(name)
+        array['word'] = word_ids[asked]
+        array['correct'] = np.where(correct, events.RIGHT, events.WRONG)
+        array['mode'] = rng.randint(0, 2, count)
+        array['time'] = np.sort(now - rng.rand(count) * days * 86400)
+        array['latency'] = rng.lognormal(1.2, 0.5, count)
+        counts = pd.DataFrame({'word': words[asked], 'right': correct,
+                               'wrong': ~correct})
+        counts = counts.groupby('word')[['right', 'wrong']].sum()
+        discarded = rng.choice(words, min(5, len(words)), replace=False)
+        segment = f'{time.time_ns()}_synth_{num}{events._sealed_suffix}'
+        with prolix_user.database.atomic():
+            prolix_user._add_user_to_db(name, set_current=False)
+            discard_table, quiz_table = prolix_user._USER_CACHE[name]
+            quiz_table.delete().execute()
+            discard_table.delete().execute()
+            data = counts.reset_index().to_dict('records')
+            for start in range(0, len(data), 500):
+                quiz_table.insert_many(data[start: start + 500]).execute()
+            discarded = [{'word': x} for x in discarded]
+            discard_table.insert_many(discarded).execute()
+        array.tofile(str(history_path / segment))
+        total += count
+    prolix_user.rebuild_word_summary()
+    prolix_user.refit_ratings()
+    return total
+
+
+def generate(path, words: int, users: int = 0, answers: int = 200,
+             seed: Optional[int] = None):
+    """
+    Create a complete synthetic data directory.
+
+    Writes a deck of words, then populates the user database with users.
+    The current data path is restored when finished.
+    """
+    old_path = prolix.data_path
+    write_deck(path, words, seed)
+    if users:
+        prolix.set_data_path(path)
+        try:
+            populate_users(users, answers, seed)
+        finally:
+            prolix.set_data_path(old_path)
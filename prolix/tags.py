@@ -0,0 +1,183 @@
+"""
+Tags and collections of words.
+
+A tag names a collection of words of a deck, such as a chapter of a
+textbook, the words missed in the last test or a theme. The tags of each
+deck are kept in tags/<deck>.csv in the data directory, a csv of tag and
+word, written like the deck csvs under the deck's store lock and replaced
+atomically.
+
+The members of each tag are precomputed as a sorted array of the row ids
+of its words in the deck, rebuilt when the tags or the deck's csv change.
+A quiz or flash card run on some tags combines their arrays once, with a
+union or an intersection, and then draws a random index of the result for
+each question, so the deck is never filtered.
+"""
+from functools import reduce
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import prolix
+from prolix.cache import LoadingCache
+from prolix.deck import get_deck
+from prolix.store import (_csv_key, _stat_key, default_deck,
+                          get_word_csv_path, store_lock)
+from prolix.utils import atomic_write
+
+# ways of combining the members of several tags
+tag_modes = ('any', 'all')
+
+_INDEXES = LoadingCache()
+_empty = np.zeros(0, dtype=np.int32)
+
+
+class TagIndex:
+    """
+    The row ids of the words of each tag of a deck.
+
+    Parameters
+    ----------
+    rows
+        A dict of tag to a sorted int32 array of row ids.
+    key
+        The keys of the tags csv and the deck csv the index was built from.
+    """
+
+    __slots__ = ('rows', 'key')
+
+    def __init__(self, rows: Dict[str, np.ndarray], key: tuple):
+        self.rows = rows
+        self.key = key
+
+    def get(self, tag: str) -> np.ndarray:
+        """ Return the row ids of the words of tag, empty if it has none. """
+        return self.rows.get(tag, _empty)
+
+    def combine(self, tags: Sequence[str], mode: str = 'any') -> np.ndarray:
+        """
+        Return the sorted row ids of the words in any of tags if mode is
+        'any', or in all of them if it is 'all'.
+        """
+        if mode not in tag_modes:
+            raise ValueError(f'{mode!r} is not one of {tag_modes}')
+        rows = [self.get(x) for x in dict.fromkeys(tags)]
+        if not rows:
+            return _empty
+        if mode == 'any':
+            return np.unique(np.concatenate(rows)).astype(np.int32)
+        # intersect the smallest first so every step is at most its size
+        rows.sort(key=len)
+        return reduce(lambda x, y: np.intersect1d(x, y, assume_unique=True),
+                      rows)
+
+
+def get_tags_path(deck: Optional[str] = None) -> Path:
+    """ Return the path of the tags csv of a deck, if None the default
+    deck. """
+    get_word_csv_path(deck)  # check the deck name
+    return Path(prolix.data_path) / 'tags' / f'{deck or default_deck}.csv'
+
+
+def _tags_key(deck: Optional[str] = None) -> tuple:
+    try:
+        return _stat_key(get_tags_path(deck).stat())
+    except FileNotFoundError:
+        return (0, 0, 0)
+
+
+def _check_tag(tag: str) -> str:
+    tag = str(tag).strip()
+    if not tag or '\n' in tag or '\r' in tag:
+        raise ValueError(f'{tag!r} is not a valid tag')
+    return tag
+
+
+def read_tags(deck: Optional[str] = None) -> pd.DataFrame:
+    """ Return a dataframe of the tag and word of each tagged word of a
+    deck. """
+    try:
+        with get_tags_path(deck).open('rb') as fi:
+            df = pd.read_csv(fi, dtype=str, keep_default_na=False)
+    except FileNotFoundError:
+        return pd.DataFrame({'tag': [], 'word': []}, dtype=object)
+    return df[['tag', 'word']]
+
+
+def _write_tags(df: pd.DataFrame, deck: Optional[str] = None):
+    """ Replace the tags csv of a deck, the store lock must be held. """
+    path = get_tags_path(deck)
+    if not len(df):
+        path.unlink(missing_ok=True)
+        return
+    df = df.drop_duplicates().sort_values(['tag', 'word'])
+    with atomic_write(path, 'w') as fi:
+        df.to_csv(fi, index=False)
+
+
+def tag_words(tag: str, words: Iterable[str], deck: Optional[str] = None):
+    """ Add words to tag in a deck, if None the default deck. """
+    tag = _check_tag(tag)
+    new = pd.DataFrame({'tag': tag, 'word': [str(x) for x in words]},
+                       dtype=object)
+    with store_lock(deck):
+        _write_tags(pd.concat([read_tags(deck), new]), deck)
+
+
+def untag_words(tag: str, words: Optional[Iterable[str]] = None,
+                deck: Optional[str] = None):
+    """ Remove words from tag in a deck, or the whole tag if words is
+    None. """
+    tag = _check_tag(tag)
+    with store_lock(deck):
+        df = read_tags(deck)
+        drop = df['tag'] == tag
+        if words is not None:
+            drop &= df['word'].isin([str(x) for x in words])
+        _write_tags(df[~drop], deck)
+
+
+def list_tags(deck: Optional[str] = None) -> Dict[str, int]:
+    """ Return the number of words of the deck each tag has. """
+    index = get_index(deck)
+    return {x: len(y) for x, y in sorted(index.rows.items())}
+
+
+def _build(deck: str, key: tuple) -> TagIndex:
+    words = get_deck(deck).words
+    df = read_tags(deck)
+    rows = {}
+    if len(words) and len(df):
+        tagged = df['word'].to_numpy(object)
+        found = np.minimum(np.searchsorted(words, tagged), len(words) - 1)
+        hit = words[found] == tagged
+        df = pd.DataFrame({'tag': df['tag'].to_numpy(object)[hit],
+                           'row': found[hit].astype(np.int32)})
+        for tag, group in df.groupby('tag', sort=True):
+            rows[tag] = np.unique(group['row'].values).astype(np.int32)
+    return TagIndex(rows, key)
+
+
+def get_index(deck: Optional[str] = None) -> TagIndex:
+    """ Return the tag index of a deck, built on first use and rebuilt if
+    its tags or words change. """
+    deck = deck or default_deck
+    key = (*_tags_key(deck), *_csv_key(deck))
+    return _INDEXES.get_or_load(deck, lambda: _build(deck, key),
+                                lambda x: x.key == key)
+
+
+def tag_rows(tags: Sequence[str], mode: str = 'any',
+             deck: Optional[str] = None) -> np.ndarray:
+    """
+    Return the sorted row ids of the words of a deck in any, or all, of
+    tags, see TagIndex.combine.
+    """
+    return get_index(deck).combine([_check_tag(x) for x in tags], mode)
+
+
+def _reset():
+    """ Forget the indexes so they are built from the new data path. """
+    _INDEXES.clear()
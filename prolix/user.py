@@ -1,22 +1,74 @@
 """
 User Module and database stuff.
 """
+import os
+import threading
+import warnings
 from contextlib import suppress
 from functools import wraps
 from pathlib import Path
-from typing import Optional, Set
+from statistics import NormalDist
+from typing import Iterator, List, Optional, Sequence, Set
 
+import numpy as np
 import pandas as pd
 import peewee
 
 import prolix
-from prolix import database_path
+from prolix import events, metrics, profiling
+from prolix.cache import LoadingCache
 from prolix.utils import iterate
+from prolix.writer import DatabaseWriter
 
-database = peewee.SqliteDatabase(database_path)
+
+class _ProlixDatabase(peewee.SqliteDatabase):
+    """
+    The prolix database.
+
+    The database path is resolved when the first connection is opened,
+    rather than at import, and the meta tables are created then.
+    """
+    _tables_created = False
+    _init_lock = threading.Lock()
+
+    def connect(self, reuse_if_open=False):
+        if self.deferred:
+            with self._init_lock:
+                if self.deferred:
+                    self.init(str(prolix.database_path))
+        opened = super().connect(reuse_if_open)
+        if not self._tables_created:
+            with self._init_lock:
+                if not self._tables_created:
+                    _create_meta_tables()
+                    self._tables_created = True
+        return opened
+
+
+database = _ProlixDatabase(None)
 
 # a cache of tables {user: (rejected_table, quiz_table)}
-_USER_CACHE = {}
+_USER_CACHE = LoadingCache()
+
+# the thread all user writes are made on, created on first use
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+_queue_depth = metrics.gauge(
+    'prolix_db_queue_depth', 'database writes waiting to be committed',
+    func=lambda: _WRITER.queue_depth if _WRITER is not None else 0,
+)
+_answers = metrics.counter(
+    'prolix_answers_total', 'answers recorded by mode and outcome',
+    labels=('mode', 'outcome'),
+)
+_answer_seconds = metrics.histogram(
+    'prolix_answer_seconds', 'seconds users took to answer, by mode',
+    labels=('mode',), buckets=(0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60),
+)
+
+# the names of event outcomes for quiz modes and for card mode
+_outcome_names = (('wrong', 'right', 'retry', 'close'), ('keep', 'discard'))
 
 
 class Meta:
@@ -37,10 +89,63 @@ def _create_table(table: peewee.Model):
 def _delete_table(table: peewee.Model):
     """ Try to delete a table, if it doesn't exist pass. """
     with suppress(peewee.OperationalError):
-        table.delete()
+        table.drop_table()
     return table
 
 
+def get_writer() -> DatabaseWriter:
+    """ Return the writer which runs all database writes. """
+    global _WRITER
+    if _WRITER is None:
+        with _WRITER_LOCK:
+            if _WRITER is None:
+                _WRITER = DatabaseWriter(_write_transaction,
+                                         on_stop=_close_connection)
+    return _WRITER
+
+
+def _write_transaction():
+    """
+    Return a transaction which takes the write lock when it begins, so
+    writers in other processes wait on the busy timeout rather than
+    failing when they try to upgrade a read lock.
+    """
+    return database.atomic('IMMEDIATE')
+
+
+def _close_connection():
+    """ Close the calling thread's database connection, if it is open. """
+    if not database.deferred and not database.is_closed():
+        database.close()
+
+
+def _reset():
+    """
+    Commit queued writes and forget the database and cached tables, so the
+    next use opens the database at prolix.database_path.
+    """
+    global _SUMMARY_READY
+    flush()
+    if _WRITER is not None:
+        _WRITER.stop()
+    _close_connection()
+    database.init(None)
+    database._tables_created = False
+    _USER_CACHE.clear()
+    _SUMMARY_READY = False
+
+
+def flush(timeout: Optional[float] = None):
+    """ Wait until all queued database writes are committed. """
+    if _WRITER is not None:
+        _WRITER.flush(timeout)
+
+
+def writer_metrics() -> dict:
+    """ Return queue depth and latency metrics of the database writer. """
+    return get_writer().metrics()
+
+
 # --- Tables and table factories
 
 
@@ -50,8 +155,59 @@ class ProlixUsers(peewee.Model):
     Meta = Meta
 
 
-# create the meta/user table
-_create_table(ProlixUsers)
+class CompactedSegments(peewee.Model):
+    """ A table of event log segments already folded into quiz tables. """
+    name = peewee.CharField(unique=True)
+    Meta = Meta
+
+
+class ChangedWords(peewee.Model):
+    """
+    The words of each user whose counts or discards changed since the last
+    sync export, so an export reads only those, see prolix.sync.
+    """
+    user = peewee.CharField()
+    word = peewee.CharField()
+
+    class Meta:
+        database = database
+        indexes = ((('user', 'word'), True),)
+
+
+class WordSummary(peewee.Model):
+    """
+    A materialized summary of every user's answers for each word.
+
+    Users is the number of users who have been quizzed on the word.
+    """
+    word = peewee.CharField(unique=True)
+    right = peewee.IntegerField(default=0)
+    wrong = peewee.IntegerField(default=0)
+    users = peewee.IntegerField(default=0)
+    Meta = Meta
+
+
+class UserRating(peewee.Model):
+    """ The ability rating of each user. """
+    user = peewee.CharField(unique=True)
+    ability = peewee.FloatField(default=0.0)
+    answers = peewee.IntegerField(default=0)
+    Meta = Meta
+
+
+class WordRating(peewee.Model):
+    """ The difficulty rating of each word. """
+    word = peewee.CharField(unique=True)
+    difficulty = peewee.FloatField(default=0.0)
+    answers = peewee.IntegerField(default=0)
+    Meta = Meta
+
+
+def _create_meta_tables():
+    """ Create the tables which are not specific to a user. """
+    for table in (ProlixUsers, CompactedSegments, ChangedWords, UserRating,
+                  WordRating):
+        _create_table(table)
 
 
 def _get_rejected_table(user) -> peewee.Model:
@@ -88,14 +244,25 @@ def _add_user_to_db(user: str, set_current: bool = True):
     if user is None:
         return
     if user not in _USER_CACHE:
-        reject_table = _create_table(_get_rejected_table(user))
-        quiz_table = _create_table(_get_quiz_table(user))
-        _USER_CACHE[user] = (reject_table, quiz_table)
+        _USER_CACHE.get_or_load(user, lambda: _create_user_tables(user))
     if set_current:
         _set_current_user(user)
     return user
 
 
+def _create_user_tables(user: str) -> tuple:
+    """ Create a user's tables, return the rejected and quiz tables. """
+    reject_table = _create_table(_get_rejected_table(user))
+    quiz_table = _create_table(_get_quiz_table(user))
+    return reject_table, quiz_table
+
+
+def _get_user_names() -> List[str]:
+    """ Return the names of all users who have tables in the database. """
+    tables = database.get_tables()
+    return sorted(x[len('quiz_'):] for x in tables if x.startswith('quiz_'))
+
+
 def _get_current_user_name() -> Optional[str]:
     """ Get the current user, return None if one is not set. """
     path = Path(prolix.user_file_path)
@@ -132,17 +299,507 @@ def _increment_word_count(words, field, user=None):
     user = _add_user_to_db(user or _get_current_user_name())
     if user is None:
         return
+    words = list(iterate(words))
+    counts = pd.Series(1, index=words)
+    counts = counts.groupby(level=0).sum().to_frame(field)
+    with database.atomic():
+        _add_word_counts(user, counts)
+        update_ratings([(user, word, field == 'right') for word in words])
+
+
+def _add_word_counts(user: str, counts: pd.DataFrame):
+    """
+    Add counts to a user's quiz table in a single transaction.
+
+    Parameters
+    ----------
+    user
+        The name of the user.
+    counts
+        A dataframe indexed by word with "right" and/or "wrong" columns.
+    """
+    _add_user_to_db(user, set_current=False)
+    _ensure_word_summary()
     table = _USER_CACHE[user][1]
-    # try to get the row for the word. Create if it doesn't exist
-    for word in iterate(words):
-        try:
-            row = table.get(word=word)
-        except peewee.DoesNotExist:
-            data = {'word': word, field: 1}
-            table.create(**data)
+    counts = counts.reindex(columns=['right', 'wrong'], fill_value=0)
+    rows = [(str(word), int(right), int(wrong))
+            for word, right, wrong in counts.itertuples()]
+    name = _quote(table._meta.table_name)
+    with database.atomic():
+        existing = _existing_words(table, [x[0] for x in rows])
+        _executemany(
+            f'UPDATE {name} SET "right" = "right" + ?, '
+            f'"wrong" = "wrong" + ? WHERE "word" = ?',
+            [(right, wrong, word) for word, right, wrong in rows
+             if word in existing],
+        )
+        new_words = [x for x in rows if x[0] not in existing]
+        _executemany(
+            f'INSERT INTO {name} ("word", "right", "wrong") VALUES (?, ?, ?)',
+            new_words,
+        )
+        users = pd.Series(1, index=[x[0] for x in new_words])
+        users = users.reindex(counts.index)
+        _update_word_summary(counts.assign(users=users.fillna(0)))
+        _mark_changed(user, [x[0] for x in rows])
+
+
+def _mark_changed(user: str, words: list):
+    """ Note words of user whose counts or discards changed, so the next
+    sync export reads them. """
+    _executemany(
+        f'INSERT OR IGNORE INTO {_quote(ChangedWords._meta.table_name)} '
+        f'("user", "word") VALUES (?, ?)', [(user, x) for x in words])
+
+
+def _executemany(sql: str, rows: list):
+    """
+    Execute a prepared statement once for each row of parameters, in a
+    transaction, which is much faster than building a query per row.
+    """
+    if rows:
+        with database.atomic():
+            database.cursor().executemany(sql, rows)
+
+
+def _existing_words(table: peewee.Model, words: list,
+                    chunk_size: int = 500) -> set:
+    """ Return the words which have rows in table. """
+    out = set()
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start: start + chunk_size]
+        query = table.select(table.word).where(table.word.in_(chunk))
+        out.update(x for (x,) in query.tuples())
+    return out
+
+
+def add_answers(answers):
+    """
+    Add answers to the users' quiz tables and ratings in one transaction.
+
+    Parameters
+    ----------
+    answers
+        An iterable of (user, word, correct) tuples, oldest first.
+    """
+    answers = pd.DataFrame(list(answers), columns=['user', 'word', 'correct'])
+    if answers.empty:
+        return
+    correct = answers['correct'].astype(bool)
+    counts = answers[['user', 'word']].assign(right=correct, wrong=~correct)
+    counts = counts.groupby(['user', 'word'])[['right', 'wrong']].sum()
+    with database.atomic():
+        for user, user_counts in counts.groupby(level='user'):
+            _add_word_counts(user, user_counts.droplevel('user'))
+        update_ratings(answers.itertuples(index=False, name=None))
+    outcomes = np.where(correct, events.RIGHT, events.WRONG)
+    for user, rows in answers.groupby('user', sort=False).indices.items():
+        prolix.masks.update_masks(
+            user, answers=zip(answers['word'].values[rows], outcomes[rows]))
+
+
+def _add_discarded_words(user: str, words):
+    """ Add words not already discarded to a user's discarded table. """
+    _add_user_to_db(user, set_current=False)
+    table = _USER_CACHE[user][0]
+    with database.atomic():
+        existing = {x.word for x in table.select(table.word)}
+        data = [{'word': x} for x in set(iterate(words)) - existing]
+        if data:
+            table.insert_many(data).execute()
+            _mark_changed(user, [x['word'] for x in data])
+
+
+# --- cross user word summary
+
+# True once the word summary table is known to be populated
+_SUMMARY_READY = False
+_SUMMARY_LOCK = threading.RLock()
+
+
+def _quote(name: str) -> str:
+    """ Quote a SQL identifier. """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _read_all_quiz_rows(users_per_query: int = 400) -> pd.DataFrame:
+    """
+    Return the quiz rows of every user in a single dataframe.
+
+    The user tables are read with UNION ALL queries, each covering up to
+    users_per_query tables, to stay below SQLite's compound select limit.
+    """
+    names = _get_user_names()
+    columns = ['user', 'word', 'right', 'wrong']
+    frames = [pd.DataFrame(columns=columns)]
+    for start in range(0, len(names), users_per_query):
+        chunk = names[start: start + users_per_query]
+        sql = ' UNION ALL '.join(
+            f'SELECT ? AS "user", "word", "right", "wrong" '
+            f'FROM {_quote("quiz_" + name)}'
+            for name in chunk
+        )
+        rows = database.execute_sql(sql, chunk).fetchall()
+        frames.append(pd.DataFrame(rows, columns=columns))
+    return pd.concat(frames, ignore_index=True)
+
+
+def rebuild_word_summary():
+    """ Recompute the word summary table from every user's quiz table. """
+    flush()
+    with _SUMMARY_LOCK:
+        _rebuild_word_summary()
+
+
+def _rebuild_word_summary():
+    """
+    Recompute the word summary without waiting for queued writes, which
+    add their counts to the summary when they run.
+    """
+    global _SUMMARY_READY
+    df = _read_all_quiz_rows()
+    summary = df.groupby('word').agg(
+        right=('right', 'sum'), wrong=('wrong', 'sum'), users=('word', 'size'),
+    )
+    data = summary.reset_index().to_dict('records')
+    with database.atomic():
+        _create_table(WordSummary)
+        WordSummary.delete().execute()
+        for start in range(0, len(data), 200):
+            WordSummary.insert_many(data[start: start + 200]).execute()
+    _SUMMARY_READY = True
+
+
+def _ensure_word_summary():
+    """ Create and populate the word summary table if it does not exist. """
+    global _SUMMARY_READY
+    if _SUMMARY_READY:
+        return
+    with _SUMMARY_LOCK:
+        if _SUMMARY_READY:
+            return
+        if WordSummary.table_exists():
+            _SUMMARY_READY = True
         else:
-            current_value = getattr(row, field, 0)
-            setattr(row, field, current_value + 1)
+            _create_table(WordSummary)
+            _rebuild_word_summary()
+
+
+def _update_word_summary(counts: pd.DataFrame):
+    """
+    Add counts to the word summary.
+
+    Parameters
+    ----------
+    counts
+        A dataframe indexed by word with "right", "wrong" and "users"
+        columns. Negative values subtract from the summary.
+    """
+    _ensure_word_summary()
+    counts = counts.reindex(columns=['right', 'wrong', 'users'], fill_value=0)
+    name = _quote(WordSummary._meta.table_name)
+    _executemany(
+        f'INSERT INTO {name} ("word", "right", "wrong", "users") '
+        f'VALUES (?, ?, ?, ?) ON CONFLICT ("word") DO UPDATE SET '
+        f'"right" = "right" + excluded."right", '
+        f'"wrong" = "wrong" + excluded."wrong", '
+        f'"users" = "users" + excluded."users"',
+        [(str(word), int(right), int(wrong), int(users))
+         for word, right, wrong, users in counts.itertuples()],
+    )
+
+
+def _remove_from_word_summary(user: str):
+    """ Subtract a user's quiz table from the word summary. """
+    _ensure_word_summary()
+    table = _USER_CACHE[user][1]
+    rows = list(table.select(table.word, table.right, table.wrong).tuples())
+    if rows:
+        df = pd.DataFrame(rows, columns=['word', 'right', 'wrong'])
+        counts = -df.groupby('word').sum()
+        counts['users'] = -1
+        _update_word_summary(counts)
+
+
+def get_word_difficulty(confidence: float = 0.95) -> pd.DataFrame:
+    """
+    Return the difficulty of every word across all users.
+
+    Error rates and their Wilson score intervals are computed from the
+    materialized word summary, so no user table is scanned.
+
+    Parameters
+    ----------
+    confidence
+        The confidence level of the error rate intervals.
+
+    Returns
+    -------
+    A dataframe indexed by word, hardest words first, with columns "right",
+    "wrong", "users", "attempts", "error_rate", "lower" and "upper". Lower
+    is the lower bound of the error rate interval and is used to rank words
+    so that words with few attempts are not ranked hardest.
+    """
+    flush()
+    _ensure_word_summary()
+    query = WordSummary.select(WordSummary.word, WordSummary.right,
+                               WordSummary.wrong, WordSummary.users)
+    df = pd.DataFrame(list(query.tuples()),
+                      columns=['word', 'right', 'wrong', 'users'])
+    df = df.set_index('word')
+    df = df[(df['right'] + df['wrong']) > 0]
+    n = (df['right'] + df['wrong']).to_numpy(dtype=float)
+    p = df['wrong'].to_numpy(dtype=float) / n
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    center = (p + z ** 2 / (2 * n)) / (1 + z ** 2 / n)
+    spread = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2))
+    spread = spread / (1 + z ** 2 / n)
+    df = df.assign(attempts=n.astype(int), error_rate=p,
+                   lower=center - spread, upper=center + spread)
+    return df.sort_values(['lower', 'attempts'], ascending=False)
+
+
+# --- ability and difficulty ratings
+
+# the base step size of online rating updates, it shrinks as the number of
+# answers for a user or word grows so ratings settle down.
+rating_k = 0.4
+# the strength of the prior which pulls ratings towards 0 in a refit
+rating_prior = 0.1
+
+
+def _rating_step(answers) -> float:
+    """ Return the step size for a user or word with answers answers. """
+    return rating_k / (1 + answers / 20)
+
+
+def _expected(ability, difficulty):
+    """ Probability a user of ability answers a word of difficulty. """
+    return 1 / (1 + np.exp(difficulty - ability))
+
+
+def update_ratings(answers):
+    """
+    Update the user and word ratings with a sequence of answers.
+
+    Ratings follow a one parameter IRT (Rasch) model, where the probability
+    of a correct answer is 1 / (1 + exp(difficulty - ability)). Each answer
+    moves both ratings along the gradient of its log likelihood, Elo style,
+    which costs O(1) per answer.
+
+    Parameters
+    ----------
+    answers
+        An iterable of (user, word, correct) tuples, oldest first.
+    """
+    answers = list(answers)
+    if not answers:
+        return
+    users = list({x[0] for x in answers})
+    words = list({x[1] for x in answers})
+    with database.atomic():
+        ability = {x.user: [x.ability, x.answers] for x in
+                   UserRating.select().where(UserRating.user.in_(users))}
+        difficulty = {x.word: [x.difficulty, x.answers] for x in
+                      WordRating.select().where(WordRating.word.in_(words))}
+        for user, word, correct in answers:
+            user_rating = ability.setdefault(user, [0.0, 0])
+            word_rating = difficulty.setdefault(word, [0.0, 0])
+            surprise = float(correct) - _expected(user_rating[0],
+                                                  word_rating[0])
+            user_rating[0] += _rating_step(user_rating[1]) * surprise
+            word_rating[0] -= _rating_step(word_rating[1]) * surprise
+            user_rating[1] += 1
+            word_rating[1] += 1
+        _executemany(
+            f'INSERT OR REPLACE INTO {_quote(UserRating._meta.table_name)} '
+            f'("user", "ability", "answers") VALUES (?, ?, ?)',
+            [(user, float(value), count)
+             for user, (value, count) in ability.items()],
+        )
+        _executemany(
+            f'INSERT OR REPLACE INTO {_quote(WordRating._meta.table_name)} '
+            f'("word", "difficulty", "answers") VALUES (?, ?, ?)',
+            [(str(word), float(value), count)
+             for word, (value, count) in difficulty.items()],
+        )
+
+
+def refit_ratings(iterations: int = 100, tol: float = 1e-6) -> pd.DataFrame:
+    """
+    Refit every rating from the whole answer history at once.
+
+    The right and wrong counts of every user and word pair are sufficient
+    statistics of the Rasch model, so the joint maximum a posteriori fit is
+    found with vectorized Newton steps over the counts, alternating between
+    abilities and difficulties. Difficulties are centered on 0.
+
+    Parameters
+    ----------
+    iterations
+        The maximum number of Newton steps.
+    tol
+        Stop once no rating changes by more than this.
+
+    Returns
+    -------
+    A dataframe of the fitted difficulties indexed by word.
+    """
+    flush()
+    df = _read_all_quiz_rows()
+    df = df[(df['right'] + df['wrong']) > 0]
+    user_ind, users = pd.factorize(df['user'])
+    word_ind, words = pd.factorize(df['word'])
+    right = df['right'].to_numpy(dtype=float)
+    total = right + df['wrong'].to_numpy(dtype=float)
+    ability = np.zeros(len(users))
+    difficulty = np.zeros(len(words))
+    for _ in range(iterations):
+        # update abilities holding difficulties fixed, then the reverse
+        p = _expected(ability[user_ind], difficulty[word_ind])
+        grad = np.bincount(user_ind, right - total * p, len(users))
+        hess = np.bincount(user_ind, total * p * (1 - p), len(users))
+        step_a = (grad - rating_prior * ability) / (hess + rating_prior)
+        ability += step_a
+        p = _expected(ability[user_ind], difficulty[word_ind])
+        grad = np.bincount(word_ind, total * p - right, len(words))
+        hess = np.bincount(word_ind, total * p * (1 - p), len(words))
+        step_d = (grad - rating_prior * difficulty) / (hess + rating_prior)
+        difficulty += step_d
+        change = max(np.abs(step_a).max(initial=0),
+                     np.abs(step_d).max(initial=0))
+        if change < tol:
+            break
+    shift = difficulty.mean() if len(difficulty) else 0.0
+    user_answers = np.bincount(user_ind, total, len(users)).astype(int)
+    word_answers = np.bincount(word_ind, total, len(words)).astype(int)
+    user_data = [dict(user=u, ability=a - shift, answers=n)
+                 for u, a, n in zip(users, ability, user_answers)]
+    word_data = [dict(word=w, difficulty=d - shift, answers=n)
+                 for w, d, n in zip(words, difficulty, word_answers)]
+    with database.atomic():
+        UserRating.delete().execute()
+        WordRating.delete().execute()
+        for start in range(0, max(len(user_data), len(word_data)), 200):
+            if user_data[start: start + 200]:
+                UserRating.insert_many(user_data[start: start + 200]).execute()
+            if word_data[start: start + 200]:
+                WordRating.insert_many(word_data[start: start + 200]).execute()
+    return get_word_ratings()
+
+
+def get_word_ratings() -> pd.DataFrame:
+    """
+    Return a dataframe indexed by word with "difficulty" and "answers".
+    """
+    flush()
+    query = WordRating.select(WordRating.word, WordRating.difficulty,
+                              WordRating.answers)
+    df = pd.DataFrame(list(query.tuples()),
+                      columns=['word', 'difficulty', 'answers'])
+    return df.set_index('word')
+
+
+# --- event log compaction
+
+# serializes compaction within a process
+_COMPACT_LOCK = threading.Lock()
+
+
+def _fold_events(array: np.ndarray):
+    """ Add the counts and discards in an event array to the user tables. """
+    users = {events.hash_name(x): x for x in _get_user_names()}
+    words = prolix.read_words().index
+    word_ids = pd.Series(words, index=np.array(
+        [events.hash_name(x) for x in words], dtype='<u8'))
+    # answers to an id shared by two words can't be credited to either
+    shared = word_ids.index.duplicated(keep=False)
+    if shared.any():
+        warnings.warn(f'skipping answers to words with the same event id: '
+                      f'{", ".join(word_ids[shared])}')
+        word_ids = word_ids[~shared]
+    df = pd.DataFrame(array)
+    df = df[df['user'].isin(users) & df['word'].isin(word_ids.index)]
+    df['user'] = df['user'].map(users)
+    df['word'] = df['word'].map(word_ids)
+    card_mode = events.modes.index('card')
+    # sum right and wrong answers for each user and word
+    quiz = df[df['mode'] != card_mode]
+    quiz = pd.DataFrame({
+        'user': quiz['user'], 'word': quiz['word'],
+        'right': quiz['correct'].isin([events.RIGHT, events.CLOSE]),
+        'wrong': quiz['correct'] == events.WRONG,
+    })
+    for user, counts in quiz.groupby('user'):
+        _add_word_counts(user, counts.groupby('word')[['right', 'wrong']].sum())
+    # replay the answers, in order, through the rating model
+    answered = quiz[quiz['right'] | quiz['wrong']]
+    update_ratings(zip(answered['user'], answered['word'], answered['right']))
+    # discard flash cards the user swiped away
+    cards = df[(df['mode'] == card_mode) & (df['correct'] == events.DISCARD)]
+    for user, discarded in cards.groupby('user'):
+        _add_discarded_words(user, list(discarded['word'].unique()))
+
+
+@profiling.timed('compaction')
+def compact_events(path: Optional[Path] = None) -> int:
+    """
+    Fold sealed event log segments into the users' quiz tables, after
+    sealing the segments of processes which died without sealing them.
+
+    Each segment is folded and marked as compacted in one transaction so a
+    segment is never counted twice. Segment files are moved to the
+    compacted directory once the transaction has been committed, when the
+    writer's batch commits if this runs on the database writer. If it is
+    called inside another outer transaction they are moved by the next
+    compaction instead.
+
+    Parameters
+    ----------
+    path
+        The directory holding the event segments. Defaults to the data path.
+
+    Returns
+    -------
+    The number of segments which were compacted.
+    """
+    events.seal()
+    count = 0
+    with _COMPACT_LOCK:
+        events.seal_stale(path)
+        segments = events.sealed_segments(path)
+        names = [x.name for x in segments]
+        query = CompactedSegments.select().where(
+            CompactedSegments.name.in_(names))
+        done = {x.name for x in query}
+        for segment in segments:
+            if segment.name in done:
+                continue
+            with suppress(peewee.IntegrityError), database.atomic():
+                CompactedSegments.create(name=segment.name)
+                _fold_events(events.read_segment(segment))
+                count += 1
+            done.add(segment.name)
+
+        def _move():
+            history = events.compacted_path(path)
+            history.mkdir(parents=True, exist_ok=True)
+            for segment in segments:
+                with suppress(FileNotFoundError):
+                    os.replace(segment, history / segment.name)
+
+        # on the writer the batch commits after this returns
+        if not get_writer().after_commit(_move) \
+                and not database.in_transaction():
+            _move()
+    return count
+
+
+def compact_events_in_background(path: Optional[Path] = None):
+    """ Queue compaction of the event log on the database writer. """
+    events.seal()
+    if events.sealed_segments(path) or events.seal_stale(path):
+        get_writer().submit(compact_events, path)
 
 
 def _require_user(method):
@@ -160,6 +817,19 @@ def _require_user(method):
     return _wrap
 
 
+def _deferred(method):
+    """
+    Method decorator to run the method on the database writer thread.
+    The method returns immediately.
+    """
+
+    @wraps(method)
+    def _wrap(self, *args, **kwargs):
+        get_writer().submit(method, self, *args, **kwargs)
+
+    return _wrap
+
+
 class User:
     """ A prolix user model. """
 
@@ -188,6 +858,9 @@ class User:
     def delete_user(self):
         """ Delete this user, remove from db and delete current user if one
          exists. """
+        flush()
+        _remove_from_word_summary(self.name)
+        UserRating.delete().where(UserRating.user == self.name).execute()
         # pull name out of cache and delete tables
         tables = _USER_CACHE.pop(self.name, [])
         for table in tables:
@@ -198,6 +871,7 @@ class User:
         # reset current_user file
         if self.name == _get_current_user_name():
             _set_current_user(None)
+        prolix.masks.forget(self.name)
 
     @staticmethod
     def _default_quiz_table() -> pd.DataFrame:
@@ -218,32 +892,278 @@ class User:
         correctly or incorrectly, respectively.
 
         """
+        flush()
         default = self._default_quiz_table()
         table = _USER_CACHE[self.name][1]
         df = pd.DataFrame(list(table.select().dicts()),
                           columns=['right', 'wrong', 'word'])
         return default.add(df.set_index('word'), fill_value=0)
 
+    @_require_user
+    def get_ability(self) -> float:
+        """ Return the user's ability rating, 0 if they have no answers. """
+        flush()
+        rating = UserRating.get_or_none(UserRating.user == self.name)
+        return rating.ability if rating else 0.0
+
+    @_require_user
+    def get_expected_scores(self) -> pd.Series:
+        """
+        Return the probability the user answers each word correctly,
+        according to their ability and the words' difficulty ratings.
+        """
+        difficulty = get_word_ratings()['difficulty']
+        difficulty = difficulty.reindex(prolix.read_words().index,
+                                        fill_value=0.0)
+        return _expected(self.get_ability(), difficulty)
+
+    @_deferred
     @_require_user
     def incorrectly_answered_word(self, word):
         """ User answered word incorrectly. """
         _increment_word_count(word, 'wrong', user=self.name)
+        prolix.masks.update_masks(
+            self.name, answers=[(x, events.WRONG) for x in iterate(word)])
 
+    @_deferred
     @_require_user
     def correctly_answered_word(self, word):
         """ User answered word correctly. """
         _increment_word_count(word, 'right', user=self.name)
+        prolix.masks.update_masks(
+            self.name, answers=[(x, events.RIGHT) for x in iterate(word)])
+
+    @_require_user
+    def record_answer(self, word: str, correct: int, mode: str = 'word',
+                      latency: float = 0.0):
+        """
+        Append an answer to the event log.
+
+        The answer is added to the quiz table (or the discarded table for
+        flash cards) when the event log is next compacted.
+
+        Parameters
+        ----------
+        word
+            The word which was asked.
+        correct
+            An outcome constant from prolix.events.
+        mode
+            The quiz mode, one of prolix.events.modes.
+        latency
+            The seconds the user took to answer.
+        """
+        events.log_event(self.name, word, correct, mode=mode, latency=latency)
+        _answers.inc(labels=(mode, _outcome_names[mode == 'card'][correct]))
+        _answer_seconds.observe(latency, labels=(mode,))
 
     @_require_user
     def get_discarded_words(self) -> Set[str]:
         """ Return a set of discarded flashcard words for user. """
+        flush()
         table = _USER_CACHE[self.name][0]
         words = {x.word for x in table.select(table.word)}
         return words
 
+    @_deferred
     @_require_user
     def discard_word(self, word):
         """ Discard a word so that the flash card is not shown again. """
         table = _USER_CACHE[self.name][0]
         data = [{'word': x} for x in iterate(word)]
-        table.insert_many(data).execute()
+        with database.atomic():
+            table.insert_many(data).execute()
+            _mark_changed(self.name, [x['word'] for x in data])
+        prolix.masks.discard_words(self.name, [x['word'] for x in data])
+
+    @_require_user
+    def get_filter(self, deck: Optional[str] = None) -> List[str]:
+        """ Return the words filtered out of quizzes and flash cards on a
+        deck, if None the default deck. """
+        return prolix.masks.read_filter(self.name, deck)
+
+    @_require_user
+    def set_filter(self, words=(), deck: Optional[str] = None):
+        """ Filter words out of quizzes and flash cards on a deck, replacing
+        the filter, see prolix.masks.set_filter. """
+        prolix.masks.set_filter(self.name, words, deck)
+
+
+# --- bulk stats export and import
+
+# columns of exported stats. Kind is "quiz" for quiz table rows, in which
+# case right and wrong are the counts, or "discarded" for discarded words.
+stats_columns = ('user', 'kind', 'word', 'right', 'wrong')
+
+_stats_formats = {
+    '.parquet': 'parquet', '.pq': 'parquet',
+    '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow',
+}
+
+
+def _get_stats_format(path: Path, format: Optional[str] = None) -> str:
+    """ Return the file format, inferred from the extension if not given. """
+    format = format or _stats_formats.get(Path(path).suffix.lower())
+    if format not in {'parquet', 'arrow'}:
+        msg = f'cannot determine stats format of {path}, use parquet or arrow'
+        raise ValueError(msg)
+    return format
+
+
+def _iter_stats_rows(users: Optional[Sequence[str]] = None):
+    """ Yield a tuple for every quiz row and discarded word of users. """
+    for user in _get_user_names() if users is None else users:
+        _add_user_to_db(user, set_current=False)
+        discarded, quiz = _USER_CACHE[user]
+        query = quiz.select(quiz.word, quiz.right, quiz.wrong).tuples()
+        for word, right, wrong in query.iterator():
+            yield user, 'quiz', word, right, wrong
+        for (word,) in discarded.select(discarded.word).tuples().iterator():
+            yield user, 'discarded', word, 0, 0
+
+
+def iter_stats(chunk_size: int = 50_000, users: Optional[Sequence[str]] = None
+               ) -> Iterator[pd.DataFrame]:
+    """
+    Yield the stats and discarded words of users in chunks.
+
+    Each chunk is a dataframe with the columns in stats_columns and at most
+    chunk_size rows, so the whole database is never held in memory. If
+    users is None every user is included.
+    """
+    flush()
+    rows = []
+    for row in _iter_stats_rows(users):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield pd.DataFrame(rows, columns=stats_columns)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows, columns=stats_columns)
+
+
+def _stats_schema():
+    """ Return the arrow schema of exported stats. """
+    import pyarrow as pa
+    return pa.schema([
+        ('user', pa.string()), ('kind', pa.string()), ('word', pa.string()),
+        ('right', pa.int64()), ('wrong', pa.int64()),
+    ])
+
+
+def export_stats(path, format: Optional[str] = None,
+                 chunk_size: int = 50_000,
+                 users: Optional[Sequence[str]] = None) -> int:
+    """
+    Stream every user's stats and discarded words to a columnar file.
+
+    Parameters
+    ----------
+    path
+        The output path.
+    format
+        Either "parquet" or "arrow" (Arrow IPC). If None it is inferred from
+        the file extension.
+    chunk_size
+        The number of rows written in each row group or record batch.
+    users
+        The names of the users to export, if None export every user.
+
+    Returns
+    -------
+    The number of rows written.
+    """
+    format = _get_stats_format(path, format)
+    import pyarrow as pa
+
+    schema = _stats_schema()
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(str(path), schema)
+    else:
+        writer = pa.ipc.new_file(str(path), schema)
+    count = 0
+    with writer:
+        for df in iter_stats(chunk_size, users):
+            batch = pa.RecordBatch.from_pandas(df, schema=schema,
+                                               preserve_index=False)
+            writer.write_batch(batch)
+            count += len(df)
+    return count
+
+
+def _iter_stats_file(path, format: str, chunk_size: int):
+    """ Yield dataframes of stats from a columnar file. """
+    import pyarrow as pa
+
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(str(path)).iter_batches(chunk_size)
+        for batch in batches:
+            yield batch.to_pandas()
+    else:
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            for num in range(reader.num_record_batches):
+                yield reader.get_batch(num).to_pandas()
+
+
+def import_stats(path, format: Optional[str] = None, replace: bool = False,
+                 chunk_size: int = 50_000) -> int:
+    """
+    Load stats written by export_stats into the database.
+
+    Parameters
+    ----------
+    path
+        The path to the exported stats.
+    format
+        Either "parquet" or "arrow". If None it is inferred from the file
+        extension.
+    replace
+        If True clear the tables of every user in the file before loading
+        their stats (a restore), else add the counts to the existing ones.
+    chunk_size
+        The number of rows read and committed at a time.
+
+    Returns
+    -------
+    The number of rows read.
+    """
+    format = _get_stats_format(path, format)
+    flush()
+    cleared = set()
+    count = 0
+    for df in _iter_stats_file(path, format, chunk_size):
+        updates = []
+        with database.atomic():
+            for user, user_df in df.groupby('user', sort=False):
+                _add_user_to_db(user, set_current=False)
+                discarded, quiz = _USER_CACHE[user]
+                clear = replace and user not in cleared
+                if clear:
+                    _remove_from_word_summary(user)
+                    quiz.delete().execute()
+                    discarded.delete().execute()
+                    cleared.add(user)
+                is_quiz = user_df['kind'] == 'quiz'
+                counts = user_df[is_quiz].groupby('word')[['right', 'wrong']]
+                counts = counts.sum()
+                if replace:
+                    data = counts.reset_index().to_dict('records')
+                    for start in range(0, len(data), 500):
+                        quiz.insert_many(data[start: start + 500]).execute()
+                    _update_word_summary(counts.assign(users=1))
+                    _mark_changed(user, list(counts.index))
+                else:
+                    _add_word_counts(user, counts)
+                words = list(user_df.loc[~is_quiz, 'word'])
+                _add_discarded_words(user, words)
+                updates.append((user, counts, words, clear))
+        # update the masks once the chunk is committed
+        for user, counts, words, clear in updates:
+            prolix.masks.update_masks(
+                user, counts=counts.itertuples(name=None), discarded=words,
+                clear=clear)
+        count += len(df)
+    return count
@@ -3,11 +3,18 @@ Utilities
 """
 
 import ast
+import os
+import stat
+import tempfile
+from contextlib import contextmanager, suppress
 from functools import reduce
 from operator import add
+from pathlib import Path
 from typing import Optional
 from typing import Sequence
 
+from prolix.profiling import timed
+
 
 def _dedict_definition(word_def: str):
     """ de-dictify the word definitions """
@@ -15,6 +22,7 @@ def _dedict_definition(word_def: str):
     return reduce(add, list(word_def.values()))
 
 
+@timed('format_definition')
 def _format_defintion(definition, number: Optional[int] = None):
     """ Format a definition for nice viewing. """
     fdefs = _dedict_definition(definition)
@@ -48,3 +56,33 @@ def iterate(obj):
     if isinstance(obj, str):
         return (obj,)
     return obj if isinstance(obj, Sequence) else (obj,)
+
+
+@contextmanager
+def atomic_write(path, mode: str = 'wb'):
+    """
+    Open a temporary file next to path to write, and move it over path once
+    it has been written and synced, so readers see either the old file or
+    the new one but never part of a write. If writing raises path is left
+    as it was.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=str(path.parent), suffix='.tmp',
+                                prefix=f'.{path.name}.')
+    try:
+        # keep the permissions of the file being replaced
+        try:
+            permissions = stat.S_IMODE(path.stat().st_mode)
+        except FileNotFoundError:
+            permissions = 0o644
+        os.chmod(temp, permissions)
+        with os.fdopen(fd, mode) as fi:
+            yield fi
+            fi.flush()
+            os.fsync(fi.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.unlink(temp)
+        raise
@@ -0,0 +1,243 @@
+"""
+A single background thread for database writes.
+
+Writes are queued so callers, such as the urwid event loop, never wait on
+SQLite. Jobs waiting in the queue are drained in batches and each batch is
+committed in one transaction, so a burst of answers costs one sync.
+"""
+import atexit
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Optional
+
+from prolix import metrics, profiling
+
+# a sentinel put in the queue to stop the writer
+_STOP = object()
+
+_write_latency = metrics.histogram(
+    'prolix_db_write_latency_seconds',
+    'seconds from queuing a database write to its commit')
+_write_errors = metrics.counter(
+    'prolix_db_write_errors_total', 'database writes which failed')
+
+
+class WriterError(Exception):
+    """ Raised by flush if a queued write failed. """
+
+
+class DatabaseWriter:
+    """
+    Run database writes on a dedicated thread.
+
+    Parameters
+    ----------
+    transaction
+        A callable returning a context manager which wraps a transaction,
+        eg peewee.Database.atomic. Each batch runs in a transaction and each
+        job in a nested one, so a failing job does not roll back the batch.
+    maxsize
+        The maximum number of queued jobs. When the queue is full submit
+        blocks until the writer catches up.
+    max_batch
+        The maximum number of jobs committed in one transaction.
+    on_stop
+        A callable run on the writer thread when it stops, eg to close the
+        thread's database connection.
+    """
+
+    def __init__(self, transaction: Optional[Callable] = None,
+                 maxsize: int = 1024, max_batch: int = 256,
+                 on_stop: Optional[Callable] = None):
+        self._transaction = transaction or nullcontext
+        self._on_stop = on_stop
+        self._queue = queue.Queue(maxsize)
+        self.max_batch = max_batch
+        self._thread = None
+        self._lock = threading.Lock()
+        self._errors = []
+        self._registered = False
+        # callables to run once the batch being written commits
+        self._after_commit = []
+        # metrics
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.blocked_submits = 0
+        self.max_write_latency = 0.0
+        self.total_write_latency = 0.0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """ Return the number of jobs waiting to be written. """
+        return self._queue.qsize()
+
+    @property
+    def is_alive(self) -> bool:
+        """ Return True if the writer thread is running. """
+        return self._thread is not None and self._thread.is_alive()
+
+    def _on_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def start(self):
+        """ Start the writer thread if it is not running. """
+        with self._lock:
+            if self.is_alive:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='prolix-db-writer', daemon=True,
+            )
+            self._thread.start()
+            if not self._registered:
+                atexit.register(self.stop)
+                self._registered = True
+
+    def submit(self, func: Callable, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) to be run on the writer thread.
+
+        Blocks if the queue is full. Jobs submitted from the writer thread,
+        by another job, are run immediately.
+        """
+        if self._on_writer_thread():
+            return func(*args, **kwargs)
+        self.start()
+        job = (func, args, kwargs, time.perf_counter())
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.blocked_submits += 1
+            self._queue.put(job)
+        self.submitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def after_commit(self, func: Callable) -> bool:
+        """
+        Run func on the writer thread once the batch being written has
+        been committed, eg to move files the batch marked as done. Return
+        False, without running func, if not called from a job.
+        """
+        if not self._on_writer_thread():
+            return False
+        self._after_commit.append(func)
+        return True
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Wait until every queued job has been committed.
+
+        Parameters
+        ----------
+        timeout
+            The maximum number of seconds to wait, if None wait forever.
+
+        Raises
+        ------
+        WriterError
+            If any job failed since the last flush.
+        TimeoutError
+            If the queue was not drained within the timeout.
+        """
+        start = time.perf_counter()
+        if self.is_alive and not self._on_writer_thread():
+            with self._queue.all_tasks_done:
+                while self._queue.unfinished_tasks:
+                    remaining = None
+                    if timeout is not None:
+                        remaining = timeout - (time.perf_counter() - start)
+                        if remaining <= 0:
+                            raise TimeoutError('database writer did not flush')
+                    self._queue.all_tasks_done.wait(remaining)
+        self.last_flush_latency = time.perf_counter() - start
+        self.max_flush_latency = max(self.max_flush_latency,
+                                     self.last_flush_latency)
+        if self._errors:
+            errors, self._errors = self._errors, []
+            msg = f'{len(errors)} database writes failed, first: {errors[0]!r}'
+            raise WriterError(msg) from errors[0]
+
+    def stop(self):
+        """ Flush the queue and stop the writer thread. """
+        if not self.is_alive:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def metrics(self) -> dict:
+        """ Return a dict of queue depth and latency metrics. """
+        return dict(
+            queue_depth=self.queue_depth,
+            max_queue_depth=self.max_queue_depth,
+            blocked_submits=self.blocked_submits,
+            submitted=self.submitted,
+            written=self.written,
+            batches=self.batches,
+            mean_write_latency=self.total_write_latency / (self.written or 1),
+            max_write_latency=self.max_write_latency,
+            last_flush_latency=self.last_flush_latency,
+            max_flush_latency=self.max_flush_latency,
+        )
+
+    # --- writer thread
+
+    def _next_batch(self):
+        """ Block for one job, then take any others already waiting. """
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_job(self, func, args, kwargs):
+        try:
+            with self._transaction():
+                func(*args, **kwargs)
+        except Exception as e:  # surfaced by the next flush
+            self._errors.append(e)
+            _write_errors.inc()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            jobs = [x for x in batch if x is not _STOP]
+            try:
+                if jobs:
+                    with profiling.phase('database_write'), \
+                            self._transaction():
+                        for func, args, kwargs, _ in jobs:
+                            self._run_job(func, args, kwargs)
+            except Exception as e:  # the commit itself failed
+                self._after_commit = []
+                self._errors.append(e)
+                _write_errors.inc(len(jobs))
+            finally:
+                callbacks, self._after_commit = self._after_commit, []
+                for func in callbacks:
+                    try:
+                        func()
+                    except Exception as e:  # surfaced by the next flush
+                        self._errors.append(e)
+                now = time.perf_counter()
+                for *_, submitted in jobs:
+                    latency = now - submitted
+                    self.total_write_latency += latency
+                    self.max_write_latency = max(self.max_write_latency,
+                                                 latency)
+                    _write_latency.observe(latency)
+                self.written += len(jobs)
+                self.batches += bool(jobs)
+                for _ in batch:
+                    self._queue.task_done()
+            if len(jobs) != len(batch):
+                if self._on_stop is not None:
+                    self._on_stop()
+                return
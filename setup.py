@@ -19,7 +19,7 @@ from setuptools.command.develop import develop
 
 # define python versions
 
-python_version = (3, 6)  # tuple of major, minor version requirement
+python_version = (3, 8)  # tuple of major, minor version requirement
 python_version_str = str(python_version[0]) + "." + str(python_version[1])
 
 # produce an error message if the python version is less than required
@@ -71,6 +71,11 @@ def read_requirements(path):
 package_req_path = here / "requirements.txt"
 test_req_path = here / "tests" / "requirements.txt"
 
+# optional dependencies, installed with pip install prolix[name]
+EXTRAS_REQUIRE = {
+    "stats": ["pyarrow"],  # export-stats and import-stats
+}
+
 
 ENTRY_POINTS = {
     'console_scripts': [
@@ -98,12 +103,12 @@ setup(
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
         "License :: OSI Approved :: GNU Public License v3 or later (GPLv3+)",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
         "Topic :: English",
     ],
     test_suite="tests",
     install_requires=read_requirements(package_req_path),
+    extras_require=EXTRAS_REQUIRE,
     tests_require=read_requirements(test_req_path),
     setup_requires=["pytest-runner>=2.0"],
     python_requires=">=%s" % python_version_str,
@@ -1,14 +1,18 @@
 """
 Tests configuration
 """
-import sys
-import string
+import asyncio
+import os
 import random
+import shutil
+import string
+import sys
 from pathlib import Path
 
 import pytest
 
 import prolix
+from prolix import synth
 
 # path to the test directory
 TEST_PATH = Path(__file__).parent
@@ -20,6 +24,54 @@ PKG_PATH = TEST_PATH.parent
 sys.path.insert(0, str(PKG_PATH))
 
 
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'deck_data(**options): the data of the deck_path fixture')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def data_path(tmp_path_factory):
+    """ Run the tests in a temporary data directory holding a copy of the
+    bundled words, so the event log, user database and other runtime data
+    aren't written to the package. """
+    path = tmp_path_factory.mktemp('data')
+    shutil.copy(prolix.default_data_path / 'words.csv', path / 'words.csv')
+    old = os.environ.get('PROLIX_DATA_PATH')
+    os.environ['PROLIX_DATA_PATH'] = str(path)
+    prolix.set_data_path(None)
+    yield path
+    prolix.user.flush()
+    if old is None:
+        del os.environ['PROLIX_DATA_PATH']
+    else:
+        os.environ['PROLIX_DATA_PATH'] = old
+    prolix.set_data_path(None)
+
+
+@pytest.fixture
+def deck_path(request, tmp_path):
+    """
+    Point prolix at a temporary data directory of synthetic data, restore
+    the data path when finished.
+
+    Mark a test or class with deck_data to change the data: size and seed
+    of the default deck, 300 and 1 if not given, decks, a dict of other
+    deck names to their size and seed, and users and answers to populate
+    the user database with, see synth.generate.
+    """
+    options = dict(size=300, seed=1, decks={}, users=0, answers=30)
+    marker = request.node.get_closest_marker('deck_data')
+    if marker is not None:
+        options.update(marker.kwargs)
+    synth.generate(tmp_path, options['size'], users=options['users'],
+                   answers=options['answers'], seed=options['seed'])
+    for name, (size, seed) in options['decks'].items():
+        synth.write_deck(tmp_path, size, seed=seed, deck=name)
+    prolix.set_data_path(tmp_path)
+    yield tmp_path
+    prolix.set_data_path(None)
+
+
 @pytest.fixture
 def user() -> prolix.User:
     """ Create a test user profile, delete when finished. """
@@ -30,3 +82,33 @@ def user() -> prolix.User:
     # delete test user and set current user back
     user.delete_user()
     current_user.is_current_user = True
+
+
+def _run_requests(*requests):
+    """ Start a server, make requests and return the responses. """
+    from prolix import server
+
+    async def _main():
+        app = server.ProlixServer(port=0, seed=3)
+        await app.start()
+        client = server._Client('127.0.0.1', app.port)
+        out = []
+        try:
+            for method, path, data in requests:
+                if callable(data):
+                    data = data(out)
+                out.append(await client.request(method, path, data))
+        finally:
+            client.close()
+            await app.close()
+        return out
+
+    return asyncio.run(_main())
+
+
+@pytest.fixture
+def run_requests():
+    """ Return a function which starts a server, makes (method, path, data)
+    requests and returns the (status, body) responses. A callable data is
+    called with the responses so far. """
+    return _run_requests
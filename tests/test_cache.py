@@ -0,0 +1,96 @@
+"""
+Tests for the thread-safe caches
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import prolix
+from prolix.cache import LoadingCache
+
+THREADS = 16
+
+
+def _hammer(func, calls: int = 400) -> list:
+    """ Call func from many threads at once, return the results. """
+    barrier = threading.Barrier(THREADS)
+
+    def _call(num):
+        if num < THREADS:
+            barrier.wait()
+        return func(num)
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        return list(pool.map(_call, range(calls)))
+
+
+class TestLoadingCache:
+    """ Tests for the cache itself. """
+
+    def test_single_flight(self):
+        """ Concurrent callers for a key should share one load. """
+        cache = LoadingCache()
+
+        def _load():
+            time.sleep(0.05)
+            return object()
+
+        out = _hammer(lambda num: cache.get_or_load(num % 4, _load))
+        assert cache.loads == 4
+        assert len({id(x) for x in out}) == 4
+
+    def test_failed_load_not_cached(self):
+        """ A load which raises should be retried by the next caller. """
+        cache = LoadingCache()
+
+        def _fail():
+            raise ValueError('no')
+
+        with pytest.raises(ValueError):
+            cache.get_or_load('a', _fail)
+        assert 'a' not in cache
+        assert cache.get_or_load('a', lambda: 1) == 1
+
+    def test_stale_value_reloaded(self):
+        """ A value is_valid rejects should be loaded again. """
+        cache = LoadingCache()
+        cache.set('a', 1)
+        assert cache.get_or_load('a', lambda: 2, lambda x: x > 1) == 2
+        assert cache.get_or_load('a', lambda: 3, lambda x: x > 1) == 2
+
+    def test_mixed_operations(self):
+        """ Loads, pops and clears from many threads should not raise. """
+        cache = LoadingCache(stripes=4)
+
+        def _op(num):
+            key = num % 10
+            if num % 7 == 0:
+                cache.pop(key)
+            elif num % 31 == 0:
+                cache.clear()
+            return cache.get_or_load(key, lambda: key * 2)
+
+        out = _hammer(_op, 2000)
+        assert out == [(x % 10) * 2 for x in range(2000)]
+
+
+def test_read_words_loaded_once():
+    """ Threads missing the word cache together should read the csv once. """
+    prolix.store._word_cache.clear()
+    loads = prolix.store._word_cache.loads
+    out = _hammer(lambda num: prolix.read_words())
+    assert prolix.store._word_cache.loads == loads + 1
+    assert all(x is out[0] for x in out)
+
+
+def test_user_tables_created_once(user):
+    """ Threads adding the same new user should create its tables once. """
+    cache = prolix.user._USER_CACHE
+    prolix.user.flush()
+    cache.pop(user.name)
+    loads = cache.loads
+    _hammer(lambda num: prolix.user._add_user_to_db(user.name, False), 200)
+    assert cache.loads == loads + 1
+    assert user.name in prolix.user._get_user_names()
@@ -0,0 +1,145 @@
+"""
+Tests for checkpointing and resuming sessions
+"""
+import numpy as np
+import pytest
+
+import prolix
+from prolix import checkpoint, synth
+
+
+def _cards(card_run, keys) -> list:
+    """ Press keys, return the word of the card shown after each. """
+    out = []
+    for key in keys:
+        card_run.dispatch('key', key)
+        out.append(card_run.card.word)
+    return out
+
+
+def _questions(quiz_run, count) -> list:
+    """ Answer count questions correctly, return the words asked. """
+    out = []
+    for _ in range(count):
+        out.append(quiz_run.quiz.word)
+        quiz_run._answer_correctly()
+    return out
+
+
+class TestCards:
+    """ Tests for resuming flash card runs. """
+
+    def test_resume_continues(self, deck_path):
+        """ A resumed run should have the same cards left and draw the
+        cards the run would have drawn had it not been quit. """
+        keys = ['right', 'left', 'f', 'left', 'right', 'left'] * 3
+        whole = prolix.CardRun(user=None, headless=True, seed=3)
+        expected = _cards(whole, keys)
+
+        card_run = prolix.CardRun(user=None, headless=True, seed=3,
+                                  checkpoint=True)
+        _cards(card_run, keys[:7])
+        card_run.dispatch('key', 'q')
+        assert checkpoint.checkpoint_path('cards').exists()
+        resumed = prolix.CardRun(user=None, headless=True, resume=True)
+        assert resumed.seed == 3
+        assert resumed.card.word == card_run.card.word
+        assert resumed.card.side == card_run.card.side
+        assert np.array_equal(resumed.words, card_run.words)
+        assert _cards(resumed, keys[7:]) == expected[7:]
+
+    def test_resume_without_checkpoint(self, deck_path):
+        """ Resuming with no checkpoint should start a new run. """
+        card_run = prolix.CardRun(user=None, headless=True, seed=3,
+                                  resume=True)
+        assert len(card_run.words) == 300
+
+    def test_finished_run_removes_checkpoint(self, deck_path):
+        """ A run with no cards left should not leave a checkpoint. """
+        card_run = prolix.CardRun(user=None, headless=True, seed=3,
+                                  checkpoint=True)
+        card_run.dispatch('key', 'q')
+        path = checkpoint.checkpoint_path('cards')
+        assert path.exists()
+        card_run = prolix.CardRun(user=None, headless=True, resume=True)
+        while not card_run._has_exited:
+            card_run.dispatch('key', 'left')
+        assert not path.exists()
+
+    def test_periodic(self, deck_path, monkeypatch):
+        """ Runs should checkpoint every checkpoint_every inputs. """
+        monkeypatch.setattr(checkpoint, 'checkpoint_every', 2)
+        card_run = prolix.CardRun(user=None, headless=True, seed=3,
+                                  checkpoint=True)
+        card_run.dispatch('key', 'right')
+        assert not checkpoint.checkpoint_path('cards').exists()
+        card_run.dispatch('key', 'left')
+        resumed = prolix.CardRun(user=None, headless=True, resume=True)
+        assert resumed.card.word == card_run.card.word
+
+
+class TestQuiz:
+    """ Tests for resuming quizzes. """
+
+    def test_resume_continues(self, deck_path):
+        """ A resumed quiz should ask the question it was quit on, with
+        the same choices, and then the questions left. """
+        whole = prolix.QuizRun(question_count=10, user=None, headless=True,
+                               seed=5)
+        expected = _questions(whole, 10)
+
+        quiz_run = prolix.QuizRun(question_count=10, user=None,
+                                  headless=True, seed=5, checkpoint=True)
+        _questions(quiz_run, 4)
+        quiz_run.item_chosen(None, (quiz_run.quiz._correct_def_index + 1) % 4)
+        quiz_run.dispatch('key', 'q')
+        resumed = prolix.QuizRun(user=None, headless=True, resume=True)
+        assert resumed.quiz.quiz_words == quiz_run.quiz.quiz_words
+        assert resumed.quiz.quiz_definitions == \
+            quiz_run.quiz.quiz_definitions
+        assert not resumed._answered_correctly
+        assert resumed._remaining_questions == quiz_run._remaining_questions
+        assert _questions(resumed, 6) == expected[4:]
+        assert resumed._has_exited
+        assert not checkpoint.checkpoint_path('quiz').exists()
+
+    def test_user_checkpoints_apart(self, deck_path):
+        """ Each user should resume their own quiz. """
+        runs = {}
+        for name, seed in (('ann', 1), ('bob', 2)):
+            runs[name] = prolix.QuizRun(user=name, headless=True, seed=seed,
+                                        checkpoint=True)
+            runs[name].dispatch('key', 'q')
+        for name, run in runs.items():
+            resumed = prolix.QuizRun(user=name, headless=True, resume=True)
+            assert resumed.seed == run.seed
+            assert resumed.quiz.word == run.quiz.word
+
+    def test_resumed_run_not_recorded(self, deck_path, tmp_path):
+        quiz_run = prolix.QuizRun(user=None, headless=True, checkpoint=True)
+        quiz_run.dispatch('key', 'q')
+        with pytest.raises(ValueError):
+            prolix.QuizRun(user=None, headless=True, resume=True,
+                           record=tmp_path / 'quiz.json')
+
+
+class TestInvalidation:
+    """ Tests for ignoring stale or damaged checkpoints. """
+
+    def test_changed_deck(self, deck_path):
+        """ A checkpoint of an older word snapshot should be ignored. """
+        card_run = prolix.CardRun(user=None, headless=True, seed=3,
+                                  checkpoint=True)
+        card_run.dispatch('key', 'q')
+        path = checkpoint.checkpoint_path('cards')
+        assert checkpoint.load(path) is not None
+        synth.write_deck(deck_path, 250, seed=2)
+        assert checkpoint.load(path) is None
+        card_run = prolix.CardRun(user=None, headless=True, resume=True)
+        assert len(card_run.words) == 250
+
+    def test_damaged(self, deck_path):
+        path = checkpoint.checkpoint_path('cards')
+        path.parent.mkdir(parents=True)
+        path.write_bytes(b'not a checkpoint')
+        assert checkpoint.load(path) is None
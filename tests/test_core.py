@@ -129,3 +129,9 @@ class TestCardRun:
             card_run._handle_input('left')
         assert card_run._has_exited
 
+    def test_remaining(self, card_run):
+        """ remaining should count the cards left without building them. """
+        assert card_run.remaining == len(card_run.words)
+        card_run._handle_input('left')
+        assert card_run.remaining == len(card_run.words)
+
@@ -0,0 +1,151 @@
+"""
+Tests for the compact deck
+"""
+import sys
+
+import numpy as np
+import pytest
+
+import prolix
+from prolix import store
+from prolix.deck import Deck, DeckMix, get_deck
+
+
+@pytest.fixture
+def deck() -> Deck:
+    return get_deck()
+
+
+class TestDeck:
+    """ Tests for the deck itself. """
+
+    def test_matches_words(self, deck):
+        """ Rows should hold the words and definitions of the store. """
+        df = prolix.read_words()
+        assert len(deck) == len(df)
+        assert list(deck.words) == list(df.index)
+        for row in (0, len(df) // 2, len(df) - 1):
+            assert deck.definition(row) == df['definition'].iloc[row]
+            assert deck.row(df.index[row]) == row
+
+    def test_unknown_word(self, deck):
+        with pytest.raises(KeyError):
+            deck.row('not a word at all')
+
+    def test_interned(self, deck):
+        """ Headwords should be interned. """
+        word = deck.words[0]
+        assert sys.intern(''.join(list(word))) is word
+
+    def test_unicode(self):
+        """ Definitions should round trip through the utf-8 buffer. """
+        deck = Deck(['a', 'b', 'c'], ['café', '', 'naïve ✓'])
+        assert [deck.definition(x) for x in range(3)] == \
+            ['café', '', 'naïve ✓']
+
+    def test_shared(self, deck):
+        """ The deck should be built once per word store. """
+        assert get_deck() is deck
+
+
+class TestCompactObjects:
+    """ Questions and cards should refer to deck rows. """
+
+    def test_word_quiz_slots(self):
+        quiz = prolix.WordQuiz(rng=np.random.RandomState(1))
+        assert not hasattr(quiz, '__dict__')
+        assert quiz.quiz_words[quiz._correct_word_index] == quiz.word
+        assert quiz.definition in quiz.quiz_definitions
+
+    def test_card_slots(self):
+        card = prolix.Card(rng=np.random.RandomState(1))
+        assert not hasattr(card, '__dict__')
+        assert card.displayed_text == card.word
+        card.flip()
+        assert card.side == 'definition'
+        assert card.displayed_text == card.formated_definition
+
+    def test_card_run_discards(self):
+        """ Discarded cards should leave the pile. """
+        card_run = prolix.CardRun(user=None, headless=True, seed=2)
+        count = len(card_run.words)
+        word = card_run.card.word
+        card_run.dispatch('key', 'left')
+        assert len(card_run.words) == count - 1
+        assert word not in set(card_run.words)
+
+
+@pytest.mark.deck_data(decks={'sat': (200, 2), 'medical': (100, 3)})
+class TestNamedDecks:
+    """ Tests for loading and mixing named decks. """
+
+    def test_list_and_read(self, deck_path):
+        """ Each deck should have its own store and snapshot. """
+        assert store.list_decks() == ['default', 'medical', 'sat']
+        assert len(prolix.read_words('sat')) == 200
+        assert len(get_deck('medical')) == 100
+        assert get_deck('medical').name == 'medical'
+        assert get_deck() is get_deck('default')
+        with pytest.raises(ValueError):
+            store.get_word_csv_path('../words')
+
+    def test_loaded_lazily(self, deck_path):
+        """ Decks should only be loaded when used. """
+        get_deck()
+        assert prolix.deck.loaded_decks() == ['default']
+        get_deck('sat')
+        assert prolix.deck.loaded_decks() == ['sat', 'default']
+
+    def test_least_recently_used_evicted(self, deck_path, monkeypatch):
+        """ Decks past the memory budget should be dropped, least recently
+        used first. """
+        sizes = {x: get_deck(x).nbytes() for x in ('default', 'sat')}
+        get_deck('default')
+        budget = sizes['default'] + sizes['sat'] + 1
+        monkeypatch.setattr(prolix.deck, 'deck_memory_budget', budget)
+        get_deck('medical')
+        assert prolix.deck.loaded_decks() == ['medical', 'default']
+        assert 'sat' not in store._word_cache
+        assert len(get_deck('sat')) == 200
+
+    def test_mix_weights(self):
+        """ Decks should be chosen in proportion to their weights. """
+        mix = DeckMix({'a': 3, 'b': 1})
+        rng = np.random.RandomState(0)
+        picks = np.array([mix.choose(rng) for _ in range(4000)])
+        assert abs((picks == 0).mean() - 0.75) < 0.03
+        only_b = [mix.choose(rng, np.array([False, True])) for _ in range(50)]
+        assert set(only_b) == {1}
+        with pytest.raises(ValueError):
+            DeckMix({'a': 0})
+
+    def test_single_deck_draws_nothing(self):
+        """ A one deck mix shouldn't change the random stream. """
+        rng = np.random.RandomState(0)
+        assert DeckMix().choose(rng) == 0
+        assert rng.randint(1000) == np.random.RandomState(0).randint(1000)
+
+    def test_quiz_mixes_decks(self, deck_path):
+        """ Questions should come from, and stay within, every deck. """
+        quiz_run = prolix.QuizRun(question_count=40, user=None,
+                                  headless=True, seed=4,
+                                  decks={'sat': 1, 'medical': 1})
+        names = set()
+        for _ in range(40):
+            quiz = quiz_run.quiz
+            names.add(quiz.deck.name)
+            assert set(quiz.quiz_words) <= set(quiz.deck.words)
+            quiz_run._answer_correctly()
+        assert names == {'sat', 'medical'}
+
+    def test_cards_mix_decks(self, deck_path):
+        """ A card run should draw from the piles of every deck. """
+        card_run = prolix.CardRun(user=None, headless=True, seed=4,
+                                  decks=['sat', 'medical'])
+        assert len(card_run.words) == 300
+        names = set()
+        for _ in range(30):
+            names.add(card_run.card.deck.name)
+            card_run.dispatch('key', 'left')
+        assert names == {'sat', 'medical'}
+        assert len(card_run.words) == 270
@@ -0,0 +1,147 @@
+"""
+Tests for the answer event log
+"""
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import prolix
+from prolix import events
+
+
+@pytest.fixture
+def event_log(tmp_path):
+    """ Return an event log writing to a temporary directory. """
+    return events.EventLog(tmp_path, max_bytes=10 * events.event_dtype.itemsize)
+
+
+@pytest.fixture
+def words():
+    """ Return a few words from the store. """
+    return list(prolix.read_words().index[:3])
+
+
+class TestEventLog:
+    """ Tests for writing and scanning segments. """
+
+    def test_round_trip(self, event_log, words):
+        """ Events appended to the log should be returned by scan. """
+        for word in words:
+            event_log.append('bob', word, events.RIGHT, latency=1.5)
+        event_log.seal()
+        array = np.concatenate(list(events.scan(event_log.path)))
+        assert len(array) == len(words)
+        assert (array['user'] == events.hash_name('bob')).all()
+        assert (array['latency'] == 1.5).all()
+
+    def test_segments_rotate(self, event_log, words):
+        """ Segments should be sealed once they exceed max bytes. """
+        for _ in range(25):
+            event_log.append('bob', words[0], events.WRONG)
+        assert len(events.sealed_segments(event_log.path)) == 2
+        assert sum(len(x) for x in events.scan(event_log.path)) == 20
+        event_log.flush()
+        assert sum(len(x) for x in events.scan(event_log.path, True)) == 25
+
+    def test_partial_record_ignored(self, event_log, words):
+        """ A truncated trailing record should not break reading. """
+        event_log.append('bob', words[0], events.RIGHT)
+        path = event_log.seal()
+        with path.open('ab') as fi:
+            fi.write(b'\x00\x01')
+        assert len(events.read_segment(path)) == 1
+
+
+class TestCompaction:
+    """ Tests for folding the event log into the user tables. """
+
+    def test_answers_folded(self, user, words, tmp_path):
+        """ Compacted answers should show up in the quiz table. """
+        log = events.EventLog(tmp_path)
+        log.append(user.name, words[0], events.RIGHT)
+        log.append(user.name, words[1], events.WRONG)
+        log.append(user.name, words[1], events.RETRY)
+        log.seal()
+        assert prolix.user.compact_events(tmp_path) == 1
+        df = user.get_quiz_df()
+        assert df.loc[words[0], 'right'] == 1
+        assert df.loc[words[1], 'right'] == 0
+        assert df.loc[words[1], 'wrong'] == 1
+        assert not events.sealed_segments(tmp_path)
+
+    def test_compacted_in_background(self, user, words, tmp_path):
+        """ Segments compacted on the writer should be moved once its
+        batch commits. """
+        log = events.EventLog(tmp_path)
+        log.append(user.name, words[0], events.RIGHT)
+        log.seal()
+        prolix.user.compact_events_in_background(tmp_path)
+        prolix.user.flush()
+        assert user.get_quiz_df().loc[words[0], 'right'] == 1
+        assert not list(tmp_path.glob('*.seg'))
+        assert len(list(events.compacted_path(tmp_path).glob('*.seg'))) == 1
+
+    def test_dead_process_segment_sealed(self, user, words, tmp_path):
+        """ A segment left open by a process which died should be sealed
+        and compacted, one still being written should not. """
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        log = events.EventLog(tmp_path)
+        log.append(user.name, words[0], events.RIGHT)
+        log.append(user.name, words[1], events.WRONG)
+        log.seal()
+        # a segment of the dead process, with a partly written last record
+        sealed = next(tmp_path.glob('*.seg'))
+        left = tmp_path / f'1_{dead.pid}_0.open'
+        left.write_bytes(sealed.read_bytes() + b'\x01\x02')
+        sealed.unlink()
+        active = events.EventLog(tmp_path)
+        active.append(user.name, words[2], events.RIGHT)
+        active.flush()
+        assert prolix.user.compact_events(tmp_path) == 1
+        df = user.get_quiz_df()
+        assert df.loc[words[0], 'right'] == 1
+        assert df.loc[words[1], 'wrong'] == 1
+        assert df.loc[words[2], 'right'] == 0
+        assert [x.name for x in tmp_path.glob('*.open')] == \
+            [active._active.name]
+        active.seal()
+
+    def test_cards_discarded(self, user, words, tmp_path):
+        """ Swiped away cards should be added to the discarded words. """
+        log = events.EventLog(tmp_path)
+        log.append(user.name, words[0], events.DISCARD, mode='card')
+        log.append(user.name, words[1], events.KEEP, mode='card')
+        log.seal()
+        prolix.user.compact_events(tmp_path)
+        assert user.get_discarded_words() == {words[0]}
+
+    def test_quiz_run_records(self, user):
+        """ Answers in a quiz run should be counted after it exits. """
+        quiz_run = prolix.QuizRun(question_count=3, user=user.name)
+        quiz_run._debug = True
+        asked = []
+        while not quiz_run._has_exited:
+            asked.append(quiz_run.quiz.word)
+            quiz_run._answer_correctly()
+        prolix.user.compact_events()
+        df = user.get_quiz_df()
+        assert df.loc[asked, 'right'].sum() == len(asked)
+
+    def test_shared_ids_skipped(self, user, words, tmp_path, monkeypatch):
+        """ Answers to an id shared by two words should be credited to
+        neither. """
+        hash_name = events.hash_name
+        monkeypatch.setattr(events, 'hash_name', lambda x: 1 if x in
+                            words[:2] else hash_name(x))
+        log = events.EventLog(tmp_path)
+        for word in words:
+            log.append(user.name, word, events.RIGHT)
+        log.seal()
+        with pytest.warns(UserWarning):
+            prolix.user.compact_events(tmp_path)
+        df = user.get_quiz_df()
+        assert df.loc[words[2], 'right'] == 1
+        assert df.loc[words[:2], 'right'].sum() == 0
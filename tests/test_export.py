@@ -0,0 +1,78 @@
+"""
+Tests for exporting quiz sets and card decks
+"""
+import csv
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+import prolix
+from prolix import export
+from prolix.cli import dispatch_cli
+from prolix.utils import _format_defintion
+
+
+class TestQuizSet:
+    """ Tests for building quiz sets. """
+
+    def test_answers_correct(self):
+        """ The answer index should point at the word's definition. """
+        df = prolix.read_words()
+        for question in export.quiz_set(1, questions=10):
+            definition = df.loc[question['word'], 'definition']
+            expected = export._one_line(_format_defintion(definition))
+            assert question['choices'][question['answer']] == expected
+            assert len(set(question['choices'])) == 4
+
+    def test_on_definition(self):
+        """ Quizzing on definitions should offer words as choices. """
+        for question in export.quiz_set(2, questions=5, quiz_on='definition'):
+            assert question['choices'][question['answer']] == question['word']
+
+    def test_seeded(self):
+        """ The same seed should give the same set. """
+        assert export.quiz_set([3, 1]) == export.quiz_set([3, 1])
+        assert export.quiz_set([3, 1]) != export.quiz_set([3, 2])
+
+    def test_small_deck(self):
+        """ Every word of a deck as small as the choices should be a
+        choice. """
+        rng = np.random.RandomState(0)
+        for _ in range(20):
+            ind, inds = export.draw_question(rng, 4, 4)
+            assert sorted(inds) == [0, 1, 2, 3]
+            assert ind in inds
+
+
+class TestExport:
+    """ Tests for writing sets to disk. """
+
+    @pytest.mark.parametrize('kind', export.kinds)
+    @pytest.mark.parametrize('format', list(export.formats))
+    def test_formats(self, tmp_path, kind, format):
+        """ Each set should be written to its own file. """
+        count = export.export(tmp_path, kind, 3, format, processes=1,
+                              questions=5, deck_size=7)
+        paths = sorted(tmp_path.iterdir())
+        assert count == len(paths) == 3
+        assert all(x.suffix == export.formats[format] for x in paths)
+        if format == 'csv':
+            with paths[0].open() as fi:
+                rows = list(csv.reader(fi))
+            assert len(rows) == 1 + (5 if kind == 'quiz' else 7)
+
+    def test_parallel_matches_serial(self, tmp_path):
+        """ Sets written by worker processes should match serial ones. """
+        serial, parallel = tmp_path / 'serial', tmp_path / 'parallel'
+        export.export(serial, count=6, seed=4, processes=1)
+        export.export(parallel, count=6, seed=4, processes=2)
+        for path in serial.iterdir():
+            assert path.read_text() == (parallel / path.name).read_text()
+
+    def test_bad_mode_refused(self, tmp_path):
+        """ An unknown --on should fail in the cli, not in the workers. """
+        result = CliRunner().invoke(dispatch_cli, ['export', str(tmp_path),
+                                                   '--on', 'words'])
+        assert result.exit_code == 2
+        assert not list(tmp_path.iterdir())
@@ -0,0 +1,98 @@
+"""
+Tests for bulk grading of answer sheets
+"""
+import csv
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import prolix
+from prolix import export, grading
+
+
+@pytest.fixture(scope='module')
+def batch() -> grading.QuizBatch:
+    """ The first three quiz sets exported with seed 5. """
+    return grading.QuizBatch.generate(3, questions=5, seed=5)
+
+
+def _letter(ind):
+    return chr(ord('a') + ind)
+
+
+class TestQuizBatch:
+    """ Tests for redrawing exported sets. """
+
+    def test_matches_export(self, batch):
+        """ The batch should have the words and answers of exported sets. """
+        for num in range(1, 4):
+            questions = export.quiz_set([5, num], questions=5)
+            ids = batch.question_ids([num] * 5, range(1, 6))
+            assert list(batch.words[ids]) == [x['word'] for x in questions]
+            assert list(batch.answers[ids]) == [x['answer'] for x in questions]
+
+    def test_bad_question(self, batch):
+        """ Questions outside the batch should raise. """
+        with pytest.raises(ValueError):
+            batch.question_ids([4], [1])
+        with pytest.raises(ValueError):
+            batch.question_ids([1], [6])
+
+
+class TestGrade:
+    """ Tests for grading answers. """
+
+    def test_choice_numbers(self):
+        """ Letters should map to choice indices, anything else to -1. """
+        out = grading.choice_numbers(['a', ' C', 'd', '', 'ab', '3', None])
+        assert list(out) == [0, 2, 3, -1, -1, -1, -1]
+
+    def test_grade(self, batch):
+        """ Right letters should be correct and others wrong. """
+        ids = np.arange(len(batch))
+        right = [_letter(x) for x in batch.answers]
+        wrong = [_letter((x + 1) % 4) for x in batch.answers]
+        users = ['a'] * len(ids) + ['b'] * len(ids)
+        graded = grading.grade(batch, users, np.tile(ids, 2), right + wrong)
+        assert graded['correct'].sum() == len(batch)
+        scores = grading.scores(graded)
+        assert scores.loc['a', 'score'] == 1
+        assert scores.loc['b', 'score'] == 0
+
+    def test_record(self, batch, user):
+        """ Recorded answers should be added to the user's stats. """
+        ids = np.array([0, 1, 1])
+        letters = [_letter(batch.answers[0]), _letter(batch.answers[1]), '']
+        scores = grading.grade_answers(batch, [user.name] * 3, ids, letters)
+        assert scores.loc[user.name, 'correct'] == 2
+        df = user.get_quiz_df()
+        first, second = batch.words[0], batch.words[1]
+        assert df.loc[first, 'right'] == 1
+        if first != second:
+            assert df.loc[second, 'right'] == 1
+            assert df.loc[second, 'wrong'] == 1
+        assert user.get_ability() != 0
+
+
+class TestGradeSheet:
+    """ Tests for grading csv answer sheets. """
+
+    def test_sheet(self, tmp_path, user):
+        """ A sheet of exported csv answers should score full marks. """
+        export.export(tmp_path / 'sets', count=2, format='csv', seed=9,
+                      processes=1, questions=4)
+        rows = []
+        for path in sorted((tmp_path / 'sets').iterdir()):
+            with path.open() as fi:
+                for row in csv.DictReader(fi):
+                    rows.append((user.name, row['set'], row['question'],
+                                 row['answer']))
+        sheet = tmp_path / 'answers.csv'
+        pd.DataFrame(rows, columns=grading.sheet_columns).to_csv(
+            sheet, index=False)
+        scores = grading.grade_sheet(sheet, questions=4, seed=9,
+                                     record_results=False)
+        assert scores.loc[user.name, 'answered'] == 8
+        assert scores.loc[user.name, 'score'] == 1
+        assert not prolix.User(user.name).get_quiz_df()['right'].any()
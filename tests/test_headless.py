@@ -0,0 +1,93 @@
+"""
+Tests for running quizzes and cards without the terminal UI
+"""
+import io
+import json
+
+import pytest
+
+import prolix
+from prolix.headless import run_cards, run_quiz
+
+
+class CorrectAnswers:
+    """ A stdin which always answers the current question correctly. """
+
+    def __init__(self, quiz_run):
+        self.quiz_run = quiz_run
+
+    def readline(self):
+        quiz_run = self.quiz_run
+        return f'{quiz_run.quiz._get_correct_ind(quiz_run._quiz_on) + 1}\n'
+
+
+@pytest.fixture(params=['word', 'definition'])
+def quiz_run(request):
+    """ Return a headless quiz run. """
+    return prolix.QuizRun(question_count=5, quiz_on=request.param,
+                          headless=True)
+
+
+@pytest.fixture
+def card_run():
+    """ Return a headless card run. """
+    return prolix.CardRun(headless=True)
+
+
+class TestHeadlessQuiz:
+    """ Tests for the line oriented quiz. """
+
+    def test_answer_all(self, quiz_run):
+        """ Answering correctly should finish the quiz without widgets. """
+        out = io.StringIO()
+        summary = run_quiz(quiz_run, CorrectAnswers(quiz_run), out)
+        assert summary['asked'] == summary['correct'] == 5
+        assert quiz_run._has_exited
+        assert quiz_run._overlay is None
+        assert out.getvalue().rstrip().endswith('wrong: 0')
+
+    def test_json_output(self, quiz_run):
+        """ Every output line should be a json object. """
+        out = io.StringIO()
+        run_quiz(quiz_run, CorrectAnswers(quiz_run), out, json_mode=True)
+        messages = [json.loads(x) for x in out.getvalue().splitlines()]
+        kinds = [x['type'] for x in messages]
+        assert kinds.count('question') == kinds.count('result') == 5
+        assert messages[-1]['type'] == 'summary'
+        assert all(x['correct'] for x in messages if x['type'] == 'result')
+
+    def test_invalid_and_quit(self, quiz_run):
+        """ Invalid answers are reported, end of input quits the quiz. """
+        out = io.StringIO()
+        summary = run_quiz(quiz_run, io.StringIO('z\n'), out, json_mode=True)
+        messages = [json.loads(x) for x in out.getvalue().splitlines()]
+        assert any(x['type'] == 'error' for x in messages)
+        assert summary['asked'] == 1
+        assert quiz_run._has_exited
+
+    def test_flip_from_next_question(self):
+        """ Flipping should grade the current question in the mode it was
+        shown in and ask the next one in the other mode. """
+        quiz_run = prolix.QuizRun(question_count=2, quiz_on='word',
+                                  headless=True, seed=1)
+        answer = quiz_run.quiz._get_correct_ind('word') + 1
+        out = io.StringIO()
+        run_quiz(quiz_run, io.StringIO(f'f\n{answer}\n'), out,
+                 json_mode=True)
+        messages = [json.loads(x) for x in out.getvalue().splitlines()]
+        results = [x for x in messages if x['type'] == 'result']
+        questions = [x for x in messages if x['type'] == 'question']
+        assert results[0]['correct']
+        assert [x['mode'] for x in questions] == ['word', 'definition']
+
+
+class TestHeadlessCards:
+    """ Tests for the line oriented flash cards. """
+
+    def test_discard_all(self, card_run):
+        """ Discarding every card should end the run. """
+        count = len(card_run.words)
+        stdin = io.StringIO('f\n' + 'd\n' * count)
+        summary = run_cards(card_run, stdin, io.StringIO())
+        assert summary == dict(type='summary', shown=count, discarded=count)
+        assert card_run._has_exited
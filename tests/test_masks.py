@@ -0,0 +1,247 @@
+"""
+Tests for the per-user exclusion masks
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+import prolix
+from prolix import events, masks
+from prolix.cli import dispatch_cli
+from prolix.deck import get_deck
+
+
+@pytest.fixture
+def user_masks(user) -> masks.UserMasks:
+    """ Return the masks of a new user. """
+    return masks.get_masks(user.name)
+
+
+def _excluded(user_masks):
+    """ Return the excluded mask recombined from scratch. """
+    return user_masks.discarded | user_masks.filtered | user_masks.mastered
+
+
+class TestUserMasks:
+    """ Tests for updating and sampling masks. """
+
+    def test_new_user_excludes_nothing(self, user_masks):
+        """ A user with no answers should be able to draw any word, in the
+        same order as an unmasked draw. """
+        assert user_masks.excluded_count == 0
+        deck = get_deck()
+        rngs = np.random.RandomState(1), np.random.RandomState(1)
+        rows = [user_masks.sample(rngs[0]) for _ in range(20)]
+        assert rows == [rngs[1].randint(0, len(deck)) for _ in range(20)]
+
+    def test_mastered_after_streak(self, user_masks):
+        """ A word is excluded once answered right mastery_streak times in a
+        row, and a wrong answer resets the streak. """
+        for _ in range(masks.mastery_streak - 1):
+            user_masks.answer(5, events.RIGHT)
+        user_masks.answer(5, events.WRONG)
+        user_masks.answer(5, events.RETRY)
+        assert not user_masks.excluded[5]
+        for _ in range(masks.mastery_streak):
+            user_masks.answer(5, events.RIGHT)
+        assert user_masks.excluded[5]
+        assert user_masks.excluded_count == 1
+
+    def test_in_place_updates_match_combined(self, user_masks):
+        """ Updating rows in place should match combining the masks. """
+        rng = np.random.RandomState(0)
+        for row in rng.randint(0, len(user_masks), 200):
+            user_masks.answer(row, rng.choice([events.RIGHT, events.WRONG]))
+            if row % 5 == 0:
+                user_masks.discard(row)
+        user_masks.set_filter(get_deck().words[:10])
+        expected = _excluded(user_masks)
+        assert np.array_equal(user_masks.excluded, expected)
+        assert user_masks.excluded_count == expected.sum()
+
+    def test_sample_skips_excluded(self, user_masks):
+        """ Sampled rows should always be eligible, even when most words
+        are excluded. """
+        words = get_deck().words
+        user_masks.set_filter(words[5:])
+        rng = np.random.RandomState(2)
+        rows = {user_masks.sample(rng) for _ in range(200)}
+        assert rows == set(range(5))
+        user_masks.set_filter(words)
+        assert 0 <= user_masks.sample(rng) < len(words)
+
+    def test_state_round_trip(self, user_masks):
+        """ Masks made from a state should draw the same rows. """
+        user_masks.discard(3)
+        user_masks.answer(4, events.RIGHT)
+        state = user_masks.state()
+        again = masks.UserMasks.from_state(state)
+        assert np.array_equal(again.excluded, user_masks.excluded)
+        assert np.array_equal(again.streak, user_masks.streak)
+
+
+class TestPersistence:
+    """ Tests for saving and rebuilding masks. """
+
+    def test_saved_and_reloaded(self, user, user_masks):
+        """ Saved masks should be loaded rather than rebuilt. """
+        user_masks.discard(7)
+        user_masks.answer(8, events.RIGHT)
+        user_masks.save()
+        masks._reset()
+        loaded = masks.get_masks(user.name)
+        assert loaded is not user_masks
+        assert loaded.discarded[7] and loaded.streak[8] == 1
+        assert loaded.excluded_count == 1
+
+    def test_rebuilt_from_tables(self, user):
+        """ Masks with no saved file should be built from the user's
+        discarded words and answers. """
+        words = get_deck().words
+        user.discard_word(words[1])
+        prolix.user.add_answers([(user.name, words[2], True)] * 3)
+        built = masks.get_masks(user.name)
+        assert built.discarded[1]
+        assert built.mastered[2]
+
+    def test_discard_word_updates_masks(self, user, user_masks):
+        """ Discarding through the user should update loaded masks. """
+        word = get_deck().words[9]
+        user.discard_word(word)
+        prolix.user.flush()
+        assert user_masks.discarded[9] and user_masks.excluded[9]
+
+    def test_answers_update_in_place(self, user, user_masks):
+        """ Answers from outside a run should carry on the streaks of the
+        loaded masks, which open runs share. """
+        word = get_deck().words[4]
+        user_masks.answer(4, events.RIGHT)
+        user_masks.answer(4, events.RIGHT)
+        prolix.user.add_answers([(user.name, word, True)])
+        assert masks.get_masks(user.name) is user_masks
+        assert user_masks.mastered[4] and user_masks.excluded[4]
+        assert not user_masks.dirty
+
+    def test_saved_masks_updated(self, user, user_masks):
+        """ Saved masks which aren't loaded should be updated on disk
+        rather than rebuilt. """
+        words = get_deck().words
+        user_masks.answer(6, events.RIGHT)
+        user_masks.answer(6, events.RIGHT)
+        user_masks.save()
+        masks._reset()
+        prolix.user.add_answers([(user.name, words[6], False),
+                                 (user.name, words[6], True)])
+        prolix.user.add_answers([(user.name, words[7], True)])
+        loaded = masks.get_masks(user.name)
+        assert loaded.streak[6] == 1 and loaded.streak[7] == 1
+
+    def test_server_discard_updates_saved(self, user, user_masks,
+                                          run_requests):
+        """ A card discarded through the server should be left out of saved
+        masks. """
+        word = get_deck().words[11]
+        user_masks.dirty = True
+        user_masks.save()
+        masks._reset()
+        run_requests(('POST', '/discard', {'user': user.name, 'word': word}))
+        prolix.user.flush()
+        assert masks.get_masks(user.name).discarded[11]
+
+    def test_answered_word_updates_masks(self, user, user_masks):
+        """ Answers added through the user should carry on streaks. """
+        words = get_deck().words
+        user.correctly_answered_word(words[12])
+        user.correctly_answered_word(words[12])
+        user.incorrectly_answered_word(words[13])
+        prolix.user.flush()
+        assert user_masks.streak[12] == 2
+
+    def test_filter_kept_by_word(self, deck_path, user, user_masks):
+        """ A filter should update the loaded masks and outlive a change to
+        the deck's csv. """
+        words = get_deck().words
+        user.set_filter(words[3:5])
+        assert user_masks.filtered[3] and user_masks.excluded[4]
+        new = pd.DataFrame({'definition': ['n. a word']},
+                           index=pd.Index(['aaaa'], name='word'))
+        prolix.store._commit_word_db(new)
+        rebuilt = masks.get_masks(user.name)
+        assert rebuilt is not user_masks
+        rows = [get_deck().row(x) for x in words[3:5]]
+        assert list(np.flatnonzero(rebuilt.filtered)) == rows
+        user.set_filter()
+        assert user.get_filter() == [] and not rebuilt.filtered.any()
+
+    def test_filter_cli(self, user, user_masks):
+        """ The filter command should add, list and remove words. """
+        words = list(get_deck().words[:3])
+        runner = CliRunner()
+        result = runner.invoke(dispatch_cli, ['filter', '-n', user.name,
+                                              *words])
+        assert result.output.split() == words
+        result = runner.invoke(dispatch_cli, ['filter', '-n', user.name,
+                                              '--remove', words[0]])
+        assert result.output.split() == words[1:]
+        assert list(np.flatnonzero(user_masks.filtered)) == [1, 2]
+        runner.invoke(dispatch_cli, ['filter', '-n', user.name, '--remove'])
+        assert user.get_filter() == []
+
+    def test_counts_of_unknown_order(self, user_masks):
+        """ A word answered wrong should lose its streak, others should
+        extend theirs by their right answers. """
+        words = get_deck().words
+        user_masks.answer(1, events.RIGHT)
+        user_masks.answer(2, events.RIGHT)
+        user_masks.add_counts([(words[1], 5, 1), (words[2], 2, 0)])
+        assert user_masks.streak[1] == 0
+        assert user_masks.streak[2] == 3 and user_masks.excluded[2]
+        user_masks.clear()
+        assert user_masks.excluded_count == 0
+
+
+class TestRuns:
+    """ Tests for runs leaving out excluded words. """
+
+    def test_quiz_skips_excluded(self, user, user_masks):
+        """ A quiz should only ask eligible words. """
+        user_masks.set_filter(get_deck().words[20:])
+        quiz_run = prolix.QuizRun(question_count=10, user=user.name,
+                                  headless=True, seed=1)
+        for _ in range(10):
+            assert quiz_run.quiz.row < 20
+            quiz_run._answer_correctly()
+
+    def test_cards_skip_excluded(self, user, user_masks):
+        """ Discarded cards should not be drawn by later runs. """
+        card_run = prolix.CardRun(user=user.name, headless=True, seed=1)
+        row = card_run.card.row
+        card_run.dispatch('key', 'left')
+        assert user_masks.discarded[row]
+        again = prolix.CardRun(user=user.name, headless=True, seed=1)
+        assert row not in again._piles[0]
+        assert len(again._piles[0]) == len(get_deck()) - 1
+
+    def test_exclude_off(self, user, user_masks):
+        """ Runs with exclude False should draw from the whole deck. """
+        user_masks.set_filter(get_deck().words[1:])
+        card_run = prolix.CardRun(user=user.name, headless=True,
+                                  exclude=False)
+        assert len(card_run._piles[0]) == len(get_deck())
+
+    def test_replay_uses_recorded_exclusions(self, user, user_masks,
+                                             tmp_path):
+        """ A replay should draw the words the recorded run drew even if
+        the user's masks changed since. """
+        from prolix import session
+        path = tmp_path / 'cards.json'
+        user_masks.set_filter(get_deck().words[30:])
+        card_run = prolix.CardRun(user=user.name, headless=True,
+                                  record=path)
+        for key in ('right', 'left', 'right', 'q'):
+            card_run.dispatch('key', key)
+        user_masks.set_filter()
+        replayed = session.replay(path, headless=True)['run']
+        assert replayed.card.word == card_run.card.word
+        assert np.array_equal(replayed._piles[0], card_run._piles[0])
@@ -0,0 +1,168 @@
+"""
+Tests for the metrics registry and its exports
+"""
+import asyncio
+import json
+import urllib.request
+
+import pytest
+
+import prolix
+from prolix import metrics, profiling, server
+
+
+@pytest.fixture
+def scratch():
+    """ Drop the test_ metrics a test registers when it finishes. """
+    yield metrics
+    for name in [x for x in metrics.registry if x.startswith('test_')]:
+        del metrics.registry[name]
+
+
+@pytest.fixture
+def metered(scratch):
+    """ Turn metrics on, turn them off and forget values and test_ metrics
+    when finished. """
+    was_enabled = metrics.is_enabled()
+    metrics.reset()
+    metrics.enable()
+    yield metrics
+    if not was_enabled:
+        metrics.disable()
+    metrics.reset()
+
+
+def _value(name: str, labels: tuple = ()):
+    """ Return the value of a registered metric. """
+    return metrics.registry[name].values().get(labels, 0)
+
+
+def _parse(text: str) -> dict:
+    """ Return {sample with labels: value} from Prometheus text. """
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            sample, value = line.rsplit(' ', 1)
+            out[sample] = float(value)
+    return out
+
+
+class TestMetrics:
+    """ Tests for counters, gauges and histograms. """
+
+    def test_disabled_not_recorded(self, scratch):
+        """ Nothing should be recorded while metrics are off. """
+        if metrics.is_enabled():
+            pytest.skip('metrics enabled by the environment')
+        counter = metrics.counter('test_disabled_total', 'test')
+        counter.inc()
+        metrics.histogram('test_disabled_seconds', 'test').observe(1.0)
+        assert counter.values() == {}
+        assert metrics.registry['test_disabled_seconds'].values() == {}
+
+    def test_prometheus_text(self, metered):
+        """ Samples should be exported with labels and cumulative
+        buckets. """
+        counter = metrics.counter('test_things_total', 'things "done"',
+                                  labels=('kind',))
+        counter.inc(labels=('a',))
+        counter.inc(2, labels=('b',))
+        histogram = metrics.histogram('test_wait_seconds', 'waits',
+                                      buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value)
+        metrics.gauge('test_depth', 'depth', func=lambda: 7)
+        text = metrics.to_prometheus()
+        assert '# HELP test_things_total things \\"done\\"' in text
+        assert '# TYPE test_wait_seconds histogram' in text
+        samples = _parse(text)
+        assert samples['test_things_total{kind="b"}'] == 2
+        assert samples['test_wait_seconds_bucket{le="0.1"}'] == 1
+        assert samples['test_wait_seconds_bucket{le="1.0"}'] == 2
+        assert samples['test_wait_seconds_bucket{le="+Inf"}'] == 3
+        assert samples['test_wait_seconds_count'] == 3
+        assert samples['test_wait_seconds_sum'] == pytest.approx(5.55)
+        assert samples['test_depth'] == 7
+
+    def test_kind_conflict(self, scratch):
+        metrics.counter('test_conflict', 'test')
+        with pytest.raises(ValueError):
+            metrics.gauge('test_conflict', 'test')
+
+
+class TestHotPaths:
+    """ Tests for the metrics updated by prolix. """
+
+    def test_quiz_run(self, metered, user):
+        """ A quiz should count questions, answers and word cache hits. """
+        prolix.read_words()
+        hits = _value('prolix_read_words_total', ('hit',))
+        quiz_run = prolix.QuizRun(question_count=2, user=user.name,
+                                  headless=True)
+        while not quiz_run._has_exited:
+            quiz_run._answer_correctly()
+        prolix.read_words()
+        prolix.user.flush()
+        assert _value('prolix_questions_total', ('word',)) == 3
+        assert _value('prolix_answers_total', ('word', 'right')) == 2
+        assert _value('prolix_read_words_total', ('hit',)) > hits
+
+    def test_database_writes(self, metered, user):
+        """ Queued writes should be timed from queuing to commit. """
+        user.correctly_answered_word(prolix.read_words().index[0])
+        prolix.user.flush()
+        counts = _value('prolix_db_write_latency_seconds')
+        assert sum(counts[:-1]) >= 1
+        assert _value('prolix_db_queue_depth') == 0
+
+
+    def test_phases_observed(self, metered):
+        """ Profiling phases should feed the phase histogram with metrics
+        on, whether or not profiling is. """
+        if profiling.is_enabled():
+            pytest.skip('profiling enabled by the environment')
+        with profiling.phase('snapshot_load'):
+            pass
+        profiling.timed('compaction')(lambda: None)()
+        for phase in ('snapshot_load', 'compaction'):
+            assert sum(_value('prolix_phase_seconds', (phase,))[:-1]) == 1
+        assert profiling.get_timer('snapshot_load').count == 0
+
+
+class TestExport:
+    """ Tests for writing and serving metrics. """
+
+    def test_files(self, metered, tmp_path):
+        """ Metrics should be written as Prometheus text and json. """
+        metrics.counter('test_files_total', 'test').inc()
+        metrics.write_prometheus(tmp_path / 'prolix.prom')
+        metrics.write_json(tmp_path / 'prolix.json')
+        text = (tmp_path / 'prolix.prom').read_text()
+        assert _parse(text)['test_files_total'] == 1
+        data = json.loads((tmp_path / 'prolix.json').read_text())
+        assert data['test_files_total']['values'] == {'': 1}
+
+    def test_endpoint(self, metered):
+        """ The local endpoint should serve the Prometheus text. """
+        metrics.counter('test_served_total', 'test').inc()
+        server = metrics.serve(port=0)
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+            with urllib.request.urlopen(url) as response:
+                assert response.headers['Content-Type'] == \
+                    metrics.content_type
+                text = response.read().decode('utf8')
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert _parse(text)['test_served_total'] == 1
+
+    def test_server_route(self, metered, user, run_requests):
+        """ The prolix server should count requests and serve metrics. """
+        run_requests(('GET', '/health', None), ('GET', '/nowhere', None))
+        assert _value('prolix_server_requests_total', ('/health', '200')) == 1
+        assert _value('prolix_server_requests_total', ('other', '404')) == 1
+        text = asyncio.run(server.ProlixServer().metrics({}))
+        assert 'prolix_server_requests_total{path="/health"' in text
+        response = server._response(200, text)
+        assert metrics.content_type.encode() in response
@@ -0,0 +1,72 @@
+"""
+Tests for the hot path instrumentation
+"""
+import io
+
+import pytest
+
+import prolix
+from prolix import profiling
+
+
+@pytest.fixture
+def profiled():
+    """ Turn profiling on, turn it off and forget timings when finished. """
+    was_enabled = profiling.is_enabled()
+    profiling.reset()
+    profiling.enable()
+    yield profiling
+    if not was_enabled:
+        profiling.disable()
+    profiling.reset()
+
+
+class TestTimer:
+    """ Tests for counters and histograms. """
+
+    def test_percentiles(self):
+        """ Percentiles should be bounded by the histogram buckets. """
+        timer = profiling.Timer('test')
+        for _ in range(99):
+            timer.record(0.000_010)
+        timer.record(0.5)
+        summary = timer.summary()
+        assert summary['count'] == 100
+        assert 0.000_010 <= summary['p50'] < 0.000_020
+        assert summary['max'] == 0.5
+
+    def test_disabled_not_recorded(self):
+        """ Nothing should be recorded while profiling is off. """
+        if profiling.is_enabled():
+            pytest.skip('profiling enabled by the environment')
+        func = profiling.timed('disabled_phase')(lambda: 1)
+        assert func() == 1
+        with profiling.phase('disabled_phase'):
+            pass
+        assert profiling.get_timer('disabled_phase').count == 0
+
+
+class TestPhases:
+    """ Tests for timing prolix's phases. """
+
+    def test_quiz_phases(self, profiled, user):
+        """ A quiz run should time question builds and database writes. """
+        # formatted definitions are cached on the deck across runs
+        prolix.deck.get_deck().formatted.cache_clear()
+        quiz_run = prolix.QuizRun(question_count=2, user=user.name)
+        quiz_run._debug = True
+        while not quiz_run._has_exited:
+            quiz_run._answer_correctly()
+        stats = profiled.summary()
+        assert stats['question_build']['count'] >= 2
+        assert stats['format_definition']['count'] >= 2
+        assert stats['widget_build']['count'] >= 2
+        assert 'database_write' in stats
+
+    def test_write_summary(self, profiled):
+        """ The summary should list every phase which ran. """
+        with profiled.phase('snapshot_load'):
+            pass
+        stream = io.StringIO()
+        profiled.write_summary(stream)
+        assert 'snapshot_load' in stream.getvalue()
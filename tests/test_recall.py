@@ -0,0 +1,112 @@
+"""
+Tests for typed recall quizzes
+"""
+import io
+
+import pytest
+
+import prolix
+from prolix import events, recall
+from prolix.headless import run_recall
+
+
+class TestGrading:
+    """ Tests for edit distances and grades. """
+
+    @pytest.mark.parametrize('first, second, distance', [
+        ('kitten', 'sitting', 3),
+        ('abate', 'abate', 0),
+        ('abate', 'abat', 1),
+        ('', 'abc', 3),
+        ('flaw', 'lawn', 2),
+    ])
+    def test_levenshtein(self, first, second, distance):
+        """ Edit distances should match known values. """
+        assert recall.levenshtein(first, second) == distance
+        assert recall.levenshtein(second, first) == distance
+
+    def test_levenshtein_bound(self):
+        """ A bounded distance should stop at one more than the bound. """
+        assert recall.levenshtein('abcdefgh', 'zyxwvuts', 2) == 3
+
+    @pytest.mark.parametrize('answer, expected', [
+        ('elucidate', recall.EXACT),
+        (' Elucidate ', recall.EXACT),
+        ('elucidat', recall.CLOSE),
+        ('eluicdate', recall.CLOSE),
+        ('abate', recall.WRONG),
+    ])
+    def test_grade(self, answer, expected):
+        """ Typos should be close, other words wrong. """
+        assert recall.grade(answer, 'elucidate')[0] == expected
+
+
+class TestBKTree:
+    """ Tests for near miss searches. """
+
+    def test_matches_brute_force(self):
+        """ The tree should find the same words as checking every word. """
+        words = list(prolix.read_words().index)
+        tree = recall.BKTree(words)
+        for query in ('abate', 'ebulient', 'xyz', 'lurd'):
+            expected = sorted((recall.levenshtein(query, x), x)
+                              for x in words
+                              if recall.levenshtein(query, x) <= 2)
+            assert tree.search(query, 2) == expected
+
+    def test_did_you_mean(self):
+        """ Misspelled words should suggest the word. """
+        assert recall.did_you_mean('elucdate')[0] == 'elucidate'
+
+
+class TestRecallRun:
+    """ Tests for the recall quiz. """
+
+    def test_answers_recorded(self, user):
+        """ Exact and close answers should count as right. """
+        recall_run = prolix.RecallRun(question_count=3, user=user.name,
+                                      seed=1)
+        recall_run._debug = True
+        first = recall_run.word
+        recall_run.dispatch('text', first)
+        assert recall_run.result['grade'] == recall.EXACT
+        second = recall_run.word
+        recall_run.dispatch('text', second[:-1] if len(second) > 3 else second)
+        recall_run.dispatch('text', 'qqqqqqqq')
+        assert recall_run.result['grade'] == recall.WRONG
+        assert recall_run._has_exited
+        prolix.user.compact_events()
+        df = user.get_quiz_df()
+        assert df.loc[first, 'right'] == 1
+
+    def test_headless(self, user):
+        """ The headless driver should grade each line. """
+        recall_run = prolix.RecallRun(question_count=2, user=user.name,
+                                      headless=True, seed=2)
+        answers = io.StringIO(f'{recall_run.word}\nnope\n')
+        summary = run_recall(recall_run, answers, io.StringIO())
+        assert summary == dict(type='summary', asked=2, exact=1, close=0,
+                               wrong=1)
+
+    @pytest.mark.deck_data(decks={'sat': (200, 2)})
+    def test_suggestions_from_deck(self, deck_path, user):
+        """ A wrong answer should be matched against the words of the deck
+        the question came from. """
+        recall_run = prolix.RecallRun(question_count=2, user=user.name,
+                                      seed=1, decks=['sat'])
+        words = set(prolix.read_words('sat').index)
+        other = next(x for x in sorted(words - {recall_run.word})
+                     if x not in prolix.read_words().index)
+        recall_run.dispatch('text', other)
+        assert recall_run.result['grade'] == recall.WRONG
+        assert recall_run.result['suggestions'][0] == other
+        assert set(recall_run.result['suggestions']) <= words
+
+    def test_close_outcome_folded(self, user, tmp_path):
+        """ Close answers in the event log should be counted as right. """
+        word = prolix.read_words().index[0]
+        log = events.EventLog(tmp_path)
+        log.append(user.name, word, events.CLOSE, mode='recall')
+        log.seal()
+        prolix.user.compact_events(tmp_path)
+        assert user.get_quiz_df().loc[word, 'right'] == 1
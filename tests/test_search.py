@@ -0,0 +1,68 @@
+"""
+Tests for searching words and definitions
+"""
+import pytest
+
+import prolix
+from prolix import search
+
+
+class TestWordSearch:
+    """ Tests for finding words. """
+
+    def test_fuzzy_misspelling(self):
+        """ A misspelled word should rank the real word first. """
+        df = search.search('elucdate')
+        assert df.index[0] == 'elucidate'
+        assert df['score'].is_monotonic_decreasing
+
+    def test_substring(self):
+        """ Exact search should return only words containing the query. """
+        df = search.search('ate', fuzzy=False, limit=1000)
+        words = prolix.read_words().index
+        assert set(df.index) == {x for x in words if 'ate' in x}
+
+    def test_short_substring(self):
+        """ Queries shorter than a trigram should still match. """
+        df = search.search('q', fuzzy=False, limit=1000)
+        assert len(df) and all('q' in x for x in df.index)
+
+
+class TestDefinitionSearch:
+    """ Tests for finding words by their definitions. """
+
+    def test_all_terms(self):
+        """ Every term should be in the definitions found. """
+        df = search.search('lacking taste', definitions=True)
+        assert len(df)
+        for definition in df['definition']:
+            assert 'lacking' in definition and 'taste' in definition
+
+    def test_prefix(self):
+        """ A term ending in * should match tokens starting with it. """
+        df = search.search('merr*', definitions=True)
+        assert 'mirth' in df.index
+
+    def test_part_of_speech_not_indexed(self):
+        """ The part of speech keys are not part of the definitions. """
+        assert search.search('noun', definitions=True).empty
+
+
+@pytest.mark.deck_data(size=500, seed=5)
+class TestIndexFile:
+    """ Tests for saving the index next to the store. """
+
+    def test_saved_and_reloaded(self, deck_path):
+        """ The index should be saved and reloaded until the csv changes. """
+        index = search.get_index()
+        path = deck_path / 'words.index.npz'
+        assert path.exists()
+        search._reset()
+        loaded = search.get_index()
+        assert loaded is not index
+        assert (loaded.words == index.words).all()
+        # adding a word changes the csv so the index is rebuilt
+        df = prolix.read_words()
+        new = df.iloc[:1].rename(index={df.index[0]: 'zzzyzzx'})
+        prolix.store._commit_word_db(new)
+        assert search.search('zzzyzzx').index[0] == 'zzzyzzx'
@@ -0,0 +1,131 @@
+"""
+Tests for the HTTP/JSON server and its load test client
+"""
+import asyncio
+
+import pytest
+
+import prolix
+from prolix import server
+
+
+class TestEndpoints:
+    """ Tests for each endpoint. """
+
+    def test_health(self, user, run_requests):
+        """ Health should report the words being served. """
+        [(status, body)] = run_requests(('GET', '/health', None))
+        assert status == 200
+        assert body['words'] == len(prolix.read_words())
+
+    def test_question_answer_stats(self, user, run_requests):
+        """ An answered question should show up in the user's stats. """
+        responses = run_requests(
+            ('POST', '/question', {'user': user.name}),
+            ('POST', '/answer', lambda out: {'id': out[0][1]['id'],
+                                             'choice': 'a'}),
+            ('GET', f'/stats?user={user.name}', None),
+        )
+        (_, question), (_, answer), (_, stats) = responses
+        assert len(question['choices']) == 4
+        assert answer['correct'] == (answer['answer'] == 0)
+        assert stats['answered'] == 1
+        assert stats['right'] == int(answer['correct'])
+        df = user.get_quiz_df()
+        assert df.loc[answer['word']].sum() == 1
+
+    def test_answer_once(self, user, run_requests):
+        """ A question can only be answered once. """
+        responses = run_requests(
+            ('POST', '/question', {'user': user.name, 'on': 'definition'}),
+            ('POST', '/answer', lambda out: {'id': out[0][1]['id'],
+                                             'choice': 1}),
+            ('POST', '/answer', lambda out: {'id': out[0][1]['id'],
+                                             'choice': 1}),
+        )
+        assert [x[0] for x in responses] == [200, 200, 400]
+
+    def test_cards_skip_discarded(self, user, run_requests):
+        """ Discarded cards should not be drawn again. """
+        words = prolix.read_words().index
+        discards = [('POST', '/discard', {'user': user.name, 'word': x})
+                    for x in words[:-1]]
+        responses = run_requests(*discards,
+                                 ('POST', '/card', {'user': user.name}))
+        assert responses[-1][1]['word'] == words[-1]
+        assert user.get_discarded_words() == set(words[:-1])
+
+    def test_cards_skip_dropped_discards(self, user):
+        """ Discarded words no longer in the words should not count as
+        discarded cards. """
+        words = prolix.read_words().index
+
+        async def _main():
+            app = server.ProlixServer(port=0, seed=3)
+            await app.start()
+            app._discarded[user.name] = set(words[:-1]) | {'zz1', 'zz2'}
+            try:
+                card = await app.card({'user': user.name})
+                app._discarded[user.name].add(words[-1])
+                with pytest.raises(server.HTTPError):
+                    await app.card({'user': user.name})
+            finally:
+                await app.close()
+            return card
+
+        assert asyncio.run(_main())['word'] == words[-1]
+
+    @pytest.mark.parametrize('method, path, data, status', [
+        ('GET', '/nowhere', None, 404),
+        ('GET', '/question', None, 405),
+        ('POST', '/question', {'user': 'no spaces'}, 400),
+        ('POST', '/question', {'user': 'bob', 'choices': 1}, 400),
+        ('POST', '/answer', {'id': 'nope', 'choice': 0}, 400),
+    ])
+    def test_errors(self, user, method, path, data, status, run_requests):
+        """ Bad requests should get an error status and message. """
+        [(got, body)] = run_requests((method, path, data))
+        assert got == status
+        assert body['error']
+
+
+def test_closed_connection():
+    """ A closed connection should be a failed request, not an error. """
+
+    async def _main():
+        async def _hang_up(reader, writer):
+            writer.close()
+
+        app = await asyncio.start_server(_hang_up, '127.0.0.1', 0)
+        client = server._Client('127.0.0.1', app.sockets[0].getsockname()[1])
+        try:
+            return await client.request('GET', '/health')
+        finally:
+            client.close()
+            app.close()
+            await app.wait_closed()
+
+    assert asyncio.run(_main()) == (0, None)
+
+
+def test_load_test(user):
+    """ The load test should report the requests it made. """
+
+    async def _main():
+        app = server.ProlixServer(port=0)
+        await app.start()
+        try:
+            return await server.load_test(port=app.port, learners=1,
+                                          requests=20, user_prefix=user.name)
+        finally:
+            await app.close()
+
+    name = f'{user.name}0'
+    try:
+        result = asyncio.run(_main())
+        assert result['requests'] == 20
+        assert result['failures'] == 0
+        assert result['p50'] <= result['p99'] <= result['max']
+    finally:
+        prolix.user.flush()
+        prolix.User(name).delete_user()
@@ -0,0 +1,76 @@
+"""
+Tests for seeding, recording and replaying sessions
+"""
+import io
+import json
+
+import prolix
+from prolix import session
+from prolix.headless import run_quiz
+
+
+def _questions(quiz_run, count=3):
+    """ Return the words of the next count questions, answering correctly. """
+    out = []
+    for _ in range(count):
+        out.append((quiz_run.quiz.word, tuple(quiz_run.quiz.quiz_words)))
+        quiz_run._answer_correctly()
+    return out
+
+
+class TestSeed:
+    """ Tests for seeded runs. """
+
+    def test_same_seed_same_questions(self, user):
+        """ Runs with the same seed should ask the same questions. """
+        runs = [prolix.QuizRun(question_count=10, user=user.name, seed=3)
+                for _ in range(2)]
+        for run in runs:
+            run._debug = True
+        assert _questions(runs[0]) == _questions(runs[1])
+
+    def test_seed_drawn(self):
+        """ Unseeded runs should still have a seed to reproduce them. """
+        card_run = prolix.CardRun(headless=True)
+        again = prolix.CardRun(headless=True, seed=card_run.seed)
+        assert card_run.card.word == again.card.word
+
+
+class TestRecordReplay:
+    """ Tests for recording a session and replaying it. """
+
+    def test_replay_quiz(self, deck_path, user, tmp_path):
+        """ A replayed quiz should ask the same questions with the same
+        outcomes. """
+        path = tmp_path / 'quiz.json'
+        # a seed whose quiz is still going when the answers run out
+        quiz_run = prolix.QuizRun(question_count=4, user=user.name,
+                                  headless=True, record=path, seed=2)
+        answers = io.StringIO('1\n2\nf\n3\n1\n2\n1\n4\n3\n2\n1\n4\nq\n')
+        summary = run_quiz(quiz_run, answers, io.StringIO())
+        recording = json.loads(path.read_text())
+        assert recording['seed'] == quiz_run.seed
+        assert recording['inputs'][-1][1:] == ['key', 'q']
+
+        for headless in (True, False):
+            out = session.replay(path, headless=headless)
+            replayed = out['run']
+            assert replayed._has_exited
+            assert replayed.quiz.word == quiz_run.quiz.word
+            assert replayed._remaining_questions == \
+                quiz_run._remaining_questions
+        assert out['inputs'] == len(recording['inputs'])
+        assert summary['asked'] >= 1
+
+    def test_nested_inputs_not_recorded(self, user, tmp_path):
+        """ A number key clicking a button should record only the key. """
+        path = tmp_path / 'quiz.json'
+        quiz_run = prolix.QuizRun(question_count=3, user=user.name,
+                                  record=path)
+        quiz_run._debug = True
+        quiz_run.dispatch('key', '1')
+        quiz_run.dispatch('key', '1')  # second press clicks the button
+        quiz_run.dispatch('key', 'q')
+        recording = session.load_session(path)
+        assert [x[1:] for x in recording['inputs']] == \
+            [['key', '1'], ['key', '1'], ['key', 'q']]
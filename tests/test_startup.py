@@ -0,0 +1,74 @@
+"""
+Tests for import time and startup side effects
+"""
+import subprocess
+import sys
+from contextlib import suppress
+
+import pytest
+
+from conftest import PKG_PATH
+
+# modules which must not be imported just to start the cli
+heavy_modules = ('pandas', 'numpy', 'urwid', 'peewee', 'colorama', 'pyarrow')
+
+
+def run_python(*args) -> subprocess.CompletedProcess:
+    """ Run a fresh python interpreter in the package directory. """
+    cmd = [sys.executable, *args]
+    return subprocess.run(cmd, cwd=str(PKG_PATH), capture_output=True,
+                          text=True)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """ Return {module: cumulative microseconds} from -X importtime output. """
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        with suppress(ValueError):  # skip the header
+            out[name.strip()] = int(cumulative)
+    return out
+
+
+@pytest.fixture(scope='module', params=['prolix', 'prolix.cli'])
+def import_times(request):
+    """ Return the import times of a fresh import of a prolix module. """
+    proc = run_python('-X', 'importtime', '-c', f'import {request.param}')
+    assert proc.returncode == 0, proc.stderr
+    return request.param, parse_importtime(proc.stderr)
+
+
+class TestImportTime:
+    """ Regression tests for the cost of importing prolix. """
+
+    def test_no_heavy_imports(self, import_times):
+        """ Heavy dependencies should only be imported when used. """
+        _, times = import_times
+        assert not set(heavy_modules) & set(times)
+
+    def test_only_prolix_imported(self, import_times):
+        """ Importing should not import any prolix submodule it doesn't
+        need, the cli only its own module. """
+        name, times = import_times
+        loaded = {x for x in times if x.startswith('prolix.')}
+        assert loaded <= {'prolix.version', 'prolix.cli'} | {name}
+
+    def test_database_not_opened(self):
+        """ Importing the user module should not open the database. """
+        code = 'import prolix.user as u; assert u.database.deferred'
+        proc = run_python('-c', code)
+        assert proc.returncode == 0, proc.stderr
+
+
+class TestStartupTime:
+    """ Tests for the cli cold start check. """
+
+    def test_cli_reports_startup(self):
+        """ The startup check should report the time and exit with 1 only
+        if it missed the target, which is timed by the benchmarks rather
+        than asserted here. """
+        proc = run_python('-m', 'prolix.cli', '--startup-time')
+        assert proc.returncode in (0, 1), proc.stderr
+        assert proc.stdout.startswith('startup:')
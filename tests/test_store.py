@@ -1,6 +1,7 @@
 """
 Tests for core of prolix
 """
+import os
 from pathlib import Path
 
 import pandas as pd
@@ -34,3 +35,109 @@ def test_word_df(populated_word_db):
     df = populated_word_db
     assert isinstance(df, pd.DataFrame)
     assert set(df.columns).issuperset({'definition'}), 'words must have definition'
+
+
+# --- concurrent readers and writers
+
+WRITERS = 3
+READERS = 3
+BATCHES = 6
+BATCH_SIZE = 20
+
+
+def _definition(word: str) -> str:
+    return f"{{'Noun': ['the meaning of {word}']}}"
+
+
+def _words_ok(df) -> bool:
+    """ Return True if every word has its whole definition. """
+    return bool((df['definition'] == df.index.map(_definition)).all())
+
+
+def _writer(path, num: int):
+    """ Add batches of new words to the store. """
+    prolix.set_data_path(path)
+    for batch in range(BATCHES):
+        words = [f'writer{num}batch{batch}word{x}' for x in range(BATCH_SIZE)]
+        df = pd.DataFrame({'definition': [_definition(x) for x in words]},
+                          index=pd.Index(words, name='word'))
+        prolix.store._commit_word_db(df)
+
+
+def _reader(path, done, errors):
+    """ Read the store until the writers are done, counting bad reads. """
+    prolix.set_data_path(path)
+    last = 0
+    while not done.is_set():
+        for df in (prolix.read_words(), prolix.store._load_words()[0]):
+            if not _words_ok(df) or len(df) < last:
+                errors.put(len(df))
+            last = max(last, len(df))
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    """ A data directory with a small deck, restore when finished. """
+    words = [f'start{x}' for x in range(300)]
+    df = pd.DataFrame({'word': words,
+                       'definition': [_definition(x) for x in words]})
+    df.to_csv(tmp_path / 'words.csv', index=False)
+    prolix.set_data_path(tmp_path)
+    yield tmp_path
+    prolix.set_data_path(None)
+
+
+class TestConcurrentWrites:
+    """ Tests for atomic, locked writes to the word store. """
+
+    def test_readers_and_writers(self, store_path):
+        """ Readers in other processes should only see whole snapshots,
+        and writers in other processes should not lose each other's
+        words. """
+        import multiprocessing
+        ctx = multiprocessing.get_context('fork')
+        done, errors = ctx.Event(), ctx.Queue()
+        readers = [ctx.Process(target=_reader, args=(store_path, done, errors))
+                   for _ in range(READERS)]
+        writers = [ctx.Process(target=_writer, args=(store_path, num))
+                   for num in range(WRITERS)]
+        for proc in readers + writers:
+            proc.start()
+        for proc in writers:
+            proc.join(60)
+        done.set()
+        for proc in readers:
+            proc.join(60)
+        assert all(x.exitcode == 0 for x in readers + writers)
+        assert errors.empty()
+        df = prolix.read_words()
+        assert len(df) == 300 + WRITERS * BATCHES * BATCH_SIZE
+        assert _words_ok(df)
+
+    def test_failed_write_keeps_store(self, store_path):
+        """ A write which fails part way should leave the old csv. """
+        before = (store_path / 'words.csv').read_bytes()
+        with pytest.raises(RuntimeError):
+            with prolix.utils.atomic_write(store_path / 'words.csv') as fi:
+                fi.write(b'word,definition\n')
+                raise RuntimeError('disk full')
+        assert (store_path / 'words.csv').read_bytes() == before
+        assert [x.name for x in store_path.iterdir()] == ['words.csv']
+
+    def test_replaced_file_reread(self, store_path):
+        """ Readers should switch to a new csv once it replaces the old
+        one, even if its modification time didn't change. """
+        path = store_path / 'words.csv'
+        df = prolix.read_words()
+        stat = path.stat()
+        extra = pd.DataFrame({'definition': [_definition('extra')]},
+                             index=pd.Index(['extra'], name='word'))
+        prolix.store._commit_word_db(extra)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert len(prolix.read_words()) == len(df) + 1
+
+    def test_lock_reentrant(self, store_path):
+        with prolix.store.store_lock():
+            with prolix.store.store_lock():
+                prolix.store._commit_word_db(prolix.read_words().iloc[:1])
+        assert len(prolix.read_words()) == 300
@@ -0,0 +1,170 @@
+"""
+Tests for syncing stats between machines
+"""
+import pytest
+
+import prolix
+from prolix import events, sync, synth
+
+
+@pytest.fixture
+def machines(tmp_path):
+    """ Return the data paths of three machines with the same deck,
+    restore the data path when finished. """
+    paths = [tmp_path / name for name in ('laptop', 'lab', 'home')]
+    for path in paths:
+        synth.write_deck(path, 100, seed=1)
+    yield paths
+    prolix.set_data_path(None)
+
+
+@pytest.fixture
+def words(machines) -> list:
+    """ Return a few words of the machines' deck. """
+    prolix.set_data_path(machines[0])
+    return list(prolix.read_words().index[:5])
+
+
+def _answer(path, answers):
+    """ Add (user, word, correct) answers on a machine. """
+    prolix.set_data_path(path)
+    prolix.user.add_answers(answers)
+
+
+def _export(path, delta, peer=None) -> dict:
+    """ Export a delta from a machine, return its counts and device id. """
+    prolix.set_data_path(path)
+    counts = sync.export_delta(delta, peer=peer)
+    return dict(counts, device=sync.device_id())
+
+
+def _import(path, delta) -> dict:
+    prolix.set_data_path(path)
+    return sync.import_delta(delta)
+
+
+def _counts(path, name: str, word: str) -> tuple:
+    """ Return the right and wrong counts of a user's word on a machine. """
+    prolix.set_data_path(path)
+    row = prolix.User(name).get_quiz_df().loc[word]
+    return int(row['right']), int(row['wrong'])
+
+
+class TestCounters:
+    """ Tests for merging right and wrong counts. """
+
+    def test_counts_summed(self, machines, words, tmp_path):
+        """ Answers made on two machines should add up on both. """
+        laptop, lab, _ = machines
+        _answer(laptop, [('ann', words[0], True)] * 2)
+        _answer(lab, [('ann', words[0], False), ('ann', words[1], True)])
+        sent = _export(laptop, tmp_path / 'laptop.npz')
+        _import(lab, tmp_path / 'laptop.npz')
+        _export(lab, tmp_path / 'lab.npz', peer=sent['device'])
+        _import(laptop, tmp_path / 'lab.npz')
+        for path in (laptop, lab):
+            assert _counts(path, 'ann', words[0]) == (2, 1)
+            assert _counts(path, 'ann', words[1]) == (1, 0)
+
+    def test_import_idempotent(self, machines, words, tmp_path):
+        """ Importing deltas again, or out of order, should change
+        nothing. """
+        laptop, lab, _ = machines
+        _answer(laptop, [('ann', words[0], True)])
+        _export(laptop, tmp_path / 'first.npz')
+        _answer(laptop, [('ann', words[0], True)])
+        _export(laptop, tmp_path / 'second.npz')
+        _import(lab, tmp_path / 'second.npz')
+        assert _import(lab, tmp_path / 'first.npz')['counted'] == 0
+        assert _import(lab, tmp_path / 'second.npz')['counted'] == 0
+        assert _counts(lab, 'ann', words[0]) == (2, 0)
+
+    def test_delta_has_only_changes(self, machines, words, tmp_path):
+        """ A delta for a known peer should hold only what it hasn't
+        seen. """
+        laptop, lab, _ = machines
+        _answer(laptop, [('ann', x, True) for x in words])
+        _export(laptop, tmp_path / 'laptop.npz')
+        _import(lab, tmp_path / 'laptop.npz')
+        lab_id = _export(lab, tmp_path / 'lab.npz')['device']
+        _import(laptop, tmp_path / 'lab.npz')
+        assert _export(laptop, tmp_path / 'none.npz',
+                       peer=lab_id)['counters'] == 0
+        _answer(laptop, [('ann', words[0], False)])
+        assert _export(laptop, tmp_path / 'one.npz',
+                       peer=lab_id)['counters'] == 1
+        _import(lab, tmp_path / 'one.npz')
+        assert _counts(lab, 'ann', words[0]) == (1, 1)
+
+    def test_export_reads_changed(self, machines, words, tmp_path,
+                                  monkeypatch):
+        """ After the first export, only words changed since should be
+        read, and still reach the other machine. """
+        laptop, lab, _ = machines
+        _answer(laptop, [('ann', words[0], True)])
+        _export(laptop, tmp_path / 'first.npz')
+        assert prolix.user.ChangedWords.select().count() == 0
+
+        def _full_scan():
+            raise AssertionError('read every user\'s tables')
+
+        monkeypatch.setattr(sync, '_read_all', _full_scan)
+        _answer(laptop, [('ann', words[1], False)])
+        prolix.User('ann').discard_word(words[2])
+        counts = _export(laptop, tmp_path / 'second.npz')
+        assert (counts['counters'], counts['discards']) == (2, 1)
+        assert prolix.user.ChangedWords.select().count() == 0
+        _import(lab, tmp_path / 'second.npz')
+        assert _counts(lab, 'ann', words[1]) == (0, 1)
+        assert prolix.User('ann').get_discarded_words() == {words[2]}
+
+    def test_relayed(self, machines, words, tmp_path):
+        """ Counts should reach a machine through another one, once. """
+        laptop, lab, home = machines
+        _answer(laptop, [('ann', words[0], True)])
+        _export(laptop, tmp_path / 'laptop.npz')
+        _import(lab, tmp_path / 'laptop.npz')
+        _export(lab, tmp_path / 'lab.npz')
+        _import(home, tmp_path / 'lab.npz')
+        _import(home, tmp_path / 'laptop.npz')
+        assert _counts(home, 'ann', words[0]) == (1, 0)
+
+
+class TestDiscardsAndEvents:
+    """ Tests for merging discarded words and event segments. """
+
+    def test_discards_merged(self, machines, words, tmp_path):
+        laptop, lab, _ = machines
+        prolix.set_data_path(laptop)
+        prolix.User('ann').discard_word(words[2])
+        _export(laptop, tmp_path / 'laptop.npz')
+        _import(lab, tmp_path / 'laptop.npz')
+        assert prolix.User('ann').get_discarded_words() == {words[2]}
+
+    def test_events_not_counted_twice(self, machines, words, tmp_path):
+        """ Segments should be kept as history, their answers arrive as
+        counters. """
+        laptop, lab, _ = machines
+        prolix.set_data_path(laptop)
+        prolix.User('ann').record_answer(words[3], events.RIGHT)
+        _export(laptop, tmp_path / 'laptop.npz')
+        _import(lab, tmp_path / 'laptop.npz')
+        prolix.user.compact_events()
+        assert _counts(lab, 'ann', words[3]) == (1, 0)
+        history = list(events.scan(include_compacted=True))
+        assert sum(len(x) for x in history) == 1
+
+
+class TestInvalid:
+    """ Tests for refusing deltas which can't be merged. """
+
+    def test_own_delta(self, machines, tmp_path):
+        _export(machines[0], tmp_path / 'laptop.npz')
+        with pytest.raises(ValueError):
+            sync.import_delta(tmp_path / 'laptop.npz')
+
+    def test_other_version(self, machines, tmp_path, monkeypatch):
+        _export(machines[0], tmp_path / 'laptop.npz')
+        monkeypatch.setattr(sync, 'sync_version', sync.sync_version + 1)
+        with pytest.raises(ValueError):
+            _import(machines[1], tmp_path / 'laptop.npz')
@@ -0,0 +1,58 @@
+"""
+Tests for the synthetic data generator
+"""
+import ast
+
+import pytest
+
+import prolix
+from prolix import synth
+
+
+class TestDeck:
+    """ Tests for generating decks. """
+
+    def test_deck(self):
+        """ Decks should have unique words and dict definitions. """
+        deck = synth.generate_deck(500, seed=1)
+        assert len(deck) == 500
+        assert deck['word'].is_unique
+        definition = ast.literal_eval(deck['definition'].iloc[0])
+        assert set(definition) <= set(synth._parts_of_speech)
+
+    def test_seeded(self):
+        """ The same seed should give the same deck. """
+        first = synth.generate_deck(50, seed=2)
+        assert first.equals(synth.generate_deck(50, seed=2))
+
+
+@pytest.mark.deck_data(users=4, seed=0)
+class TestDataPath:
+    """ Tests for pointing prolix at a generated data directory. """
+
+    def test_words_read(self, deck_path):
+        """ The store should read the generated deck. """
+        words = prolix.read_words()
+        assert len(words) == 300
+        assert prolix.store.get_word_csv_path() == deck_path / 'words.csv'
+
+    def test_users_populated(self, deck_path):
+        """ Generated users should have answers and discarded words. """
+        user = prolix.User('synth_0')
+        df = user.get_quiz_df()
+        assert df[['right', 'wrong']].to_numpy().sum() > 0
+        assert len(user.get_discarded_words()) == 5
+        assert len(prolix.user.get_word_difficulty())
+
+    def test_data_path_restored(self, deck_path, monkeypatch):
+        """ Resetting the data path should return to the bundled data, or
+        the directory set by PROLIX_DATA_PATH. """
+        monkeypatch.delenv('PROLIX_DATA_PATH', raising=False)
+        prolix.set_data_path(None)
+        assert prolix.data_path == prolix.default_data_path
+        monkeypatch.setenv('PROLIX_DATA_PATH', str(deck_path))
+        prolix.set_data_path(None)
+        assert prolix.data_path == deck_path
+        monkeypatch.delenv('PROLIX_DATA_PATH')
+        prolix.set_data_path(None)
+        assert len(prolix.read_words()) != 300
@@ -0,0 +1,127 @@
+"""
+Tests for tags and their membership indexes
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+import prolix
+from prolix import tags
+from prolix.cli import dispatch_cli
+from prolix.deck import get_deck
+
+
+@pytest.fixture
+def tagged(deck_path):
+    """ Add two tags to the words of a synthetic deck, return its data
+    path. """
+    words = get_deck().words
+    tags.tag_words('chapter 1', words[10:40])
+    tags.tag_words('missed', list(words[30:35]) + list(words[200:205]))
+    return deck_path
+
+
+class TestTags:
+    """ Tests for storing tags and combining their members. """
+
+    def test_members(self, tagged):
+        assert tags.list_tags() == {'chapter 1': 30, 'missed': 10}
+        rows = tags.tag_rows(['chapter 1', 'missed'])
+        assert list(rows) == list(range(10, 40)) + list(range(200, 205))
+        assert rows.dtype == np.int32
+        both = tags.tag_rows(['chapter 1', 'missed'], mode='all')
+        assert list(both) == list(range(30, 35))
+        assert not len(tags.tag_rows(['nothing']))
+
+    def test_untag(self, tagged):
+        words = get_deck().words
+        tags.untag_words('missed', words[30:35])
+        assert tags.list_tags()['missed'] == 5
+        tags.untag_words('chapter 1')
+        assert 'chapter 1' not in tags.list_tags()
+
+    def test_rebuilt_with_deck(self, tagged):
+        """ Rows should follow their words when words are added to the
+        deck. """
+        tagged = get_deck().words[tags.tag_rows(['missed'])]
+        new = pd.DataFrame({'definition': ['n. a word']},
+                           index=pd.Index(['aaaa'], name='word'))
+        prolix.store._commit_word_db(new)
+        words = get_deck().words
+        assert list(words[tags.tag_rows(['missed'])]) == list(tagged)
+
+    def test_bad_tag(self, tagged):
+        with pytest.raises(ValueError):
+            tags.tag_words(' ', ['word'])
+        with pytest.raises(ValueError):
+            tags.tag_rows(['missed'], mode='some')
+
+
+class TestRuns:
+    """ Tests for quizzing on tagged words. """
+
+    def test_quiz_draws_tagged(self, tagged):
+        quiz_run = prolix.QuizRun(question_count=20, user=None,
+                                  headless=True, seed=2, tags=['missed'])
+        words = set(get_deck().words[tags.tag_rows(['missed'])])
+        while not quiz_run._has_exited:
+            assert quiz_run.quiz.word in words
+            quiz_run._answer_correctly()
+
+    def test_cards_intersection(self, tagged):
+        card_run = prolix.CardRun(user=None, headless=True, seed=2,
+                                  tags=['missed', 'chapter 1'],
+                                  tag_mode='all')
+        assert sorted(card_run.words) == sorted(get_deck().words[30:35])
+
+    def test_masked_draws_tagged(self, tagged, user):
+        """ Tagged words should be drawn around words the user left out. """
+        words = get_deck().words
+        user.discard_word(words[30])
+        recall_run = prolix.RecallRun(question_count=30, user=user.name,
+                                      headless=True, seed=4,
+                                      tags=['missed'])
+        allowed = set(words[tags.tag_rows(['missed'])]) - {words[30]}
+        while not recall_run._has_exited:
+            assert recall_run.word in allowed
+            recall_run.submit_text(recall_run.word)
+
+    def test_untagged_unchanged(self, tagged):
+        """ Runs without tags should draw as they did before tags. """
+        first = prolix.QuizRun(question_count=5, user=None, headless=True,
+                               seed=5)
+        second = prolix.QuizRun(question_count=5, user=None, headless=True,
+                                seed=5, tags=[])
+        assert first.quiz.word == second.quiz.word
+
+    def test_resume_keeps_tags(self, tagged):
+        """ A resumed run should keep drawing from the checkpoint's
+        tags. """
+        quiz_run = prolix.QuizRun(question_count=20, user=None,
+                                  headless=True, seed=2, tags=['missed'],
+                                  checkpoint=True)
+        quiz_run._answer_correctly()
+        quiz_run.checkpoint()
+        resumed = prolix.QuizRun(question_count=20, user=None,
+                                 headless=True, resume=True)
+        words = set(get_deck().words[tags.tag_rows(['missed'])])
+        for _ in range(10):
+            assert resumed.quiz.word in words
+            resumed._answer_correctly()
+
+    def test_no_tagged_words(self, tagged):
+        with pytest.raises(ValueError):
+            prolix.QuizRun(user=None, headless=True, tags=['nothing'])
+
+    def test_cli(self, tagged):
+        runner = CliRunner()
+        word = get_deck().words[0]
+        result = runner.invoke(dispatch_cli, ['--data-path', str(tagged),
+                                              'tags', 'new', word])
+        assert result.exit_code == 0
+        assert 'new: 1 words' in result.output
+        result = runner.invoke(dispatch_cli, [
+            '--data-path', str(tagged), 'quiz', '--plain', '-q', '1',
+            '--tag', 'new'], input='1\n1\n')
+        assert word in result.output
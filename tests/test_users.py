@@ -1,12 +1,16 @@
 """
 Tests for user features
 """
+import sys
 
 import numpy as np
+import pandas as pd
 import peewee
 import pytest
+from click.testing import CliRunner
 
 import prolix
+from prolix.cli import dispatch_cli
 
 user_who_doesnt_exist = 'bob_the_guy_who_cant_be_in_the_database'
 
@@ -15,7 +19,7 @@ user_who_doesnt_exist = 'bob_the_guy_who_cant_be_in_the_database'
 def random_words():
     """ Get a list of 5 random words """
     df = prolix.read_words()
-    return list(np.random.choice(df.index.values, 5))
+    return list(np.random.choice(df.index.values, 5, replace=False))
 
 
 class TestDiscardedWords:
@@ -66,3 +70,128 @@ class TestUserManagement:
     def test_get_default_user_set(self, user):
         """ When user fixture is invoked the user should be set. """
         assert prolix.User().name == user.name
+
+
+class TestStatsExport:
+    """ Tests for exporting and importing all users' stats. """
+
+    @pytest.fixture
+    def answered_user(self, user, random_words):
+        """ A user who has answered and discarded some words. """
+        user.correctly_answered_word(random_words)
+        user.incorrectly_answered_word(random_words[0])
+        user.discard_word(random_words[-1])
+        return user
+
+    @pytest.fixture(params=['stats.parquet', 'stats.arrow'])
+    def stats_path(self, request, answered_user, tmp_path):
+        """ Export the stats, return the path. """
+        pytest.importorskip('pyarrow')
+        path = tmp_path / request.param
+        users = [answered_user.name]
+        prolix.user.export_stats(path, chunk_size=7, users=users)
+        return path
+
+    def test_round_trip(self, stats_path, answered_user, random_words):
+        """ Replacing the stats with the export should change nothing. """
+        before = answered_user.get_quiz_df()
+        prolix.user.import_stats(stats_path, replace=True)
+        assert answered_user.get_quiz_df().equals(before)
+        assert random_words[-1] in answered_user.get_discarded_words()
+
+    def test_import_adds(self, stats_path, answered_user, random_words):
+        """ Importing without replace should add to the existing counts. """
+        before = answered_user.get_quiz_df()
+        prolix.user.import_stats(stats_path)
+        after = answered_user.get_quiz_df()
+        assert (after == before * 2).all().all()
+
+    def test_import_updates_masks(self, stats_path, answered_user,
+                                  random_words):
+        """ A restore read in small chunks should leave the masks as the
+        whole file describes them. """
+        prolix.user.flush()
+        user_masks = prolix.masks.get_masks(answered_user.name)
+        prolix.user.import_stats(stats_path, replace=True, chunk_size=2)
+        deck = user_masks.deck
+        rows = [deck.row(x) for x in random_words]
+        assert list(user_masks.streak[rows[1:-1]]) == [1, 1, 1]
+        assert user_masks.streak[rows[0]] == 0
+        assert user_masks.discarded[rows[-1]]
+
+    def test_missing_pyarrow(self, tmp_path, monkeypatch):
+        """ The commands should name the extra to install without
+        pyarrow. """
+        monkeypatch.setitem(sys.modules, 'pyarrow', None)
+        runner = CliRunner()
+        for command in ('export-stats', 'import-stats'):
+            result = runner.invoke(dispatch_cli, [
+                command, str(tmp_path / 'stats.parquet')])
+            assert result.exit_code == 2
+            assert 'prolix[stats]' in result.output
+
+    def test_bad_format_raises(self, tmp_path):
+        """ An unknown extension should raise. """
+        with pytest.raises(ValueError):
+            prolix.user.export_stats(tmp_path / 'stats.txt')
+
+
+class TestWordDifficulty:
+    """ Tests for the cross user word summary. """
+
+    @pytest.fixture
+    def missed_word(self, user, random_words):
+        """ Have the user miss the first word several times. """
+        word = random_words[0]
+        for _ in range(5):
+            user.incorrectly_answered_word(word)
+        return word
+
+    def test_summary_matches_rebuild(self, missed_word):
+        """ Incremental updates should match a full rebuild. """
+        before = prolix.user.get_word_difficulty()
+        prolix.user.rebuild_word_summary()
+        after = prolix.user.get_word_difficulty()
+        pd.testing.assert_frame_equal(before.sort_index(), after.sort_index())
+
+    def test_missed_word_counted(self, user, missed_word):
+        """ The missed word should have at least the user's wrong answers. """
+        df = prolix.user.get_word_difficulty()
+        assert df.loc[missed_word, 'wrong'] >= 5
+        assert df.loc[missed_word, 'lower'] <= df.loc[missed_word, 'error_rate']
+        assert df.loc[missed_word, 'error_rate'] <= df.loc[missed_word, 'upper']
+
+    def test_deleted_user_removed(self, user, missed_word):
+        """ Deleting a user should remove their answers from the summary. """
+        wrong = prolix.user.get_word_difficulty().loc[missed_word, 'wrong']
+        user.delete_user()
+        df = prolix.user.get_word_difficulty()
+        assert df['wrong'].get(missed_word, 0) == wrong - 5
+
+
+class TestRatings:
+    """ Tests for the ability and difficulty ratings. """
+
+    def test_online_updates(self, user, random_words):
+        """ Right answers should raise ability and lower word difficulty. """
+        hard, easy = random_words[0], random_words[1]
+        before = prolix.user.get_word_ratings()['difficulty']
+        user.correctly_answered_word([easy] * 3)
+        ability = user.get_ability()
+        assert ability > 0
+        user.incorrectly_answered_word([hard] * 3)
+        after = prolix.user.get_word_ratings()['difficulty']
+        assert after[easy] < before.get(easy, 0)
+        assert after[hard] > before.get(hard, 0)
+        assert user.get_ability() < ability
+
+    def test_refit(self, deck_path, user, random_words):
+        """ A refit should rank missed words harder than known ones. """
+        hard, easy = random_words[0], random_words[1]
+        user.correctly_answered_word([easy] * 5)
+        user.incorrectly_answered_word([hard] * 5)
+        ratings = prolix.user.refit_ratings()
+        assert ratings.loc[hard, 'difficulty'] > ratings.loc[easy, 'difficulty']
+        assert abs(ratings['difficulty'].mean()) < 1e-8
+        scores = user.get_expected_scores()
+        assert scores[easy] > scores[hard]
@@ -0,0 +1,91 @@
+"""
+Tests for the database writer thread
+"""
+import threading
+import time
+
+import pytest
+
+import prolix
+from prolix.writer import DatabaseWriter, WriterError
+
+
+@pytest.fixture
+def writer():
+    """ Return a writer with a small queue, stop it when finished. """
+    writer = DatabaseWriter(maxsize=2, max_batch=4)
+    yield writer
+    writer.stop()
+
+
+class TestDatabaseWriter:
+    """ Tests for queueing and flushing jobs. """
+
+    def test_jobs_run_in_order(self, writer):
+        """ Jobs should run on the writer thread in submission order. """
+        out = []
+        for num in range(20):
+            writer.submit(out.append, num)
+        writer.flush()
+        assert out == list(range(20))
+        assert writer.metrics()['written'] == 20
+
+    def test_jobs_run_on_writer_thread(self, writer):
+        """ The submitting thread should not run the job. """
+        threads = []
+        writer.submit(lambda: threads.append(threading.current_thread()))
+        writer.flush()
+        assert threads[0] is not threading.current_thread()
+
+    def test_backpressure(self, writer):
+        """ Submitting to a full queue should block until there is room. """
+        for _ in range(10):
+            writer.submit(time.sleep, 0.01)
+        assert writer.blocked_submits > 0
+        writer.flush()
+        metrics = writer.metrics()
+        assert metrics['queue_depth'] == 0
+        assert metrics['max_queue_depth'] <= 2
+        assert metrics['last_flush_latency'] > 0
+
+    def test_errors_raised_on_flush(self, writer):
+        """ A failing job should not stop the writer but raise on flush. """
+        out = []
+        writer.submit(lambda: 1 / 0)
+        writer.submit(out.append, 1)
+        with pytest.raises(WriterError):
+            writer.flush()
+        assert out == [1]
+        writer.flush()  # errors are only raised once
+
+    def test_after_commit(self, writer):
+        """ Callbacks added by a job should run once its batch has been
+        committed, and not at all outside a job. """
+        out = []
+        assert not writer.after_commit(lambda: out.append('outside'))
+
+        def _job():
+            writer.after_commit(lambda: out.append('committed'))
+            out.append('job')
+
+        writer.submit(_job)
+        writer.flush()
+        assert out == ['job', 'committed']
+
+    def test_flush_timeout(self, writer):
+        """ Flush should raise if the queue does not drain in time. """
+        writer.submit(time.sleep, 0.2)
+        with pytest.raises(TimeoutError):
+            writer.flush(timeout=0.01)
+
+
+class TestUserWrites:
+    """ Tests for user writes going through the writer. """
+
+    def test_answers_visible_after_write(self, user):
+        """ Reads should see writes queued before them. """
+        word = prolix.read_words().index[0]
+        for _ in range(3):
+            user.correctly_answered_word(word)
+        assert user.get_quiz_df().loc[word, 'right'] == 3
+        assert prolix.user.writer_metrics()['queue_depth'] == 0